@@ -20,12 +20,14 @@
 
 from __future__ import print_function
 
+import copy
 import cv2
 import sys
 import time
 import traceback
 
 from ikalog.utils import *
+from ikalog.inputs.capture_thread import CaptureThread
 from . import scenes
 
 
@@ -35,59 +37,235 @@ from . import scenes
 
 class IkaEngine:
 
+    # Events always delivered on the engine thread even if async_dispatch
+    # is enabled. These need the live context, or are related to UI.
+    sync_event_prefixes = [
+        'on_frame_', 'on_debug_', 'on_config_', 'on_option_', 'on_key_press',
+    ]
+
+    # Events which have non-standard arguments. These are not delivered
+    # to onUncatchedEvent().
+    nonstandard_events = ['on_frame_next', 'on_key_press']
+
     def dprint(self, text):
         print(text, file=sys.stderr)
 
+    def _get_hook(self, op, event_name):
+        hooks = self._plugin_hooks.setdefault(id(op), {})
+        if not event_name in hooks:
+            fallback = not (event_name in self.nonstandard_events)
+            hooks[event_name] = PluginHook.create(
+                op, event_name, fallback=fallback)
+        return hooks[event_name]
+
+    # Returns hooks of the event in order of the plugins.
+    # The result is cached until set_plugins() is called.
+    def _get_hooks(self, event_name):
+        hooks = self._dispatch_table.get(event_name)
+        if hooks is None:
+            hooks = []
+            for op in self.output_plugins:
+                hook = self._get_hook(op, event_name)
+                if hook is not None:
+                    hooks.append(hook)
+            self._dispatch_table[event_name] = hooks
+        return hooks
+
+    def _build_dispatch_table(self):
+        self._plugin_hooks = {}
+        self._dispatch_table = {}
+
+        event_names = set()
+        for op in self.output_plugins:
+            for name in dir(op):
+                if name.startswith('on_') and callable(getattr(op, name)):
+                    event_names.add(name)
+
+        for event_name in event_names:
+            self._get_hooks(event_name)
+
+    def _call_hook(self, hook, context, debug=False):
+        if debug:
+            self.dprint('Call  %s' % hook)
+        try:
+            hook(context)
+        except:
+            self.dprint('%s() raised a exception >>>>' % hook)
+            self.dprint(traceback.format_exc())
+            self.dprint('<<<<<')
+
+    def _call_plugin(self, op, event_name, context, debug=False):
+        hook = self._get_hook(op, event_name)
+        if hook is not None:
+            self._call_hook(hook, context, debug=debug)
+
+    def _is_sync_event(self, event_name):
+        for prefix in self.sync_event_prefixes:
+            if event_name.startswith(prefix):
+                return True
+        return False
+
+    # Take a snapshot of the context for asynchronous plugins.
+    # IkaEngine keeps updating its own context while plugins are working.
+    def _snapshot_context(self):
+        context = self.context
+
+        engine = dict(context['engine'])
+        if engine.get('frame') is not None:
+            engine['frame'] = engine['frame'].copy()
+            engine['frame'].flags.writeable = False
+        engine['capture_stats'] = copy.copy(engine.get('capture_stats'))
+        # FrameCache.from_context() creates one for the copied frame.
+        engine['frame_cache'] = None
+
+        return {
+            'engine': engine,
+            'game': copy.deepcopy(context['game']),
+            'lobby': copy.deepcopy(context['lobby']),
+            'scenes': copy.deepcopy(context['scenes']),
+            'config': context['config'],
+        }
+
     def call_plugins(self, event_name, debug=False):
         if debug:
             self.dprint('call plug-in hook (%s):' % event_name)
 
+        hooks = self._get_hooks(event_name)
+        if not hooks:
+            return
+
+        if self._plugin_workers and not self._is_sync_event(event_name):
+            snapshot = self._snapshot_context()
+            for hook in hooks:
+                self._plugin_workers[id(hook.plugin)].put(event_name, snapshot)
+            return
+
+        for hook in hooks:
+            self._call_hook(hook, self.context, debug=debug)
+
+    def _start_plugin_workers(self):
+        self._stop_plugin_workers()
+
+        if not self.async_dispatch:
+            return
+
         for op in self.output_plugins:
-            if hasattr(op, event_name):
-                if debug:
-                    self.dprint('Call  %s' % op.__class__.__name__)
-                try:
-                    getattr(op, event_name)(self.context)
-                except:
-                    self.dprint('%s.%s() raised a exception >>>>' %
-                                (op.__class__.__name__, event_name))
-                    self.dprint(traceback.format_exc())
-                    self.dprint('<<<<<')
-            elif hasattr(op, 'onUncatchedEvent'):
-                if debug:
-                    self.dprint(
-                        'call plug-in hook (UncatchedEvent, %s):' % event_name)
-                try:
-                    getattr(op, 'onUncatchedEvent')(event_name, self.context)
-                except:
-                    self.dprint('%s.%s() raised a exception >>>>' %
-                                (op.__class__.__name__, event_name))
-                    self.dprint(traceback.format_exc())
-                    self.dprint('<<<<<')
+            self._plugin_workers[id(op)] = PluginWorker(
+                op, self._call_plugin, max_queue=self.max_plugin_queue)
+
+    # Wait until plugins process all queued events, and stop the workers.
+    # Each worker waits for its plugin for a few seconds at most; events
+    # of a hung plugin are abandoned (and logged).
+    def _stop_plugin_workers(self):
+        workers = self._plugin_workers
+        self._plugin_workers = {}
+
+        for worker in workers.values():
+            worker.stop()
+
+    ##
+    # Get call statistics of plugin hooks.
+    # @return dict of {'Plugin.event': {'calls', 'total', 'worst', 'average'}}
+    #         Times are in seconds.
+    #
+    def get_plugin_hook_stats(self):
+        stats = {}
+        for hooks in self._plugin_hooks.values():
+            for hook in hooks.values():
+                if (hook is not None) and hook.calls:
+                    stats[str(hook)] = hook.get_stats()
+        return stats
+
+    def dump_plugin_hook_stats(self, limit=10):
+        stats = self.get_plugin_hook_stats()
+        names = sorted(stats, key=lambda n: stats[n]['total'], reverse=True)
+        for name in names[:limit]:
+            s = stats[name]
+            self.dprint('%s: %d calls, total %.3fs, average %.2fms, worst %.2fms' % (
+                name, s['calls'], s['total'], s['average'] * 1000,
+                s['worst'] * 1000))
+
+    ##
+    # Get per-region statistics of the RoiWatcher.
+    # @return dict of {name: {'checks', 'skips', 'skip_ratio'}}
+    #
+    def get_roi_watcher_stats(self):
+        return self.roi_watcher.get_stats()
+
+    def get_plugin_worker_stats(self):
+        stats = {}
+        for worker in self._plugin_workers.values():
+            stats[worker.plugin.__class__.__name__] = worker.get_stats()
+        return stats
+
+    def _read_frame(self):
+        if self._capture_thread is None:
+            return self.capture.read()
+
+        frame, t = self._capture_thread.read()
+        self.context['engine']['capture_stats'] = \
+            self._capture_thread.get_stats()
+        return frame, t
+
+    def _new_frame_cache(self, frame):
+        old_cache = self.context['engine'].get('frame_cache')
+        if old_cache is not None:
+            self._frame_cache_hits += old_cache.hits
+            self._frame_cache_misses += old_cache.misses
+
+        self.context['engine']['frame_cache'] = FrameCache(frame)
+
+    ##
+    # Get cumulative hit/miss counts of per-frame FrameCaches.
+    #
+    def get_frame_cache_stats(self):
+        hits = self._frame_cache_hits
+        misses = self._frame_cache_misses
+
+        cache = self.context['engine'].get('frame_cache')
+        if cache is not None:
+            hits += cache.hits
+            misses += cache.misses
+
+        return {'hits': hits, 'misses': misses}
 
     def read_next_frame(self, skip_frames=0):
         for i in range(skip_frames):
-            frame, t = self.capture.read()
-        frame, t = self.capture.read()
+            frame, t = self._read_frame()
+        frame, t = self._read_frame()
 
         while frame is None:
             self.call_plugins('on_frame_read_failed')
             if self._stop:
                 return None, None
             cv2.waitKey(1000)
-            frame, t = self.capture.read()
+            frame, t = self._read_frame()
 
         self.context['engine']['msec'] = t
         self.context['engine']['frame'] = frame
+        self._new_frame_cache(frame)
 
         self.call_plugins('on_debug_read_next_frame')
 
         return frame, t
 
+    ##
+    # Stop the engine.
+    #
+    # Events queued for asynchronous plugins are processed before the
+    # workers stop: by run() when it returns, or here if run() is not
+    # running.
+    #
     def stop(self):
         self.call_plugins('on_stop')
         self._stop = True
 
+        if self._capture_thread is not None:
+            self._capture_thread.stop()
+
+        if not self._running:
+            self._stop_plugin_workers()
+
     def reset(self):
         # Initalize the context
         self.context['game'] = {
@@ -100,16 +278,19 @@ class IkaEngine:
             'dead': False,
             'death_reasons': {},
 
-            'livesTrack': [],
-            'towerTrack': [],
+            'livesTrack': LivesTrack(),
+            'towerTrack': TowerTrack(),
         }
 
     def create_context(self):
         self.context = {
             'engine': {
                 'frame': None,
+                'frame_cache': None,
+                'capture_stats': None,
                 'service': {
                     'callPlugins': self.call_plugins,
+                    'roi_watcher': self.roi_watcher,
                 }
             },
             'scenes': {
@@ -130,174 +311,333 @@ class IkaEngine:
 
         self.reset()
 
-    def process_frame(self):
-        context = self.context
+    ##
+    # Seconds elapsed since the time by self.clock.
+    #
+    def _elapsed(self, context, last):
+        now = self.clock.time(context)
+        if now < last:
+            # The time has been rewinded (e.g. another file)
+            return float('inf')
+        return now - last
+
+    def reset_timers(self):
+        self.last_capture = float('-inf')
+        self.last_gamestart = float('-inf')
+        self.last_game_finish = float('-inf')
+
+    # Exclusive scenes: once entered, only the scene itself is evaluated
+    # on following frames until it leaves.
+    # Each function returns True while the scene continues.
+
+    def _continue_game_start(self, context):
+        r = self.scn_gamestart.match(context)
+
+        # ステージとルールが確定したらすぐに通知する。確定しないまま
+        # 抜けた場合は最多得票のもので通知する
+        if not self._game_start_notified:
+            if not r:
+                self.scn_gamestart.elect(context, force=True)
+
+            if (not r) or self.scn_gamestart.is_decided():
+                self._game_start_notified = True
+                self.call_plugins('on_game_start')
 
-        skip_frames = 0
-        if (self.capture.from_file and self.capture.fps > 28):
-            skip_frames = int(self.capture.fps / 3)
+        if r:
+            return True
 
-        frame, t = self.read_next_frame(skip_frames=skip_frames)
+        self.last_gamestart = self.clock.time(context)
+        self.scn_gamestart.reset()
+        return False
 
-        if frame is None:
+    def _continue_result_judge(self, context):
+        return self.scn_result_judge.match(context)
+
+    def _continue_result_detail(self, context):
+        # 安定するまで待つ
+        stability = self.scn_gameresult.stability
+        t = self.clock.time(context)
+        stable = stability.update(FrameCache.from_context(context), t)
+        if not (stable or stability.is_timed_out(t)):
+            return True
+
+        if not stable:
+            self.dprint('result_detail: timed out waiting for stable frames')
+
+        # 安定した画像で再度解析
+        if self.scn_gameresult.match(context):
+            self.scn_gameresult.analyze(context)
+
+            self.call_plugins('on_game_individual_result_analyze')
+            self.call_plugins('on_game_individual_result')
+
+            self.session_close_wdt = context[
+                'engine']['msec'] + (20 * 1000)
+        return False
+
+    def _continue_result_udemae(self, context):
+        if self.scn_result_udemae.match(context):
+            return True
+
+        self.dprint('Escaped result_udemae loop')
+        return False
+
+    def _continue_result_gears(self, context):
+        if self.scn_result_gears.match(context):
+            return True
+
+        self.dprint('Escaped result_gears loop')
+        return False
+
+    def _enter_exclusive_scene(self, name):
+        self._exclusive_scene = name
+
+    ##
+    # Process the current exclusive scene, if any.
+    # @return True if the exclusive scene consumed the frame.
+    #
+    def _process_exclusive_scene(self, context):
+        name = self._exclusive_scene
+        if name is None:
             return False
 
-        context['engine']['inGame'] = self.scn_ingame.matchTimerIcon(context)
+        if getattr(self, '_continue_%s' % name)(context):
+            return True
 
-        self.call_plugins('on_frame_read')
+        self._exclusive_scene = None
+        return False
+
+    def _process_scenes(self, context):
+        scheduler = self.scene_scheduler
+        scheduler.new_frame(context)
+
+        if context['engine']['inGame']:
+            scheduler.enter('in_game')
 
         self.scn_ingame.match(context)
 
-        tower_data = self.scn_tower_tracker.match(context)
+        tower_data = None
+        if scheduler.should_run('in_game'):
+            tower_data = self.scn_tower_tracker.match(context)
 
         try:
             # ライフをチェック
             (team1, team2) = self.scn_ingame.lives(context)
             # print("味方 %s 敵 %s" % (team1, team2))
 
-            context['game']['livesTrack'].append(
-                [context['engine']['msec'], team1, team2])
+            if team1 is not None:
+                context['game']['livesTrack'].append(
+                    context['engine']['msec'], team1, team2)
             if tower_data:
                 context['game']['towerTrack'].append(
-                    [context['engine']['msec'], tower_data.copy()])
+                    context['engine']['msec'], tower_data)
         except:
             pass
 
-        # Lobby
-        r = False
         if not context['engine']['inGame']:
-            r = self.scn_lobby.match(context)
+            self._process_out_of_game_scenes(context)
+
+        if self._exclusive_scene is not None:
+            return
+
+        if self.session_close_wdt is not None:
+            if self.session_close_wdt < context['engine']['msec']:
+                self.dprint('Watchdog fired. Closing current session')
+                self.session_close()
+
+    def _process_out_of_game_scenes(self, context):
+        scheduler = self.scene_scheduler
+
+        # Lobby
+        if scheduler.should_run('lobby') and self.scn_lobby.match(context):
+            scheduler.enter('lobby')
 
         # GameStart (マップ名、ルール名が表示されている) ?
 
         r = None
-        if (not context['engine']['inGame']) and (time.time() - self.last_gamestart) > 10:
+        if (self._elapsed(context, self.last_gamestart) > 10) and \
+                scheduler.should_run('game_start'):
             r = self.scn_gamestart.match(context)
 
         if r:
             self.scn_tower_tracker.reset(context)
-
-            while (r):
-                frame, t = self.read_next_frame(skip_frames=3)
-                r = self.scn_gamestart.match(context)
-
-            self.last_gamestart = time.time()
-
-            self.call_plugins('on_game_start')
+            self._game_start_notified = False
+            scheduler.enter('game_start')
+            self._enter_exclusive_scene('game_start')
+            return
 
         # GameFinish (ゲームが終了した) ?
         r = False
-        if (not context['engine']['inGame']) and \
-            (time.time() - self.last_game_finish) > 60:
+        if (self._elapsed(context, self.last_game_finish) > 60) and \
+                scheduler.should_run('game_finish'):
             r = self.scn_gamefinish.match(context)
 
         if r:
+            scheduler.enter('game_finish')
             self.call_plugins('on_game_finish')
-            self.last_game_finish = time.time()
+            self.last_game_finish = self.clock.time(context)
 
         # ResultJudge
-        r = (not context['engine']['inGame'])
-        if r:
-            r = self.scn_result_judge.match(context)
+        r = scheduler.should_run('result_judge') and \
+            self.scn_result_judge.match(context)
 
-        while r:
-            frame, t = self.read_next_frame()
-            context['engine']['frame'] = frame
-            r = self.scn_result_judge.match(context)
+        if r:
+            scheduler.enter('result_judge')
+            self._enter_exclusive_scene('result_judge')
+            return
 
         # GameResult (勝敗の詳細が表示されている）?
-        r = (not context['engine']['inGame']) and (
-            time.time() - self.last_capture) > 60
+        r = (self._elapsed(context, self.last_capture) > 60) and \
+            scheduler.should_run('result_detail')
         if r:
             r = self.scn_gameresult.match(context)
 
         if r:
-            if ((time.time() - self.last_capture) > 60):
-                self.last_capture = time.time()
-
-                # 安定するまで待つ
-                for x in range(10):
-                    frame, t = self.read_next_frame()
-
-                # 安定した画像で再度解析
-                if self.scn_gameresult.match(context):
-                    self.scn_gameresult.analyze(context)
-
-                    self.call_plugins('on_game_individual_result_analyze')
-                    self.call_plugins('on_game_individual_result')
-
-                    self.session_close_wdt = context[
-                        'engine']['msec'] + (20 * 1000)
+            self.last_capture = self.clock.time(context)
+            self.scn_gameresult.stability.reset(self.last_capture)
+            self.scn_gameresult.stability.update(
+                FrameCache.from_context(context), self.last_capture)
+            scheduler.enter('result_detail')
+            self._enter_exclusive_scene('result_detail')
+            return
 
         # ResultUdemae
-        r = (not context['engine']['inGame'])
-        if r:
-            r = self.scn_result_udemae.match(context)
+        r = scheduler.should_run('result_udemae') and \
+            self.scn_result_udemae.match(context)
 
         if r:
             self.dprint('Entering result_udemae loop')
             context['scenes'].pop('result_udemae', None)
-            while r:
-                frame, t = self.read_next_frame()
-                r = self.scn_result_udemae.match(context)
-            self.dprint('Escaped result_udemae loop')
+            scheduler.enter('result_udemae')
+            self._enter_exclusive_scene('result_udemae')
+            return
 
         # result_gears
-        r = (not context['engine']['inGame'])
-        if r:
-            r = self.scn_result_gears.match(context)
+        r = scheduler.should_run('result_gears') and \
+            self.scn_result_gears.match(context)
 
         if r:
             self.dprint('Entering result_gears loop')
-            while r:
-                frame, t = self.read_next_frame()
-                r = self.scn_result_gears.match(context)
-            self.dprint('Escaped result_gears loop')
+            scheduler.enter('result_gears')
+            self._enter_exclusive_scene('result_gears')
+            return
+
+    ##
+    # Process a frame.
+    # Reads exactly one frame (after skipping frames if needed) and
+    # returns. Scene states are kept across calls.
+    #
+    def process_frame(self):
+        context = self.context
 
-        if self.session_close_wdt is not None:
-            if self.session_close_wdt < context['engine']['msec']:
-                self.dprint('Watchdog fired. Closing current session')
-                self.session_close()
+        skip_frames = 0
+        if (self.capture.from_file and self.capture.fps > 28):
+            skip_frames = int(self.capture.fps / 3)
+
+        frame, t = self.read_next_frame(skip_frames=skip_frames)
+
+        if frame is None:
+            return False
+
+        context['engine']['inGame'] = self.scn_ingame.matchTimerIcon(context)
+
+        self.call_plugins('on_frame_read')
+
+        if not self._process_exclusive_scene(context):
+            self._process_scenes(context)
 
         key = None
 
-        # FixMe: Since on_frame_next and on_key_press has non-standard arguments,
+        # Since on_frame_next and on_key_press has non-standard arguments,
         # self.call_plugins() doesn't work for those.
 
-        for op in self.output_plugins:
-            if hasattr(op, "on_frame_next"):
-                try:
-                    key = op.on_frame_next(context)
-                except:
-                    pass
+        for hook in self._get_hooks('on_frame_next'):
+            try:
+                key = hook(context)
+            except:
+                pass
 
-        for op in self.output_plugins:
-            if hasattr(op, "on_key_press"):
-                try:
-                    op.on_key_press(context, key)
-                except:
-                    pass
+        for hook in self._get_hooks('on_key_press'):
+            try:
+                hook(context, key)
+            except:
+                pass
+
+        return True
 
     def run(self):
+        if self.async_dispatch and not self._plugin_workers:
+            self._start_plugin_workers()
+
+        if self._capture_thread is not None:
+            self._capture_thread.start()
+
         # Main loop.
-        while not self._stop:
-            if self._pause:
-                time.sleep(0.5)
-            else:
-                self.process_frame()
+        self._running = True
+        try:
+            while not self._stop:
+                if self._pause:
+                    time.sleep(0.5)
+                else:
+                    self.process_frame()
+        finally:
+            self._stop_plugin_workers()
+            self._running = False
 
         cv2.destroyAllWindows()
 
     def set_capture(self, capture):
+        if self._capture_thread is not None:
+            self._capture_thread.stop()
+            self._capture_thread = None
+
         self.capture = capture
+        self._exclusive_scene = None
+        self.reset_timers()
+        self.scene_scheduler.reset()
+        self.scn_gameresult.reset_offset()
+        self.scn_gamestart.reset()
+        self.roi_watcher.reset()
+
+        # Decode frames in background, so that decoding and analysis
+        # overlap. Frames are recycled by the ring buffer.
+        if self.enable_capture_thread:
+            self._capture_thread = CaptureThread(capture)
+            self._capture_thread.start()
 
     def set_plugins(self, plugins):
         self.output_plugins = plugins
+        self._build_dispatch_table()
+        self._start_plugin_workers()
 
     def pause(self, pause):
         self._pause = pause
 
-    def __init__(self):
+    ##
+    # Constructor
+    # @param self                   The object.
+    # @param enable_capture_thread  If true, read the capture in a thread.
+    # @param async_dispatch         If true, each plugin receives events
+    #                               in its own thread.
+    # @param max_plugin_queue       Max number of events queued per
+    #                               plugin.
+    # @param clock                  Clock for intervals between scenes.
+    #                               MediaClock (frame timestamp) if None.
+    #
+    def __init__(self, enable_capture_thread=True, async_dispatch=False,
+                 max_plugin_queue=64, clock=None):
+        self.clock = clock if clock is not None else MediaClock()
+        self.enable_capture_thread = enable_capture_thread
+        self.async_dispatch = async_dispatch
+        self.max_plugin_queue = max_plugin_queue
+        self._running = False
+        self.capture = None
+        self._capture_thread = None
+        self.output_plugins = []
+        self._plugin_hooks = {}
+        self._dispatch_table = {}
+        self._plugin_workers = {}
+
         self.scn_gamestart = scenes.GameStart()
         self.scn_gamefinish = scenes.GameFinish()
         self.scn_gameresult = scenes.ResultDetail()
@@ -308,9 +648,21 @@ class IkaEngine:
         self.scn_tower_tracker = scenes.TowerTracker()
         self.scn_lobby = scenes.Lobby()
 
-        self.last_capture = time.time() - 100
-        self.last_gamestart = time.time() - 100
-        self.last_game_finish = time.time() - 100
+        self.scene_scheduler = scenes.SceneScheduler([
+            self.scn_lobby, self.scn_gamestart, self.scn_ingame,
+            self.scn_gamefinish, self.scn_result_judge, self.scn_gameresult,
+            self.scn_result_udemae, self.scn_result_gears,
+        ])
+
+        self.reset_timers()
+
+        self._exclusive_scene = None
+        self._game_start_notified = False
+        self._frame_cache_hits = 0
+        self._frame_cache_misses = 0
+
+        # Scenes skip recognition of regions which didn't change.
+        self.roi_watcher = RoiWatcher()
 
         self._stop = False
         self._pause = True
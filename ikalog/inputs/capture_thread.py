@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import collections
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from ikalog.utils import *
+
+
+# Ring buffer of reusable frame arrays, shared between a capture thread
+# (producer) and IkaEngine (consumer).
+#
+# Frame arrays are allocated once per slot and recycled afterwards.
+# A frame returned by get() stays valid until the next call of get(),
+# so the consumer must copy() anything it wants to keep longer.
+#
+class FrameRingBuffer(object):
+
+    def _prepare_slot(self, index, frame):
+        buf = self._frames[index]
+        if (buf is None) or (buf.shape != frame.shape) or \
+                (buf.dtype != frame.dtype):
+            buf = np.empty_like(frame)
+            self._frames[index] = buf
+        return buf
+
+    def _drop_oldest(self):
+        # "Latest frame wins": recycle the oldest frame nobody read yet.
+        while self._queue:
+            index, t = self._queue.popleft()
+            if index is not None:
+                self._free.append(index)
+                self.dropped_frames = self.dropped_frames + 1
+                return True
+        return False
+
+    ##
+    # Put a frame into the buffer.
+    # @param frame   The frame. None means the capture source failed.
+    # @param t       Timestamp of the frame (msec)
+    # @param block   If True, wait for a free slot (lossless).
+    #                If False, overwrite the oldest unread frame.
+    # @return False if the buffer has been closed.
+    #
+    def put(self, frame, t, block=False):
+        with self._cond:
+            if self._closed:
+                return False
+
+            if frame is None:
+                # Read failures don't need a slot. Coalesce them.
+                if not (self._queue and self._queue[-1][0] is None):
+                    self._queue.append((None, None))
+                    self._cond.notify_all()
+                return True
+
+            while not self._free:
+                if (not block) and self._drop_oldest():
+                    break
+                self._cond.wait()
+                if self._closed:
+                    return False
+
+            index = self._free.popleft()
+
+        # The slot is reserved for us, so copy without holding the lock.
+        np.copyto(self._prepare_slot(index, frame), frame)
+
+        with self._cond:
+            self._queue.append((index, t))
+            self.captured_frames = self.captured_frames + 1
+            self._cond.notify_all()
+        return True
+
+    ##
+    # Get the next frame from the buffer.
+    # @param timeout  Timeout in seconds. None waits forever.
+    # @return (frame, t). (None, None) on read failure, timeout or close.
+    #
+    def get(self, timeout=None):
+        with self._cond:
+            if self._held is not None:
+                self._free.append(self._held)
+                self._held = None
+                self._cond.notify_all()
+
+            while not self._queue:
+                if self._closed:
+                    return None, None
+                if not self._cond.wait(timeout):
+                    return None, None
+
+            index, t = self._queue.popleft()
+            if index is None:
+                return None, None
+
+            self._held = index
+            return self._frames[index], t
+
+    def queued_frames(self):
+        with self._cond:
+            return len(self._queue)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reset(self):
+        with self._cond:
+            self._queue.clear()
+            self._free = collections.deque(range(len(self._frames)))
+            self._held = None
+            self._closed = False
+            self._cond.notify_all()
+
+    def __init__(self, num_slots=4):
+        # One slot is held by the consumer and one may be written by the
+        # producer; at least one more is needed to queue anything.
+        assert num_slots >= 3
+
+        self._frames = [None] * num_slots
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self.captured_frames = 0
+        self.dropped_frames = 0
+        self.reset()
+
+
+# Capture thread: reads frames from an input plugin (CVCapture,
+# ScreenCapture, ...) in background and feeds FrameRingBuffer, so that
+# decoding and analysis can overlap.
+#
+# Live sources drop stale frames (latest frame wins). Recorded files are
+# read losslessly; the thread blocks until IkaEngine catches up.
+#
+class CaptureThread(object):
+
+    # Wait before retrying after the capture source failed (in seconds)
+    retry_interval = 0.1
+
+    def is_lossless(self):
+        if self.drop_frames is not None:
+            return not self.drop_frames
+
+        # The source may be switched at any time (e.g. from IkaUI)
+        return bool(getattr(self.capture, 'from_file', False))
+
+    def _thread_func(self):
+        while not self._stopped:
+            try:
+                frame, t = self.capture.read()
+            except:
+                IkaUtils.dprint('%s: capture.read() raised a exception >>>>' %
+                                self)
+                IkaUtils.dprint(traceback.format_exc())
+                IkaUtils.dprint('<<<<<')
+                frame, t = None, None
+
+            if frame is None:
+                self.ring.put(None, None)
+                time.sleep(self.retry_interval)
+                continue
+
+            self.ring.put(frame, t, block=self.is_lossless())
+
+    ##
+    # Start the thread. Nothing happens if already started, or once
+    # stopped; a stopped CaptureThread is never restarted.
+    #
+    def start(self):
+        with self._lock:
+            if self._stopped or (self._thread is not None):
+                return
+
+            self._thread = threading.Thread(target=self._thread_func)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+        self.ring.close()
+
+        thread = self._thread
+        if (thread is not None) and (thread is not threading.current_thread()):
+            thread.join(timeout=3.0)
+        self._thread = None
+
+    ##
+    # Read a frame. Same interface as input plugins' read().
+    # @return (frame, t). (None, None) on failure, or after stop().
+    #
+    def read(self):
+        if self._stopped:
+            return None, None
+        return self.ring.get(timeout=self.read_timeout)
+
+    def get_stats(self):
+        return {
+            'captured': self.ring.captured_frames,
+            'dropped': self.ring.dropped_frames,
+            'queued': self.ring.queued_frames(),
+        }
+
+    ##
+    # Constructor
+    # @param capture       Input plugin to read frames from.
+    # @param num_slots     Number of frame arrays in the ring buffer.
+    # @param drop_frames   True: latest frame wins, False: lossless.
+    #                      None: decide by capture.from_file.
+    # @param read_timeout  Timeout for read() in seconds.
+    #
+    def __init__(self, capture, num_slots=4, drop_frames=None, read_timeout=5.0):
+        self.capture = capture
+        self.drop_frames = drop_frames
+        self.read_timeout = read_timeout
+        self.ring = FrameRingBuffer(num_slots=num_slots)
+
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread = None
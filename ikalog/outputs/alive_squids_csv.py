@@ -24,6 +24,8 @@
 
 from datetime import datetime
 
+from ikalog.utils import *
+
 
 # IkaLog Output Plugin: Write 'Alive Squids' CSV data
 #
@@ -47,13 +49,13 @@ class AliveSquidsCSV(object):
     def write_alive_squids_csv(self, context, basename="ikabattle_log", debug=False):
         csv = ["tick,y\n", "tick,y\n"]
 
-        for sample in context['game']['livesTrack']:
+        # 記録時と同じ間隔(1フレームごと)で書き出す
+        track = context['game']['livesTrack']
+        for time, team1, team2 in track.samples(step=track.sample_interval):
             if debug:
-                print('lives sample = %s', sample)
-            time = sample[0]
-            del sample[0]
+                print('lives sample = %s', (time, team1, team2))
             num_team = 0
-            for team in sample:
+            for team in [team1, team2]:
                 num_squid = 0
                 for alive in team:
                     num_squid = num_squid + 1
@@ -80,11 +82,10 @@ class AliveSquidsCSV(object):
 
         csv = "tick,pos,max,min\n"
 
-        for sample in context['game']['towerTrack']:
+        track = context['game']['towerTrack']
+        for time, sample in track.samples(step=track.sample_interval):
             if debug:
                 print('tower sample = %s', sample)
-            time = sample[0]
-            sample = sample[1]
             csv = "%s%d, %d, %d, %d\n" % (
                 csv, time, sample['pos'], sample['max'], sample['min'])
 
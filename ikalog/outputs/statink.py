@@ -543,7 +543,7 @@ class StatInk(object):
     # @param context   IkaLog context
     #
     def on_game_individual_result(self, context):
-        self.img_result_detail = context['engine']['frame']
+        self.img_result_detail = context['engine']['frame'].copy()
         IkaUtils.dprint('%s: Gathered img_result (%s)' %
                         (self, self.img_result_detail.shape))
 
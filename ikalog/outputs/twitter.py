@@ -492,7 +492,7 @@ class Twitter(object):
     # @param context   IkaLog context
     #
     def on_game_individual_result(self, context):
-        self.img_result_detail = context['engine']['frame']
+        self.img_result_detail = context['engine']['frame'].copy()
 
     def on_game_session_end(self, context):
         IkaUtils.dprint('%s (enabled = %s)' % (self, self.enabled))
@@ -10,3 +10,4 @@ from .result_judge import ResultJudge
 from .result_udemae import ResultUdemae
 from .result_gears import ResultGears
 from .tower_tracker import TowerTracker
+from .scheduler import SceneScheduler
@@ -26,12 +26,17 @@ from ikalog.utils import *
 
 class GameFinish(object):
 
+    # Game-phase graph (see SceneScheduler)
+    phase = 'game_finish'
+    predecessors = ['in_game']
+    successors = ['result_judge']
+
     last_matched = False
 
     def match(self, context):
-        frame = context['engine']['frame']
+        frame_cache = FrameCache.from_context(context)
 
-        matched = self.mask_finish.match(frame)
+        matched = self.mask_finish.match(frame_cache)
         ret = matched and (not self.last_matched)
         self.last_matched = matched
 
@@ -26,6 +26,11 @@ from ikalog.utils import *
 
 class GameStart(object):
 
+    # Game-phase graph (see SceneScheduler)
+    phase = 'game_start'
+    predecessors = ['lobby']
+    successors = ['in_game']
+
     # 720p サイズでの値
     mapname_width = 430
     mapname_left = 1280 - mapname_width
@@ -40,101 +45,79 @@ class GameStart(object):
     rulename_height = rulename_bottom - rulename_top
 
     def guess_stage(self, frame):
-        most_possible_stage = (0, None)
-
-        for stage in self.map_list:
-            matched, fg_score, bg_score = stage['mask'].match_score(frame)
-            if matched and (most_possible_stage[0] < fg_score):
-                most_possible_stage = (fg_score, stage)
-
-        return most_possible_stage[1]
+        return self.map_bank.best_match(frame)
 
     def guess_rule(self, frame):
-        most_possible_rule = (0, None)
+        return self.rule_bank.best_match(frame)
+
+    ##
+    # Update context['game'] with the leaders of the elections.
+    # @param force  If True, the leaders win even without the margin.
+    # @return (stage, rule) elected.
+    #
+    def elect(self, context, force=False):
+        # 古すぎる投票は捨てる
+        t = context['engine']['msec']
+        self.stage_ballot.expire(t)
+        self.rule_ballot.expire(t)
 
-        for rule in self.rule_list:
-            matched, fg_score, bg_score = rule['mask'].match_score(frame)
-            if matched and (most_possible_rule[0] < fg_score):
-                most_possible_rule = (fg_score, rule)
+        stage = self.stage_ballot.decided(force=force)
+        rule = self.rule_ballot.decided(force=force)
+
+        # 確定したものだけ更新
+        if stage is not None:
+            context['game']['map'] = stage
+        if rule is not None:
+            context['game']['rule'] = rule
 
-        return most_possible_rule[1]
+        return stage, rule
 
-    def elect(self, context):
-        # 古すぎる投票は捨てる
-        election_start = context['engine']['msec'] - self.election_period
-        while (len(self.votes) and self.votes[0][0] < election_start):
-            del self.votes[0]
-
-        # 考えづらいがゼロ票なら開票しない
-        if len(self.votes) == 0:
-            return None, None
-
-        # 3秒以上たっていたら開票開始
-        #election_start2 = context['engine']['msec'] - (3 * 1000)
-        # if election_start2 < self.votes[0][0]:
-        #    return None, None
-
-        # 開票作業
-        stages = {}
-        rules = {}
-
-        count = 0
-        stage_top = (0, None)  # 最高票数の tuple   (17[票], <IkaMatcher>)
-        rule_top = (0, None)
-
-        for vote in self.votes:
-            if vote[1] is not None:
-                stage = vote[1]['name']
-                stages[stage] = stages[stage] + 1 if map in stages else 1
-                if stage_top[0] < stages[stage]:
-                    stage_top = (stages[stage], vote[1])
-
-            if vote[2] is not None:
-                rule = vote[2]['name']
-                rules[rule] = rules[rule] + 1 if rule in rules else 1
-                if rule_top[0] < rules[rule]:
-                    rule_top = (rules[rule], vote[2])
-
-        # 必要票数
-        quorum = 1  # max(3, len(self.votes) / 2)
-        # print(maps)
-        # print(rules)
-        #print('quorum = %s' % quorum)
-
-        # 必要票数が達しなかった場合
-        if stage_top[0] < quorum:
-            stage_top = (0, None)
-
-        if rule_top[0] < quorum:
-            rule_top = (0, None)
-
-        # 必要票数に達したものだけ更新
-        if stage_top[1] is not None:
-            context['game']['map'] = stage_top[1]
-        if rule_top[1] is not None:
-            context['game']['rule'] = rule_top[1]
-
-        return stage_top[1], rule_top[1]
+    ##
+    # Check if both of the stage and the rule are decided.
+    #
+    def is_decided(self):
+        return self.stage_ballot.is_decided() and self.rule_ballot.is_decided()
 
     def match(self, context):
-        map = self.guess_stage(context['engine']['frame'])
-        rule = self.guess_rule(context['engine']['frame'])
+        frame_cache = FrameCache.from_context(context)
+
+        # 確定後は、確定したステージとルールが表示されているかだけ見る
+        if self.is_decided():
+            stage = self.stage_ballot.decided()
+            rule = self.rule_ballot.decided()
+            return stage['mask'].match(frame_cache) or \
+                rule['mask'].match(frame_cache)
+
+        map = self.guess_stage(frame_cache)
+        rule = self.guess_rule(frame_cache)
 
         if not map is None:
             context['game']['map'] = map
         if not rule is None:
             context['game']['rule'] = rule
 
-        if len(self.votes) or map or rule:
-            self.votes.append((context['engine']['msec'], map, rule))
+        if map or rule:
+            t = context['engine']['msec']
+            self.stage_ballot.vote(map, t)
+            self.rule_ballot.vote(rule, t)
 
         self.elect(context)
 
         return (map or rule)
 
+    def reset(self):
+        self.stage_ballot.reset()
+        self.rule_ballot.reset()
+
     def __init__(self, debug=False):
+        # 5秒以内の投票で、次点に3票差がついたら確定
         self.election_period = 5 * 1000  # msec
-        self.votes = []
+        self.stage_ballot = BallotBox(
+            size=32, margin=3, period=self.election_period,
+            key=lambda stage: stage['name'])
+        self.rule_ballot = BallotBox(
+            size=32, margin=3, period=self.election_period,
+            key=lambda rule: rule['name'])
 
         self.map_list = [
             {'name': 'タチウオパーキング', 'file': 'masks/gachi_tachiuo.png'},
@@ -182,6 +165,12 @@ class GameStart(object):
                 debug=debug,
             )
 
+        # All the masks share the ROI; score them at once.
+        self.map_bank = MatcherBank(
+            [(map['mask'], map) for map in self.map_list], debug=debug)
+        self.rule_bank = MatcherBank(
+            [(rule['mask'], rule) for rule in self.rule_list], debug=debug)
+
 if __name__ == "__main__":
     target = cv2.imread(sys.argv[1])
 
@@ -26,6 +26,11 @@ from ikalog.utils.character_recoginizer import *
 
 
 class InGame(object):
+    # Game-phase graph (see SceneScheduler)
+    phase = 'in_game'
+    predecessors = ['game_start']
+    successors = ['game_finish', 'result_judge']
+
     # 720p サイズでの値
     timer_left = 60
     timer_width = 28
@@ -38,132 +43,120 @@ class InGame(object):
     meter_width = 485
     meter_height = 1
 
+    # 生存イカの目の部分
+    eye_top = 44
+    eye_height = 6
+
+    # キルしたときのメッセージ (下から4つ)
+    killed_left = 502
+    killed_y = [652, 652 - 40, 652 - 80, 652 - 120]  # たぶん...。
+    killed_roi = (502, 652 - 120, 25, 120 + 30)
+
+    # 塗りポイント (4桁)
+    paint_score_roi = (938, 33, 1079 + 37 - 938, 41)
+
+    ##
+    # Find the squid icons on the meter.
+    # @param bright  Bright (not black) pixels of the meter.
+    # @param x       Position to start from (next to the VS).
+    # @param step    Step to the next pixel to check (-3 or 3).
+    # @param count   Number of the icons.
+    # @return X positions of the icons, or None.
+    #
+    # Only every 3rd pixel from x is checked. Each icon is between the
+    # last dark pixel before its bright run and the first dark pixel
+    # after the run.
+    #
+    def find_squids(self, bright, x, step, count=4):
+        if step > 0:
+            positions = np.arange(x, len(bright), step)
+        else:
+            positions = np.arange(x, -1, step)
+        positions = positions[(positions >= 0) & (positions < len(bright))]
+
+        # Runs reaching the end of the meter are not counted
+        runs = find_runs(bright[positions])
+        if len(runs) < count:
+            return None
+
+        runs = np.array(runs[:count])
+        inner = positions[np.maximum(runs[:, 0] - 1, 0)]
+        outer = positions[runs[:, 1] + 1]
+        return (inner + outer) // 2
+
+    ##
+    # Draw the debug overlay of lives() (the eye regions checked).
+    # @param img  The image to draw on, e.g. a copy of the frame.
+    # @return img
+    #
+    def draw_lives_overlay(self, img):
+        for x in self._lives_debug:
+            cv2.rectangle(img, (self.meter_left + x - 4, self.eye_top),
+                          (self.meter_left + x + 4, self.eye_top + self.eye_height),
+                          (255, 255, 255), 1)
+        return img
+
     def lives(self, context):
         if not context['engine']['inGame']:
             return None, None
 
-        img = context['engine']['frame'][self.meter_top:self.meter_top +
-                                         self.meter_height, self.meter_left:self.meter_left + self.meter_width]
-        img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        img2 = cv2.resize(img, (self.meter_width, 100))
-        # for i in range(2):
-        #     img2[20:40,:, i] = cv2.resize(img_hsv[:,:,0], (self.meter_width, 20))
-        #     img2[40:60,:, i] = cv2.resize(img_hsv[:,:,1], (self.meter_width, 20))
-        #     img2[60:80,:, i] = cv2.resize(img_hsv[:,:,2], (self.meter_width, 20))
-        #
-        # cv2.imshow('yagura',     img2)
-        # cv2.imshow('yagura_hsv', cv2.resize(img_hsv, (self.meter_width, 100)))
+        frame_cache = FrameCache.from_context(context)
+        meter_roi = (self.meter_left, self.meter_top,
+                     self.meter_width, self.meter_height)
+        img = frame_cache.bgr(meter_roi)
+        img_hsv = frame_cache.hsv(meter_roi)
 
         # VS 文字の位置（白）を検出する (s が低く v が高い)
-        white_mask_s = cv2.inRange(img_hsv[:, :, 1], 0, 8)
-        white_mask_v = cv2.inRange(img_hsv[:, :, 2], 248, 256)
-        white_mask = np.minimum(white_mask_s, white_mask_v)
-
-        x_list = np.arange(self.meter_width)
-        vs_x = np.extract(white_mask > 128, x_list)
+        white_mask = (img_hsv[0, :, 1] <= 8) & (img_hsv[0, :, 2] >= 248)
+        vs_x = np.flatnonzero(white_mask)
+        if len(vs_x) == 0:
+            return None, None
 
         vs_xPos = np.average(vs_x)  # VS があるX座標の中心がわかった
 
-        # print(vs_xPos)
-
         # 明るい白以外を検出する (グレー画像から)
-        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        img_gray2 = cv2.resize(img_gray, (self.meter_width, 20))
-        img_gray3 = cv2.inRange(img_gray2, 48, 256)
-
-        team1 = []
-        team2 = []
-
-        # 左チーム
-        x = vs_xPos - 20
-        x2 = x
-        direction = -3
-        for i in range(4):
-            while img_gray3[0, x] < 128:
-                x2 = x
-                x = x + direction
-
-            while img_gray3[0, x] > 128:
-                x = x + direction
-
-            x1 = x
-            # プレイヤー画像は x1:x2 の間にある
-            squid_xPos = int((x1 + x2) / 2)
-            #print(x1, squid_xPos, x2)
-            team1.append(squid_xPos)
-
-        # 右チーム
-        x = vs_xPos + 20
-        x1 = x
-        direction = 3
-        for i in range(4):
-            while img_gray3[0, x] < 128:
-                x1 = x
-                x = x + direction
-
-            while img_gray3[0, x] > 128:
-                x = x + direction
-
-            x2 = x
-            # プレイヤー画像は x1:x2 の間にある
-            squid_xPos = int((x1 + x2) / 2)
-            #print(x1, squid_xPos, x2)
-            team2.append(squid_xPos)
-
-        team1 = np.sort(team1)
-        team2 = np.sort(team2)
-
-        # 目の部分が白かったら True なマスクをつくる
-        img_eye = context['engine']['frame'][
-            44:50, self.meter_left:self.meter_left + self.meter_width]
-        img_eye_hsv = cv2.cvtColor(img_eye, cv2.COLOR_BGR2HSV)
-        eye_white_mask_s = cv2.inRange(img_eye_hsv[:, :, 1], 0, 48)
-        eye_white_mask_v = cv2.inRange(img_eye_hsv[:, :, 2], 200, 256)
-        eye_white_mask = np.minimum(eye_white_mask_s, eye_white_mask_v)
-        a = []
-        team1_color = None
-        team2_color = None
-
-        for i in team1:
-            eye_score = np.sum(eye_white_mask[:, i - 4: i + 4]) / 255
-            alive = eye_score > 1
-            a.append(alive)
-
-            if alive:
-                team1_color = img[0, i]  # BGR
-                team1_color_hsv = img_hsv[0, i]
-
-            cv2.rectangle(context['engine']['frame'], (self.meter_left +
-                                                       i - 4,  44), (self.meter_left + i + 4, 50), (255, 255, 255), 1)
-
-        b = []
-        for i in team2:
-            eye_score = np.sum(eye_white_mask[:, i - 4: i + 4]) / 255
-            alive = eye_score > 1
-            b.append(alive)
-
-            if alive:
-                team2_color = img[0, i]  # BGR
-                team2_color_hsv = img_hsv[0, i]
-
-            cv2.rectangle(context['engine']['frame'], (self.meter_left +
-                                                       i - 4,  44), (self.meter_left + i + 4, 50), (255, 255, 255), 1)
-        # print("色: 味方 %d 敵 %d" % (team1_color, team2_color))
-        # print("味方 %s 敵 %s" % (a,b))
-        # cv2.imshow('yagura_gray', img_gray2)
-        # cv2.imshow('yagura_gray2', img_gray3)
-        # cv2.imshow('eyes', eye_white_mask)
+        bright = frame_cache.gray(meter_roi)[0] >= 48
+
+        # 左チーム, 右チーム
+        team1 = self.find_squids(bright, int(vs_xPos - 20), -3)
+        team2 = self.find_squids(bright, int(vs_xPos + 20), 3)
+        if (team1 is None) or (team2 is None):
+            return None, None
+
+        squids = np.concatenate((np.sort(team1), team2))
+
+        # 目の部分が白いドットを列毎に数え、各イカの前後4ドットで合計
+        img_eye_hsv = frame_cache.hsv(
+            (self.meter_left, self.eye_top, self.meter_width, self.eye_height))
+        eye_white = (img_eye_hsv[:, :, 1] <= 48) & (img_eye_hsv[:, :, 2] >= 200)
+        eye_count = np.concatenate(
+            ([0], np.cumsum(np.count_nonzero(eye_white, axis=0))))
+
+        x1 = np.clip(squids - 4, 0, self.meter_width)
+        x2 = np.clip(squids + 4, 0, self.meter_width)
+        alive = (eye_count[x2] - eye_count[x1]) > 1
+
+        if self.debug:
+            self._lives_debug = squids.tolist()
+
+        a = alive[0:4].tolist()
+        b = alive[4:8].tolist()
 
         hasTeamColor = ('team_color_bgr' in context['game'])
 
-        if (not team1_color is None) and (not team2_color is None) and not hasTeamColor:
+        if (True in a) and (True in b) and not hasTeamColor:
+            # 各チームで一番右の生存イカの色
+            x1 = squids[0:4][alive[0:4]][-1]
+            x2 = squids[4:8][alive[4:8]][-1]
+
+            # The frame buffer is reused, so copy the values.
             context['game']['team_color_bgr'] = [
-                team1_color,
-                team2_color
+                img[0, x1].copy(),
+                img[0, x2].copy(),
             ]
             context['game']['team_color_hsv'] = [
-                team1_color_hsv,
-                team2_color_hsv
+                img_hsv[0, x1].copy(),
+                img_hsv[0, x2].copy(),
             ]
 
             callPlugins = context['engine']['service']['callPlugins']
@@ -172,12 +165,13 @@ class InGame(object):
         return (a, b)
 
     def matchTimerIcon(self, context):
-        return self.mask_timer.match(context['engine']['frame'])
+        return self.mask_timer.match(FrameCache.from_context(context))
 
-    def match_paint_score(self, context):
+    def _recoginize_paint_score(self, context):
         x_list = [938, 988, 1032, 1079]
 
-        paint_score = 0
+        # Recognize all digits at once.
+        batch = CharacterBatch(self.number_recoginizer)
         for x in x_list:
             # Extract a digit.
             img = context['engine']['frame'][33:33 + 41, x:x + 37, :]
@@ -196,19 +190,30 @@ class InGame(object):
                 # Seems not to be a white character on black background.
                 return None
 
-            # Recoginize a digit.
-            digit = self.number_recoginizer.match_digits(
+            batch.add(
                 img,
                 num_digits=(1, 1),
                 char_width=(11, 40),
                 char_height=(28, 33),
             )
 
+        paint_score = 0
+        for digit in batch.match_digits():
             if digit is None:
                 return None
 
             paint_score = (paint_score * 10) + digit
 
+        return paint_score
+
+    def match_paint_score(self, context):
+        # The score changes only when the player paints.
+        paint_score = RoiWatcher.call_in_context(
+            context, 'in_game/paint_score', self.paint_score_roi,
+            self._recoginize_paint_score, context)
+        if paint_score is None:
+            return None
+
         # Set latest paint_score to the context.
         last_paint_score = context['game'].get('paint_score', 0)
         if last_paint_score != paint_score:
@@ -220,57 +225,52 @@ class InGame(object):
     # FixMe
     _last_killed = 0
 
-    def matchKilled(self, context):
-        img_gray = cv2.cvtColor(context['engine']['frame'][
-                                :, 502:778], cv2.COLOR_BGR2GRAY)
-        ret, img_thresh = cv2.threshold(img_gray, 90, 255, cv2.THRESH_BINARY)
-
-        killed_y = [652, 652 - 40, 652 - 80, 652 - 120]  # たぶん...。
-        killed = 0
-
-        list = []
-        for n in range(len(killed_y)):
-            y = killed_y[n]
-            box = img_thresh[y:y + 30, :]
-            r = self.mask_killed.match(box)
+    ##
+    # Check the slots of the kill messages, from the bottom.
+    # @param context  The context.
+    # @param stop     If True, stop at the first empty slot.
+    # @return List of the slots which have the message.
+    #
+    # Only the rectangles mask_killed looks at are converted, into the
+    # preallocated buffer.
+    #
+    def _match_killed_slots(self, context, stop=False):
+        frame = context['engine']['frame']
+        x1 = self.killed_left
+        x2 = x1 + self.mask_killed.width
+
+        slots = []
+        for n, y in enumerate(self.killed_y):
+            box = self._killed_boxes[n]
+            img = frame[y:y + self.mask_killed.height, x1:x2]
+            cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=box)
+            cv2.threshold(box, 90, 255, cv2.THRESH_BINARY, dst=box)
+
+            if self.mask_killed.match(box):
+                slots.append(n)
+            elif stop:
+                break
 
-            if r:
-                list.append(n)
+        return slots
 
-        return len(list)
+    def matchKilled(self, context):
+        return len(self._match_killed_slots(context))
 
     def match_go_sign(self, context):
         # ゴーサイン (60秒に1度まで)
         msec = context['engine']['msec']
         if (context['scenes']['in_game']['last_go_sign'] + 60 * 1000) < msec:
-            if self.mask_go_sign.match(context['engine']['frame']):
+            if self.mask_go_sign.match(FrameCache.from_context(context)):
                 context['scenes']['in_game']['last_go_sign'] = msec
                 callPlugins = context['engine']['service']['callPlugins']
                 callPlugins('on_game_go_sign')
 
-        return self.mask_go_sign.match(context['engine']['frame'])
+        return self.mask_go_sign.match(FrameCache.from_context(context))
 
     def match_kills1(self, context):
-        img_gray = cv2.cvtColor(
-            context['engine']['frame'][:, 502:778],
-            cv2.COLOR_BGR2GRAY)
-        ret, img_thresh = cv2.threshold(img_gray, 90, 255, cv2.THRESH_BINARY)
-
-        killed_y = [652, 652 - 40, 652 - 80, 652 - 120]  # たぶん...。
-        killed = 0
-
-        list = []
-        for n in range(len(killed_y)):
-            y = killed_y[n]
-            box = img_thresh[y:y + 30, :]
-            r = self.mask_killed.match(box)
-
-            if r:
-                list.append(n)
-            else:
-                break
-
-        return len(list)
+        return RoiWatcher.call_in_context(
+            context, 'in_game/killed', self.killed_roi,
+            lambda: len(self._match_killed_slots(context, stop=True)))
 
     def match_kills_loop(self):
         # ToDo: 誰をキルしたか認識してカウントする
@@ -309,7 +309,10 @@ class InGame(object):
                 last_kills = min(last_kills, kills)
 
     def match_dead(self, context):
-        return self.mask_dead.match(context['engine']['frame'])
+        m = self.mask_dead
+        return RoiWatcher.call_in_context(
+            context, 'in_game/dead', (m.left, m.top, m.width, m.height),
+            m.match, FrameCache.from_context(context))
 
     def recoginize_and_vote_death_reason(self, context):
         if self.deadly_weapon_recoginizer is None:
@@ -330,25 +333,21 @@ class InGame(object):
         img_weapon_b_bgr = cv2.cvtColor(img_weapon_b, cv2.COLOR_GRAY2BGR)
         weapon_id = self.deadly_weapon_recoginizer.match(img_weapon_b_bgr)
 
-        # 投票する(あとでまとめて開票)
-        data = context['scenes']['in_game']
-        data['deadly_weapons'][weapon_id] = \
-            data['deadly_weapons'].get(weapon_id, 0) + 1
+        # 投票する(確定したら開票)
+        decided = self.death_reason_ballot.vote(weapon_id)
 
-    def count_death_reason_votes(self, context):
         data = context['scenes']['in_game']
-        if len(data['deadly_weapons']) == 0:
-            return None
-
-        most_possible_id = None
-        most_possible_count = 0
-        for weapon_id in data['deadly_weapons'].keys():
-            weapon_count = data['deadly_weapons'][weapon_id]
-            if most_possible_count < weapon_count:
-                most_possible_id = weapon_id
-                most_possible_count = weapon_count
-
-        if (most_possible_count == 0) or (most_possible_id is None):
+        data['deadly_weapons'] = self.death_reason_ballot.get_counts()
+        return decided
+
+    ##
+    # Count the votes of the death reason, and notify the plugins.
+    # @param force  If True, the leader wins even without the margin.
+    # @return weapon_id, or None if not identified.
+    #
+    def count_death_reason_votes(self, context, force=False):
+        most_possible_id = self.death_reason_ballot.decided(force=force)
+        if most_possible_id is None:
             return None
 
         context['game']['last_death_reason'] = most_possible_id
@@ -386,6 +385,8 @@ class InGame(object):
 
             data['deadly_weapons'] = {}
             data['msec_last_death'] = msec
+            self.death_reason_ballot.reset()
+            identified = False
 
             context['game']['dead'] = True
 
@@ -398,7 +399,11 @@ class InGame(object):
                 context = (yield dead)
 
                 if self.match_dead(context):
-                    self.recoginize_and_vote_death_reason(context)
+                    # 死因が確定したらそれ以上は認識しない
+                    if (not identified) and \
+                            self.recoginize_and_vote_death_reason(context):
+                        identified = \
+                            self.count_death_reason_votes(context) is not None
                     continue
 
                 # 3秒以上 or 5 フレーム間は last_kill の値を維持する
@@ -410,8 +415,9 @@ class InGame(object):
 
             # 死亡状態を抜けた。
 
-            # 死因が判れば特定、イベントを発生させる
-            self.count_death_reason_votes(context)
+            # 確定していなければ最多得票の死因でイベントを発生させる
+            if not identified:
+                self.count_death_reason_votes(context, force=True)
 
             context['game']['dead'] = False
 
@@ -469,6 +475,11 @@ class InGame(object):
         self._match_loop = self.match_loop()
         self._match_loop.send(None)
 
+        # Debug overlays are drawn by draw_lives_overlay(), not on the
+        # frame.
+        self.debug = debug
+        self._lives_debug = []
+
         self.mask_timer = IkaMatcher(
             self.timer_left, self.timer_top, self.timer_top, self.timer_height,
             img_file='masks/ingame_timer.png',
@@ -508,6 +519,9 @@ class InGame(object):
             label='killed',
             debug=debug,
         )
+        self._killed_boxes = np.zeros(
+            (len(self.killed_y), self.mask_killed.height, self.mask_killed.width),
+            dtype=np.uint8)
 
         self.mask_dead = IkaMatcher(
             1057, 657, 137, 26,
@@ -520,6 +534,9 @@ class InGame(object):
             debug=debug,
         )
 
+        # 死因の投票。次点に3票差がついたら確定する
+        self.death_reason_ballot = BallotBox(size=16, margin=3)
+
         try:
             self.deadly_weapon_recoginizer = DeadlyWeaponRecoginizer()
         except:
@@ -556,4 +573,8 @@ if __name__ == "__main__":
 
     print(obj.matchTimerIcon(context))
     print(context['scenes'][obj])
+
+    context['engine']['inGame'] = True
+    print(obj.lives(context))
+    cv2.imshow('lives', obj.draw_lives_overlay(target.copy()))
     cv2.waitKey()
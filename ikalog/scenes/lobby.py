@@ -27,18 +27,24 @@ from ikalog.utils import *
 
 class Lobby(object):
 
+    # Game-phase graph (see SceneScheduler)
+    phase = 'lobby'
+    predecessors = ['result_gears', 'result_detail']
+    successors = ['game_start']
+
     def match_tag_lobby(self, context):
-        frame = context['engine']['frame']
+        frame_cache = FrameCache.from_context(context)
 
         # 「ルール」「ステージ」
-        if not self.mask_tag_rule.match(frame):
+        if not self.mask_tag_rule.match(frame_cache):
             return False
 
-        if not self.mask_tag_stage.match(frame):
+        if not self.mask_tag_stage.match(frame_cache):
             return False
 
-        r_tag_matching = self.mask_tag_matching.match(frame)
-        r_tag_matched = self.mask_tag_matched.match(frame)
+        scores = self.bank_tag_matching.match_scores(frame_cache)
+        r_tag_matching = scores[0][0]
+        r_tag_matched = scores[1][0]
 
         matched = (r_tag_matching or r_tag_matched)
         matched = matched and not (r_tag_matching and r_tag_matched)
@@ -63,8 +69,8 @@ class Lobby(object):
             num_members = 0
             for n in range(len(top_list)):
                 top = top_list[n]
-                img_ready = frame[top:top + 41, 1118:1118 + 51]
-                img_ready_yellow = filter_yellow.evaluate(img_ready)
+                img_ready_hsv = frame_cache.hsv((1118, top, 51, 41))
+                img_ready_yellow = filter_yellow.evaluate(img_hsv=img_ready_hsv)
 
                 # vチェックが付いていれば平均600ぐらい、
                 # vチェックが付いていなければ真っ黒(0)ぐらいのはず
@@ -78,21 +84,21 @@ class Lobby(object):
         return True
 
     def match_private_lobby(self, context):
-        frame = context['engine']['frame']
+        frame_cache = FrameCache.from_context(context)
 
-        r = self.mask_private_rule.match(frame) and \
-            self.mask_private_stage.match(frame)
+        r = self.mask_private_rule.match(frame_cache) and \
+            self.mask_private_stage.match(frame_cache)
 
         # r == False ならプライベートロビーではない
         if not r:
             return False
 
         # Matching? or Matched?
-        r_matching = self.mask_private_matching_alpha.match(frame) and \
-            self.mask_private_matching_bravo.match(frame)
+        r_matching = self.mask_private_matching_alpha.match(frame_cache) and \
+            self.mask_private_matching_bravo.match(frame_cache)
 
-        r_matched = self.mask_private_matched_alpha.match(frame) and \
-            self.mask_private_matched_bravo.match(frame)
+        r_matched = self.mask_private_matched_alpha.match(frame_cache) and \
+            self.mask_private_matched_bravo.match(frame_cache)
 
         # マッチング中かつマッチング完了はありえない
         if (not (r_matching or r_matched)) or (r_matching and r_matched):
@@ -109,19 +115,20 @@ class Lobby(object):
         return True
 
     def match_public_lobby(self, context):
-        frame = context['engine']['frame']
+        frame_cache = FrameCache.from_context(context)
 
         # 「ルール」「ステージ」
-        if not self.mask_rule.match(frame):
+        if not self.mask_rule.match(frame_cache):
             return False
 
-        if not self.mask_stage.match(frame):
+        if not self.mask_stage.match(frame_cache):
             return False
 
         # マッチング中は下記文字列のうちひとつがあるはず
-        r_pub_matching = self.mask_matching.match(frame)
-        r_pub_matched = self.mask_matched.match(frame)
-        r_fes_matched = self.mask_fes_matched.match(frame)
+        scores = self.bank_matching.match_scores(frame_cache)
+        r_pub_matching = scores[0][0]
+        r_pub_matched = scores[1][0]
+        r_fes_matched = self.mask_fes_matched.match(frame_cache)
 
         match_count = 0
         for matched in [r_pub_matching, r_pub_matched, r_fes_matched]:
@@ -300,6 +307,12 @@ class Lobby(object):
             debug=debug
         )
 
+        # Matching/Matched share the ROI
+        self.bank_matching = MatcherBank(
+            [self.mask_matching, self.mask_matched], debug=debug)
+        self.bank_tag_matching = MatcherBank(
+            [self.mask_tag_matching, self.mask_tag_matched], debug=debug)
+
         self.mask_private_rule = IkaMatcher(
             78, 133, 74, 24,
             img_file='masks/ui_lobby_private_matched.png',
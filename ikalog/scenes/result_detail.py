@@ -18,6 +18,7 @@
 #  limitations under the License.
 #
 import sys
+import threading
 import traceback
 from datetime import datetime
 
@@ -25,10 +26,24 @@ import cv2
 
 import numpy as np
 from ikalog.utils import *
-from ikalog.inputs.filters import OffsetFilter
 
 class ResultDetail(object):
 
+    # Game-phase graph (see SceneScheduler)
+    phase = 'result_detail'
+    predecessors = ['result_judge']
+    successors = ['result_udemae', 'result_gears', 'lobby']
+
+    # Max offset of the frame (in pixels) auto_offset() looks for.
+    offset_search_range = 5
+    # Results of phase correlation weaker than this are not trusted.
+    offset_min_response = 0.1
+
+    # The players slide in. IkaEngine waits for this number of stable
+    # frames (or the timeout, in seconds) before analyze().
+    stable_frames = 3
+    stable_timeout = 2.0
+
     def is_entry_me(self, entry_img):
         # ヒストグラムから、入力エントリが自分かを判断
         if len(entry_img.shape) > 2 and entry_img.shape[2] != 1:
@@ -50,8 +65,10 @@ class ResultDetail(object):
         return (me_score_normalized > 1)
 
     # FixMe: character_recoginizer を使って再実装
-    def guess_fes_title(self, img_fes_title):
-        img_fes_title_hsv = cv2.cvtColor(img_fes_title, cv2.COLOR_BGR2HSV)
+    def guess_fes_title(self, img_fes_title, img_fes_title_hsv=None):
+        if img_fes_title_hsv is None:
+            img_fes_title_hsv = cv2.cvtColor(
+                img_fes_title, cv2.COLOR_BGR2HSV)
         yellow = cv2.inRange(img_fes_title_hsv[:, :, 0], 32 - 2, 32 + 2)
         yellow2 = cv2.inRange(img_fes_title_hsv[:, :, 2], 240, 255)
         img_fes_title_mask = np.minimum(yellow, yellow2)
@@ -100,7 +117,17 @@ class ResultDetail(object):
 
         return gender, level, team
 
-    def analyze_entry(self, img_entry):
+    ##
+    # Analyze an entry of a player.
+    # @param img_entry  Image of the entry.
+    # @param batches    If given, characters are only collected to the
+    #                   batches, and recognized by _match_batches() later.
+    # @return The entry.
+    #
+    # Called from the worker threads; must not modify anything but the
+    # batches.
+    #
+    def analyze_entry(self, img_entry, batches=None):
         # 各プレイヤー情報のスタート左位置
         entry_left = 610
         # 各プレイヤー報の横幅
@@ -151,7 +178,7 @@ class ResultDetail(object):
         img_deaths = img_entry[entry_height_kd:entry_height_kd *
                                2, entry_xoffset_kd:entry_xoffset_kd + entry_width_kd]
 
-        img_fes_title = img_name[0:entry_height / 2, :]
+        img_fes_title = img_name[0:entry_height // 2, :]
         img_fes_title_hsv = cv2.cvtColor(img_fes_title, cv2.COLOR_BGR2HSV)
         yellow = cv2.inRange(img_fes_title_hsv[:, :, 0], 32 - 2, 32 + 2)
         yellow2 = cv2.inRange(img_fes_title_hsv[:, :, 2], 240, 255)
@@ -161,7 +188,7 @@ class ResultDetail(object):
 
         if is_fes:
             fes_gender, fes_level, fes_team = self.guess_fes_title(
-                img_fes_title)
+                img_fes_title, img_fes_title_hsv)
 
         # フェス中ではなく、 p の表示があれば(avg = 55.0) ナワバリ。なければガチバトル
         isRankedBattle = (not is_fes) and (
@@ -193,73 +220,219 @@ class ResultDetail(object):
             if fes_level and ('boy' in fes_level):
                 entry['prefix_en'] = fes_level['boy']
 
+        # Characters are recognized later in _match_batches(), with the
+        # other entries.
+        own_batches = batches is None
+        if own_batches:
+            batches = self._new_batches()
+
         if self.udemae_recoginizer and isRankedBattle:
-            try:
-                entry['udemae_pre'] = self.udemae_recoginizer.match(
-                    entry['img_score']).upper()
-            except:
-                IkaUtils.dprint('Exception occured in Udemae recoginization.')
-                IkaUtils.dprint(traceback.format_exc())
+            self._add_to_batch(batches, 'udemae', entry, 'udemae_pre',
+                               entry['img_score'])
 
         if self.number_recoginizer:
-            try:
-                entry['rank'] = self.number_recoginizer.match_digits(
-                    entry['img_rank'])
-                entry['kills'] = self.number_recoginizer.match_digits(
-                    entry['img_kills'])
-                entry['deaths'] = self.number_recoginizer.match_digits(
-                    entry['img_deaths'])
-                if isNawabariBattle:
-                    entry['score'] = self.number_recoginizer.match_digits(
-                        entry['img_score'])
+            fields = ['rank', 'kills', 'deaths']
+            if isNawabariBattle:
+                fields.append('score')
 
-            except:
-                IkaUtils.dprint('Exception occured in K/D recoginization.')
-                IkaUtils.dprint(traceback.format_exc())
+            for field in fields:
+                self._add_to_batch(batches, 'number', entry, field,
+                                   entry['img_%s' % field])
 
         if self.weapons and self.weapons.trained:
+            # The weapon is normalized here (in parallel) and searched in
+            # _match_batches().
             try:
-                result, distance = self.weapons.match(entry['img_weapon'])
-                entry['weapon'] = result
+                prepared = self.weapons.prepare(entry['img_weapon'])
+                with batches['lock']:
+                    batches['weapons'].append((entry, prepared))
             except:
                 IkaUtils.dprint('Exception occured in weapon recoginization.')
                 IkaUtils.dprint(traceback.format_exc())
 
+        if own_batches:
+            self._match_batches(batches)
+
         return entry
 
+    def _new_batches(self):
+        batches = {'requests': [], 'weapons': [], 'lock': threading.Lock()}
+        for name, recoginizer in [('udemae', self.udemae_recoginizer),
+                                  ('number', self.number_recoginizer)]:
+            batches[name] = None
+            if recoginizer:
+                batches[name] = character_recoginizer.CharacterBatch(
+                    recoginizer)
+        return batches
+
+    def _add_to_batch(self, batches, name, entry, field, img):
+        try:
+            index = batches[name].add(img)
+        except:
+            IkaUtils.dprint('Exception occured in %s recoginization.' % name)
+            IkaUtils.dprint(traceback.format_exc())
+            return
+
+        with batches['lock']:
+            batches['requests'].append((name, index, entry, field))
+
+    ##
+    # Recognize all characters and weapons collected by analyze_entry(),
+    # with one KNN query per model, and fill the entries.
+    #
+    def _match_batches(self, batches):
+        results = {}
+        try:
+            if batches['udemae'] is not None:
+                results['udemae'] = batches['udemae'].match()
+        except:
+            IkaUtils.dprint('Exception occured in Udemae recoginization.')
+            IkaUtils.dprint(traceback.format_exc())
+
+        try:
+            if batches['number'] is not None:
+                results['number'] = batches['number'].match_digits()
+        except:
+            IkaUtils.dprint('Exception occured in K/D recoginization.')
+            IkaUtils.dprint(traceback.format_exc())
+
+        for name, index, entry, field in batches['requests']:
+            if not name in results:
+                continue
+
+            value = results[name][index]
+            if name == 'udemae':
+                if value is None:
+                    continue
+                value = value.upper()
+            entry[field] = value
+
+        entries = batches['weapons']
+        if len(entries) > 0:
+            try:
+                weapons = self.weapons.match_prepared(
+                    [prepared for e, prepared in entries])
+                for (e, prepared), (result, distance) in zip(entries, weapons):
+                    e['weapon'] = result
+            except:
+                IkaUtils.dprint('Exception occured in weapon recoginization.')
+                IkaUtils.dprint(traceback.format_exc())
+
     def is_win(self, context):
         return context['game']['won']
 
+    ##
+    # Shift the frame. Same as OffsetFilter.execute()
+    # @param frame   The frame.
+    # @param offset  (ox, oy) Destination of the pixel (0, 0).
+    # @return New frame.
+    #
+    def _shift_frame(self, frame, offset):
+        ox, oy = offset
+        if ox == 0 and oy == 0:
+            return frame
+
+        h, w = frame.shape[0:2]
+        sx1, sy1 = max(-ox, 0), max(-oy, 0)
+        dx1, dy1 = max(ox, 0), max(oy, 0)
+        cw = w - abs(ox)
+        ch = h - abs(oy)
+
+        new_frame = np.zeros(frame.shape, frame.dtype)
+        new_frame[dy1:dy1 + ch, dx1:dx1 + cw] = \
+            frame[sy1:sy1 + ch, sx1:sx1 + cw]
+        return new_frame
+
+    ##
+    # Crop the mask ROI as if the frame were shifted by the offset.
+    # @return The ROI, or None if it is out of the frame.
+    #
+    def _crop_shifted_roi(self, frame, offset):
+        m = self.mask_win
+        x = m.left - offset[0]
+        y = m.top - offset[1]
+        if x < 0 or y < 0 or x + m.width > frame.shape[1] or \
+                y + m.height > frame.shape[0]:
+            return None
+        return frame[y: y + m.height, x: x + m.width]
+
+    def _match_offset(self, frame, offset):
+        img = self._crop_shifted_roi(frame, offset)
+        if img is None:
+            return (False, 0.0, 0.0)
+        return self.mask_win.match_score(img)
+
+    ##
+    # Estimate the offset of the frame with phase correlation.
+    # @param frame  The frame.
+    # @return (ox, oy) in sub-pixels, or None if failed.
+    #
+    def estimate_offset(self, frame):
+        x1, y1, x2, y2 = self._offset_rect
+        img = frame[y1:y2, x1:x2]
+        if len(img.shape) > 2:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if img.shape != self._offset_template.shape:
+            return None
+
+        (dx, dy), response = cv2.phaseCorrelate(
+            self._offset_template, np.float32(img))
+
+        if response < self.offset_min_response:
+            return None
+
+        # The content moved by (dx, dy); move it back.
+        return (-dx, -dy)
+
+    ##
+    # Search the offset by trying every candidate. Used when phase
+    # correlation failed.
+    #
+    def _search_offset(self, frame):
+        r = self.offset_search_range
+        best_match = (None, 0.0)
+        for ox in range(-r, r + 1):
+            for oy in range(-r, r + 1):
+                score = self._match_offset(frame, (ox, oy))
+                if score[0] and best_match[1] < score[1]:
+                    best_match = ((ox, oy), score[1])
+        return best_match[0]
+
     def auto_offset(self, context):
         # 画面のオフセットを自動検出して image を返す
+        frame = context['engine']['frame']
 
-        filter = OffsetFilter(self)
-        filter.enable()
+        # The offset doesn't change during a capture session.
+        if (self.offset is not None) and \
+                self._match_offset(frame, self.offset)[0]:
+            return self._shift_frame(frame, self.offset)
 
-        # filter が必要とするので...
-        self.out_width = 1280
-        self.out_height = 720
+        offset = None
+        estimated = self.estimate_offset(frame)
+        if estimated is not None:
+            offset = (int(round(estimated[0])), int(round(estimated[1])))
+            if not self._match_offset(frame, offset)[0]:
+                offset = None
 
-        best_match = (context['engine']['frame'], 0.0, 0, 0)
+        if offset is None:
+            offset = self._search_offset(frame)
 
-        for ox in range(-5, 6, 1):
-            for oy in range(-5, 6, 1):
-                filter.offset = (ox, oy)
-                img = filter.execute(context['engine']['frame'])
-                IkaUtils.matchWithMask(context['engine']['frame'], self.winlose_gray, 0.997, 0.20)
-                score = self.mask_win.match_score(img)
+        if offset is None:
+            # Use the frame as is. Keep the cache for next time.
+            return frame
 
-                if not score[0]:
-                    continue
-
-                if best_match[1] < score[1]:
-                    best_match = (img, score[1], ox, oy)
-
-        if best_match[2] != 0 or best_match[3] != 0:
+        if offset != self.offset and offset != (0, 0):
             IkaUtils.dprint('%s: Offset detected. (%d, %d)' %
-                (self, best_match[2], best_match[3]))
+                            (self, offset[0], offset[1]))
 
-        return best_match[0]
+        self.offset = offset
+        return self._shift_frame(frame, offset)
+
+    ##
+    # Forget the offset. Called when the capture source is changed.
+    #
+    def reset_offset(self):
+        self.offset = None
 
     def analyze(self, context):
         # 各プレイヤー情報のスタート左位置
@@ -276,12 +449,29 @@ class ResultDetail(object):
 
         img = self.auto_offset(context)
 
-        for top in entry_top:
-            entry_id = entry_id + 1
-            img_entry = img[top:top + entry_height,
-                            entry_left:entry_left + entry_width]
+        # フレームのバッファは再利用されるので、戦績に残す画像(img_*)の
+        # ためにコピーしておく
+        if img is context['engine']['frame']:
+            img = img.copy()
+
+        batches = self._new_batches()
+        img_entries = [img[top:top + entry_height,
+                           entry_left:entry_left + entry_width]
+                       for top in entry_top]
+
+        # The entries are independent. Analyze them on the shared
+        # thread pool, and recognize the characters at once later.
+        if self.thread_pool is None:
+            entries = [self.analyze_entry(img_entry, batches)
+                       for img_entry in img_entries]
+        else:
+            futures = [self.thread_pool.submit(
+                self.analyze_entry, img_entry, batches)
+                for img_entry in img_entries]
+            entries = [f.result() for f in futures]
 
-            e = self.analyze_entry(img_entry)
+        for e in entries:
+            entry_id = entry_id + 1
 
             e['team'] = 1 if entry_id < 5 else 2
             e['rank_in_team'] = entry_id if e['team'] == 1 else entry_id - 4
@@ -291,6 +481,8 @@ class ResultDetail(object):
             if e['me']:
                 context['game']['won'] = True if entry_id < 5 else False
 
+        self._match_batches(batches)
+
         context['game']['won'] = self.is_win(context)
         context['game']['timestamp'] = datetime.now()
         context['game']['is_fes'] = ('prefix' in context['game']['players'][0])
@@ -319,6 +511,16 @@ class ResultDetail(object):
         return IkaUtils.matchWithMask(context['engine']['frame'], self.winlose_gray, 0.997, 0.20)
 
     def __init__(self, debug=False):
+        # Analyze the entries in parallel. None to analyze serially.
+        self.thread_pool = get_thread_pool()
+
+        # The table of the players
+        self.stability = StabilityDetector(
+            roi=(610, 101, 610, 570),
+            frames=self.stable_frames,
+            timeout=self.stable_timeout,
+        )
+
         self.mask_win = IkaMatcher(
             651, 47, 99, 33,
             img_file='masks/result_detail.png',
@@ -365,6 +567,25 @@ class ResultDetail(object):
 
         self.winlose_gray = cv2.cvtColor(winlose, cv2.COLOR_BGR2GRAY)
 
+        # Template for estimate_offset(): the expected image around the
+        # mask (white text).
+        # cv2.phaseCorrelate() is biased by half a pixel if the DFT size
+        # is odd, so use even DFT-friendly sizes.
+        def dft_size(n):
+            while (cv2.getOptimalDFTSize(n) != n) or (n % 2):
+                n = n + 1
+            return n
+
+        m = self.mask_win
+        r = self.offset_search_range
+        x1, y1 = m.left - r, m.top - r
+        self._offset_rect = (x1, y1,
+                             x1 + dft_size(m.width + r * 2),
+                             y1 + dft_size(m.height + r * 2))
+        self._offset_template = np.float32(255 - self.winlose_gray[
+            y1:self._offset_rect[3], x1:self._offset_rect[2]])
+        self.reset_offset()
+
 if __name__ == "__main__":
     import re
     files = sys.argv[1:]
@@ -25,16 +25,21 @@ from ikalog.utils import *
 
 class ResultGears(object):
 
+    # Game-phase graph (see SceneScheduler)
+    phase = 'result_gears'
+    predecessors = ['result_detail', 'result_udemae']
+    successors = ['lobby', 'game_start']
+
     def match1(self, context):
-        frame = context['engine']['frame']
+        frame_cache = FrameCache.from_context(context)
 
-        if not self.mask_okane_msg.match(frame):
+        if not self.mask_okane_msg.match(frame_cache):
             return False
 
-        if not self.mask_level_msg.match(frame):
+        if not self.mask_level_msg.match(frame_cache):
             return False
 
-        if not self.mask_gears_msg.match(frame):
+        if not self.mask_gears_msg.match(frame_cache):
             return False
 
         return True
@@ -44,7 +49,8 @@ class ResultGears(object):
         x_list = [613, 613 + 209, 613 + 209 * 2]
         for n in range(3):
             x = x_list[n]
-            img_gear = context['engine']['frame'][457:457 + 233, x: x + 204]
+            # フレームのバッファは再利用されるのでコピーしておく
+            img_gear = context['engine']['frame'][457:457 + 233, x: x + 204].copy()
 
             gear = {}
             gear['img_name'] = img_gear[9:9 + 25, 3:3 + 194]
@@ -101,9 +107,10 @@ class ResultGears(object):
         if not ('result_gears' in context['scenes']):
             context['scenes']['result_gears'] = {}
 
-        context['scenes']['result_gears']['img_cash'] = img_cash
-        context['scenes']['result_gears']['img_level'] = img_level
-        context['scenes']['result_gears']['img_exp'] = img_exp
+        # フレームのバッファは再利用されるのでコピーしておく
+        context['scenes']['result_gears']['img_cash'] = img_cash.copy()
+        context['scenes']['result_gears']['img_level'] = img_level.copy()
+        context['scenes']['result_gears']['img_exp'] = img_exp.copy()
         context['scenes']['result_gears']['cash'] = cash
         context['scenes']['result_gears']['level'] = level
         context['scenes']['result_gears']['gears'] = gears
@@ -111,6 +118,21 @@ class ResultGears(object):
         # TODO: Slash が処理できるようになったら exp を数値化
         return True
 
+    ##
+    # Analyze the frame unless the numbers have already been analyzed
+    # after they stopped changing.
+    # @return True if the frame is analyzed (or skipped) successfully.
+    #
+    def analyze_if_changed(self, context):
+        frame_cache = FrameCache.from_context(context)
+        stable = self.stability.update(frame_cache)
+        if stable and self._analyzed_stable:
+            return True
+
+        r = self.analyze(context)
+        self._analyzed_stable = stable and r
+        return r
+
     def match_loop(self):
 
         while True:
@@ -127,6 +149,8 @@ class ResultGears(object):
             # in_trigger = True
             msec_start = context['engine']['msec']
             missed_frames = 0
+            self.stability.reset()
+            self._analyzed_stable = False
 
             # Now entered to the scene.
 
@@ -137,7 +161,7 @@ class ResultGears(object):
                 if self.match1(context):
                     msec_last = context['engine']['msec']
                     missed_frames = 0
-                    self.analyze(context)
+                    self.analyze_if_changed(context)
                 else:
 
                     missed_frames = missed_frames + 1
@@ -202,6 +226,10 @@ class ResultGears(object):
         except:
             self.number_recoginizer = None
 
+        # お金、ランク、経験値 (アニメーションする)
+        self.stability = StabilityDetector(roi=(643, 110, 544, 268))
+        self._analyzed_stable = False
+
 if __name__ == "__main__":
     target = cv2.imread(sys.argv[1])
     obj = ResultGears(debug=True)
@@ -26,22 +26,28 @@ from ikalog.utils import *
 
 class ResultJudge(object):
 
+    # Game-phase graph (see SceneScheduler)
+    phase = 'result_judge'
+    predecessors = ['game_finish']
+    successors = ['result_detail']
+
     def match1(self, context):
         frame = context['engine']['frame']
 
         if frame is None:
             return False
 
-        match_win = self.mask_win.match(frame)
-        match_lose = self.mask_lose.match(frame)
+        frame_cache = FrameCache.from_context(context)
+        scores = self.bank_win_lose.match_scores(frame_cache)
+        match_win = scores[0][0]
+        match_lose = scores[1][0]
 
         match_win_or_lose = (match_win or match_lose) and (
             not (match_win and match_lose))
         if not match_win_or_lose:
             return False
 
-        img_bar = context['engine']['frame'][600:600 + 30, 126:126 + 1028, :]
-        img_bar_hsv = cv2.cvtColor(img_bar, cv2.COLOR_BGR2HSV)
+        img_bar_hsv = frame_cache.hsv((126, 600, 1028, 30))
         ret, img_bar_b = cv2.threshold(
             img_bar_hsv[:, :, 2], 96, 255, cv2.THRESH_BINARY)
 
@@ -54,8 +60,9 @@ class ResultJudge(object):
         return True
 
     def analyze(self, context):
-        win_ko = bool(self.mask_win_ko.match(context['engine']['frame']))
-        lose_ko = bool(self.mask_lose_ko.match(context['engine']['frame']))
+        frame_cache = FrameCache.from_context(context)
+        win_ko = bool(self.mask_win_ko.match(frame_cache))
+        lose_ko = bool(self.mask_lose_ko.match(frame_cache))
 
         # win_ko もしくは lose_ko が検出されたらノックアウト。
         # ただし以前のフレームで検出したノックアウトが検出できなくなっている
@@ -278,6 +285,9 @@ class ResultJudge(object):
             debug=debug,
         )
 
+        self.bank_win_lose = MatcherBank(
+            [self.mask_win, self.mask_lose], debug=debug)
+
         try:
             self.number_recoginizer = character_recoginizer.NumberRecoginizer()
         except:
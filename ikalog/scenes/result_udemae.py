@@ -29,9 +29,14 @@ import ikalog.utils.matcher as matcher
 
 class ResultUdemae(object):
 
+    # Game-phase graph (see SceneScheduler)
+    phase = 'result_udemae'
+    predecessors = ['result_detail']
+    successors = ['result_gears']
+
     def match1(self, context):
-        frame = context['engine']['frame']
-        matched = self.mask_udemae_msg.match(frame)
+        frame_cache = FrameCache.from_context(context)
+        matched = self.mask_udemae_msg.match(frame_cache)
         return matched
 
     def analyze(self, context):
@@ -93,12 +98,39 @@ class ResultUdemae(object):
                 'udemae_exp_pre': udemae_exp,
             }
 
-        # udemae_(str|exp)_after は常に最新の値を指す
+        self.vote(context, (udemae_str, udemae_exp))
+        return True
 
+    ##
+    # Vote the udemae, and update udemae_(str|exp)_after with the leader.
+    # @param udemae  (udemae_str, udemae_exp)
+    #
+    def vote(self, context, udemae):
+        self._last_udemae = udemae
+        self.ballot.vote(udemae)
+
+        # udemae_(str|exp)_after は直近の投票で最多の値を指す。
+        # アニメーション中の値は数フレームで押し出される
+        udemae_str, udemae_exp = self.ballot.decided(force=True)
         context['scenes']['result_udemae']['udemae_str_after'] = udemae_str
         context['scenes']['result_udemae']['udemae_exp_after'] = udemae_exp
 
-        return True
+    ##
+    # Analyze the frame unless the numbers have already been analyzed
+    # after they stopped changing.
+    # @return True if the frame is analyzed (or skipped) successfully.
+    #
+    def analyze_if_changed(self, context):
+        frame_cache = FrameCache.from_context(context)
+        stable = self.stability.update(frame_cache)
+        if stable and self._analyzed_stable:
+            # 画面は変化していないので、前回の結果をもう一票とする
+            self.vote(context, self._last_udemae)
+            return True
+
+        r = self.analyze(context)
+        self._analyzed_stable = stable and r
+        return r
 
     def match_loop(self):
         # FIXME: チャタリング対策
@@ -111,7 +143,12 @@ class ResultUdemae(object):
             t = context['engine']['msec']
 
             if self.match1(context):
-                r = self.analyze(context)
+                if not in_trigger:
+                    self.stability.reset()
+                    self.ballot.reset()
+                    self._analyzed_stable = False
+
+                r = self.analyze_if_changed(context)
                 if r:
                     context['scenes']['result_udemae'][
                         'last_update'] = context['engine']['msec']
@@ -150,6 +187,14 @@ class ResultUdemae(object):
         self.number_recoginizer = character_recoginizer.NumberRecoginizer()
         self.udemae_recoginizer = character_recoginizer.UdemaeRecoginizer()
 
+        # ウデマエと経験値 (アニメーションする)
+        self.stability = StabilityDetector(roi=(450, 310, 430, 185))
+        self._analyzed_stable = False
+
+        # 認識結果の投票。ウデマエは変化するので直近のフレームのみ
+        self.ballot = BallotBox(size=8, margin=3)
+        self._last_udemae = None
+
 
 if __name__ == "__main__":
     target = cv2.imread(sys.argv[1])
@@ -24,6 +24,11 @@ from ikalog.utils import *
 
 class Scene(object):
 
+    # Game-phase graph (see SceneScheduler)
+    phase = None
+    predecessors = []
+    successors = []
+
     # シーンクラスを単体で動作させるためのクラスメソッド
     @classmethod
     def main_func(cls):
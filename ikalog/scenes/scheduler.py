@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+from ikalog.utils import *
+
+
+# Decides which scenes are worth evaluating on the current frame.
+#
+# Scenes declare their place in the game-phase graph by class attributes:
+#
+#   phase         Name of the phase the scene detects.
+#   predecessors  Phases which may come right before the phase.
+#   successors    Phases which may come right after the phase.
+#
+# Only the scenes of the current phase and its successors are evaluated.
+# Every sweep_interval (msec), all the scenes are evaluated to recover
+# from missed transitions.
+#
+class SceneScheduler(object):
+
+    def _add_edge(self, src, dest):
+        self._successors.setdefault(src, set()).add(dest)
+        self._successors.setdefault(dest, set())
+
+    ##
+    # Register a scene.
+    # @param scene  The scene object (or class) which declares phase.
+    #
+    def register(self, scene):
+        phase = getattr(scene, 'phase', None)
+        if phase is None:
+            return
+
+        self._successors.setdefault(phase, set())
+        for src in getattr(scene, 'predecessors', []):
+            self._add_edge(src, phase)
+        for dest in getattr(scene, 'successors', []):
+            self._add_edge(phase, dest)
+
+    def get_successors(self, phase):
+        return self._successors.get(phase, set())
+
+    ##
+    # Called once per frame before evaluating scenes.
+    #
+    def new_frame(self, context):
+        msec = context['engine'].get('msec') or 0
+
+        if (self._last_sweep_msec is not None) and \
+                (msec < self._last_sweep_msec):
+            # The time has been rewinded (e.g. another file)
+            self._last_sweep_msec = None
+
+        self.sweep = (self.phase is None) or \
+            (self._last_sweep_msec is None) or \
+            (msec - self._last_sweep_msec >= self.sweep_interval)
+
+        if self.sweep:
+            self._last_sweep_msec = msec
+            self.sweeps = self.sweeps + 1
+
+    ##
+    # Check if scenes of the phase should be evaluated.
+    # @param phase  Name of the phase.
+    # @return True if the scenes should be evaluated on this frame.
+    #
+    def should_run(self, phase):
+        r = self.sweep or (phase == self.phase) or \
+            (phase in self.get_successors(self.phase))
+
+        if r:
+            self.evaluated = self.evaluated + 1
+        else:
+            self.skipped = self.skipped + 1
+        return r
+
+    ##
+    # Notify that a scene of the phase has been detected.
+    #
+    def enter(self, phase):
+        if phase == self.phase:
+            return
+
+        if (self.phase is not None) and \
+                not (phase in self.get_successors(self.phase)):
+            IkaUtils.dprint('%s: unexpected transition %s -> %s' %
+                            (self, self.phase, phase))
+
+        self.phase = phase
+
+    def reset(self):
+        self.phase = None
+        self.sweep = True
+        self._last_sweep_msec = None
+
+    def get_stats(self):
+        return {
+            'phase': self.phase,
+            'evaluated': self.evaluated,
+            'skipped': self.skipped,
+            'sweeps': self.sweeps,
+        }
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    ##
+    # Constructor
+    # @param scenes          Scenes to register.
+    # @param sweep_interval  Interval of full sweeps (msec)
+    #
+    def __init__(self, scenes=[], sweep_interval=3000):
+        self.sweep_interval = sweep_interval
+        self.evaluated = 0
+        self.skipped = 0
+        self.sweeps = 0
+        self._successors = {}
+        self.reset()
+
+        for scene in scenes:
+            self.register(scene)
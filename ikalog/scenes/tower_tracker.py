@@ -23,6 +23,7 @@ import cv2
 
 import numpy as np
 
+from ikalog.utils import *
 
 # Tracker the control tower, (or rainmaker)
 #
@@ -31,12 +32,13 @@ import numpy as np
 class TowerTracker(object):
     # 720p サイズでの値
     tower_width = 580
-    tower_left = 1280 / 2 - tower_width / 2
+    tower_left = int(1280 / 2 - tower_width / 2)
     tower_top = 78
     tower_height = 88
 
     tower_line_top = 93
     tower_line_height = 5
+    tower_sample_line = 3  # ゲージのうち位置を判定するライン
 
     def reset(self, context):
         context['game']['tower'] = {
@@ -46,29 +48,28 @@ class TowerTracker(object):
         }
 
     def tower_pos(self, context):
-        img = context['engine']['frame'][self.tower_line_top:self.tower_line_top +
-                                         self.tower_line_height, self.tower_left:self.tower_left + self.tower_width]
-        img2 = cv2.resize(img, (self.tower_width, 100))
-        img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        for i in range(2):
-            img2[20:40, :, i] = cv2.resize(
-                img_hsv[:, :, 0], (self.tower_width, 20))
-            img2[40:60, :, i] = cv2.resize(
-                img_hsv[:, :, 1], (self.tower_width, 20))
-            img2[60:80, :, i] = cv2.resize(
-                img_hsv[:, :, 2], (self.tower_width, 20))
+        tower_roi = (self.tower_left, self.tower_line_top,
+                     self.tower_width, self.tower_line_height)
+        return RoiWatcher.call_in_context(
+            context, 'tower_tracker/tower', tower_roi,
+            self._tower_pos, context, tower_roi, scale=2)
+
+    def _tower_pos(self, context, tower_roi):
+        frame_cache = FrameCache.from_context(context)
+        line = self.tower_sample_line
+        img = frame_cache.bgr(tower_roi)[line:line + 1]
 
         # ゲージのうち信頼できる部分だけでマスクする
-        img3 = np.minimum(img, self.ui_tower_mask)
+        img = np.minimum(img, self.ui_tower_mask[line:line + 1])
 
         # 白い部分にいまヤグラ/ホコがある
-        img3_hsv = cv2.cvtColor(img3, cv2.COLOR_BGR2HSV)
-        white_mask_s = cv2.inRange(img3_hsv[:, :, 1], 0, 8)
-        white_mask_v = cv2.inRange(img3_hsv[:, :, 2], 248, 256)
-        white_mask = np.minimum(white_mask_s, white_mask_v)
-        x_list = np.arange(self.tower_width)
-        tower_x = np.extract(white_mask[3, :] > 128, x_list)
-        tower_xPos = np.average(tower_x)
+        img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)[0]
+        tower_x = np.flatnonzero(
+            (img_hsv[:, 1] <= 8) & (img_hsv[:, 2] >= 248))
+        if len(tower_x) == 0:
+            return float('nan')
+
+        tower_xPos = np.mean(tower_x)
 
         # FixMe: マスクした関係が位置がずれている可能性があるので、適宜補正すべき
 
@@ -77,7 +78,7 @@ class TowerTracker(object):
 
         # あきらかにおかしい値が出たらとりあえず排除
         if xPos_pct < -120 or 120 < xPos_pct:
-            xPos_pct = Nan
+            xPos_pct = float('nan')
 
         return xPos_pct
 
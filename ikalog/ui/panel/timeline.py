@@ -20,6 +20,8 @@
 
 import wx
 
+from ikalog.utils import *
+
 
 class TimelinePanel(wx.Panel):
     margin_dots = 30
@@ -38,13 +40,13 @@ class TimelinePanel(wx.Panel):
             return
 
         # 横幅を確定する
-        l = len(self.context['game']['livesTrack'])
+        msec = self.context['game']['livesTrack'].msec
 
-        if l < 2:
+        if len(msec) < 2:
             return
 
-        t1 = self.context['game']['livesTrack'][0][0]
-        t2 = self.context['game']['livesTrack'][l - 1][0]
+        t1 = msec[0]
+        t2 = msec[-1]
         t = int((t2 - t1) / 1000 + 0.999)
         self.game_period = t
 
@@ -55,27 +57,19 @@ class TimelinePanel(wx.Panel):
         if len(context['game']['livesTrack']) < 1:
             return False
 
-        time_origin = context['game']['livesTrack'][0][0]
+        msec_list, team1_alive, team2_alive = \
+            context['game']['livesTrack'].alive_counts()
+        time_origin = int(msec_list[0])
 
         last_xPos = None
         last_yPos = None
-        for sample in context['game']['livesTrack']:
-            msec = sample[0] - time_origin
-            team1_lives = sample[1]
-            team2_lives = sample[2]
+        for msec, y1, y2 in zip(msec_list.tolist(), team1_alive.tolist(),
+                                team2_alive.tolist()):
+            msec = msec - time_origin
 
             xPos = 0 if msec == 0 else int(
                 ((msec * 1.0) / (self.game_period * 1000.0)) * self.gw)
 
-            # team1
-            y1 = 0
-            for life in team1_lives:
-                y1 = y1 + {True: 1, False: 0}[life]
-
-            y2 = 0
-            for life in team2_lives:
-                y2 = y2 + {True: 1, False: 0}[life]
-
             if y1 == 0 and y2 == 0:
                 # 全員相打ちクソワロタ
                 h1 = 0
@@ -114,15 +108,15 @@ class TimelinePanel(wx.Panel):
             #print('draw_tower: no track data 2')
             return False
 
-        time_origin = context['game']['towerTrack'][0][0]
+        time_origin = int(context['game']['towerTrack'].msec[0])
 
         self.dc.SetPen(wx.Pen(wx.RED, 3))
 
         last_xPos = None
         last_yPos = None
-        for sample in context['game']['towerTrack']:
-            msec = sample[0] - time_origin
-            vals = sample[1]
+        track = context['game']['towerTrack']
+        for msec, vals in track.samples(step=track.sample_interval):
+            msec = msec - time_origin
 
             xPos = 0 if msec == 0 else int(
                 msec * self.gw / (self.game_period * 1000.0))
@@ -20,7 +20,16 @@
 from __future__ import print_function
 
 from .ikautils import IkaUtils
-from .matcher import IkaMatcher
+from .matcher import IkaMatcher, MatcherBank
+from .clock import MediaClock, WallClock
+from .frame_cache import FrameCache
+from .stability_detector import StabilityDetector
+from .roi_watcher import RoiWatcher
+from .ballot_box import BallotBox
+from .time_series import TimeSeries, LivesTrack, TowerTrack
+from .plugin_hook import PluginHook
+from .plugin_worker import PluginWorker
+from .thread_pool import get_thread_pool
 from .glyph_recoginizer import IkaGlyphRecoginizer
 from .character_recoginizer import CharacterRecoginizer
 from .character_recoginizer.number import NumberRecoginizer
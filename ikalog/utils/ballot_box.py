@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+from collections import deque
+
+
+# Voting over the last N recognition results.
+#
+# Recognizers are not perfect on a single frame; scenes vote the results
+# of several frames, and take the leader once it is far enough ahead of
+# the runner-up. Old votes fall out of the ring buffer (and optionally
+# expire after a period), so a newer result can take over.
+#
+class BallotBox(object):
+
+    ##
+    # Cast a vote.
+    # @param candidate  The recognized value. None is an abstention.
+    # @param t          Time of the vote (for the period).
+    # @return True if the election is decided.
+    #
+    def vote(self, candidate, t=None):
+        self.expire(t)
+
+        if len(self._votes) == self.size:
+            self._remove(self._votes.popleft())
+
+        key = None if candidate is None else self.key(candidate)
+        self._votes.append((t, key))
+
+        if key is not None:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._candidates[key] = candidate
+
+        return self.is_decided()
+
+    def _remove(self, vote):
+        key = vote[1]
+        if key is None:
+            return
+
+        self._counts[key] = self._counts[key] - 1
+        if self._counts[key] == 0:
+            del self._counts[key]
+            del self._candidates[key]
+
+    ##
+    # Drop the votes older than the period.
+    # @param t  Current time.
+    #
+    def expire(self, t):
+        if (self.period is None) or (t is None):
+            return
+
+        while len(self._votes) and (self._votes[0][0] < t - self.period):
+            self._remove(self._votes.popleft())
+
+    ##
+    # Get the leader.
+    # @return (candidate, votes, margin over the runner-up)
+    #
+    def leader(self):
+        top_key, top, second = None, 0, 0
+        for key, count in self._counts.items():
+            if top < count:
+                top_key, top, second = key, count, top
+            elif second < count:
+                second = count
+
+        if top_key is None:
+            return None, 0, 0
+        return self._candidates[top_key], top, top - second
+
+    def is_decided(self):
+        candidate, votes, margin = self.leader()
+        return (votes >= self.quorum) and (margin >= self.margin)
+
+    ##
+    # Get the elected candidate.
+    # @param force  If True, the leader wins even without the margin.
+    # @return The candidate, or None if not decided.
+    #
+    def decided(self, force=False):
+        candidate, votes, margin = self.leader()
+        if votes == 0:
+            return None
+        if force or self.is_decided():
+            return candidate
+        return None
+
+    def get_counts(self):
+        return dict(self._counts)
+
+    def reset(self):
+        self._votes.clear()
+        self._counts = {}
+        self._candidates = {}
+
+    ##
+    # Constructor
+    # @param size    Number of the votes to keep.
+    # @param margin  Votes the leader needs over the runner-up.
+    # @param quorum  Votes the leader needs at least.
+    # @param period  Votes older than this are dropped. None to keep.
+    # @param key     Function to identify candidates, for those which
+    #                are not hashable (e.g. dicts).
+    #
+    def __init__(self, size=16, margin=3, quorum=1, period=None, key=None):
+        self.size = size
+        self.margin = margin
+        self.quorum = quorum
+        self.period = period
+        self.key = key or (lambda candidate: candidate)
+        self._votes = deque()
+        self.reset()
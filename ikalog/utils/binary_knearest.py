@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import cv2
+import numpy as np
+
+
+# Nearest-neighbour classifier for binary (0/255) samples.
+#
+# A drop-in replacement of cv2.ml.KNearest for models trained with
+# thresholded images. Samples are packed into bits, and distances are
+# Hamming distances computed by cv2.batchDistance(NORM_HAMMING).
+# Squared L2 distance between 0/255 vectors is 255^2 times the Hamming
+# distance, so the results are the same as cv2.ml.KNearest:
+#
+# - Neighbours are sorted by distance. Ties are resolved in the
+#   order of the training samples.
+# - The result is the most common response among the neighbours.
+#   Ties are resolved to the smaller response.
+# - Distances are reported as squared L2 distances.
+#
+class BinaryKNearest(object):
+
+    ##
+    # Check if samples can be handled by BinaryKNearest.
+    # @param samples  Samples (MxN array)
+    # @return True if all values are 0 or 255.
+    #
+    @staticmethod
+    def is_binary(samples):
+        samples = np.asarray(samples)
+        return samples.size > 0 and \
+            bool(np.all((samples == 0) | (samples == 255)))
+
+    ##
+    # Pack binary samples into bits, as stored in the model.
+    # @param samples  Samples (MxN array of 0/255)
+    # @return Packed samples (M x ceil(N/8) uint8 array)
+    #
+    @staticmethod
+    def pack(samples):
+        return np.packbits(np.asarray(samples) >= 128, axis=1)
+
+    def _pack(self, samples):
+        return self.pack(np.asarray(samples).reshape((-1, self._num_features)))
+
+    def isTrained(self):
+        return self._bits is not None
+
+    def getVarCount(self):
+        return self._num_features
+
+    ##
+    # Train the model. Same arguments as cv2.ml.KNearest.train()
+    # @param samples    Training samples (MxN array of 0/255)
+    # @param layout     Must be cv2.ml.ROW_SAMPLE
+    # @param responses  Responses of the samples
+    #
+    def train(self, samples, layout=cv2.ml.ROW_SAMPLE, responses=None):
+        assert layout == cv2.ml.ROW_SAMPLE
+        samples = np.asarray(samples)
+        assert self.is_binary(samples), 'Samples must be binary (0/255)'
+
+        return self.train_packed(self.pack(samples), samples.shape[1],
+                                 responses)
+
+    ##
+    # Train the model with packed samples.
+    # @param bits          Samples packed by pack()
+    # @param num_features  Number of features (before packing)
+    # @param responses     Responses of the samples
+    #
+    def train_packed(self, bits, num_features, responses):
+        self._num_features = num_features
+        self._bits = np.asarray(bits, np.uint8)
+        self._responses = np.asarray(responses, np.float32).reshape(-1)
+        return True
+
+    ##
+    # Find neighbours. Same interface as cv2.ml.KNearest.findNearest()
+    # @param samples  Query samples (MxN array, thresholded to 0/255)
+    # @param k        Number of neighbours
+    # @return (retval, results, neighborResponses, dists)
+    #
+    def findNearest(self, samples, k):
+        k = min(k, self._bits.shape[0])
+
+        # Keeps the training order for ties, as cv2.ml.KNearest does.
+        dists, neighbours = cv2.batchDistance(
+            self._pack(samples), self._bits, cv2.CV_32S,
+            normType=cv2.NORM_HAMMING, K=k)
+        neighbor_responses = self._responses[neighbours]
+
+        # Majority vote. Sorted responses make ties resolve to the
+        # smaller response (the first one in the row).
+        votes = np.sort(neighbor_responses, axis=1)
+        counts = (votes[:, :, np.newaxis] == votes[:, np.newaxis, :]).sum(2)
+        best = np.argmax(counts, axis=1)
+        results = votes[np.arange(votes.shape[0]), best].reshape((-1, 1))
+
+        dists = np.float32(dists) * np.float32(255 * 255)
+        return results[0, 0], results, neighbor_responses, dists
+
+    def __init__(self):
+        self._num_features = 0
+        self._bits = None
+        self._responses = None
@@ -18,38 +18,59 @@
 #  limitations under the License.
 #
 
+import threading
+
 import cv2
 import numpy as np
 import pickle
 
+from ikalog.utils import model_file
+from ikalog.utils.binary_knearest import BinaryKNearest
+from ikalog.utils.glyph_cache import GlyphCache
 from ikalog.utils.character_recoginizer import *
 
 
-class PerCharacter(object):
+# 行・列の添字 (0..1279)
+array0to1280 = np.arange(1280, dtype=np.int32)
 
-    def cut(self, img, img_hist_x):
-        chars = []
-        in_char = False
-        x_start = None
-        last_x = None
 
-        for x in range(len(img_hist_x)):
-            if in_char:
-                if img_hist_x[x] > 0:
-                    continue
-                else:
-                    char = (x_start, x - 1)
-                    if char[1] - char[0] > 2:
-                        chars.append((x_start, x - 1))
-                    in_char = False
-            else:
-                if img_hist_x[x] > 0:
-                    x_start = x
-                    in_char = True
-                else:
-                    continue
+##
+# Find runs of non-zero values in a histogram.
+# @param hist        Number of dots per column (or row).
+# @param min_length  Runs shorter than this are ignored.
+# @return List of (start, end) tuples. end is inclusive.
+#
+# A run which is still open at the end of hist is not returned
+# (same as the original per-column loop).
+#
+def find_runs(hist, min_length=1):
+    mask = np.asarray(hist) > 0
+    edges = np.diff(mask.view(np.int8), prepend=np.int8(0))
+
+    ends = np.flatnonzero(edges < 0) - 1
+    starts = np.flatnonzero(edges > 0)[:len(ends)]
+
+    valid = (ends - starts) >= (min_length - 1)
+    return list(zip(starts[valid].tolist(), ends[valid].tolist()))
 
-        return chars
+
+##
+# Find the range of non-zero values in a histogram.
+# @param hist  Number of dots per column (or row).
+# @return (first, last + 1, number of non-zero values), or None.
+#
+def find_extent(hist):
+    nonzero = np.flatnonzero(hist)
+    if len(nonzero) == 0:
+        return None
+    return int(nonzero[0]), int(nonzero[-1]) + 1, len(nonzero)
+
+
+class PerCharacter(object):
+
+    def cut(self, img, img_hist_x):
+        # 4 ドット幅未満は文字として扱わない
+        return find_runs(img_hist_x, min_length=4)
 
     def __init__(self):
         pass
@@ -85,11 +106,11 @@ class FixedWidth(object):
         pass
 
 
-array0to1280 = np.array(range(1280), dtype=np.int32)
-
-
 class CharacterRecoginizer(object):
 
+    # Max number of recognized characters to remember.
+    cache_size = 1024
+
     def FES_NAME(self, img):
         # フェスの検出の場合は黄色文字を抽出。
         yellow = cv2.inRange(img_fes_title_hsv[:, :, 0], 32 - 2, 32 + 2)
@@ -104,17 +125,44 @@ class CharacterRecoginizer(object):
         white_mask = np.minimum(white_mask_s, white_mask_v)
         return white_mask
 
-    def save_model_to_file(self, file):
-        f = open(file, 'wb')
-        pickle.dump([self.samples, self.responses], f)
-        f.close()
-
+    ##
+    # Save the model.
+    # @param file  Filename.
+    # @param meta  Additional data to save (e.g. name tables)
+    #
+    def save_model_to_file(self, file, meta=None):
+        samples = np.asarray(self.samples, np.float32)
+        arrays = {
+            'samples': samples,
+            'responses': np.asarray(self.responses, np.int32),
+        }
+        if BinaryKNearest.is_binary(samples):
+            arrays['bits'] = BinaryKNearest.pack(samples)
+
+        model_file.save_model(file, arrays, meta)
+
+    ##
+    # Load the model.
+    # @param file  Filename.
+    # @return Additional data saved with the model.
+    #
     def load_model_from_file(self, file):
+        self.sample_bits = None
+
+        if model_file.is_model_file(file):
+            arrays, meta = model_file.load_model(file)
+            self.samples = arrays['samples']
+            self.responses = arrays['responses'].tolist()
+            self.sample_bits = arrays.get('bits')
+            return meta
+
+        # Former format: pickled [samples, responses, names]
         f = open(file, 'rb')
         l = pickle.load(f)
         f.close()
         self.samples = l[0]
         self.responses = l[1]
+        return {'names': l[2]} if len(l) > 2 else {}
 
     def add_sample(self, response, img):
         img = cv2.resize(
@@ -128,6 +176,7 @@ class CharacterRecoginizer(object):
             self.responses = []
 
         self.samples = np.append(self.samples, sample, 0)
+        self.sample_bits = None
 
         try:
             response = ord('0') + int(response)
@@ -138,13 +187,25 @@ class CharacterRecoginizer(object):
         self.responses.append(response)
 
     def train(self):
-        samples = np.array(self.samples, np.float32)
-        responses = np.array(self.responses, np.float32)
-        responses = responses.reshape((responses.size, 1))
+        # Samples loaded from a model file are float32 already.
+        samples = np.asarray(self.samples, np.float32)
         responses = np.array(self.responses, np.float32)
-        self.model.train(samples, cv2.ml.ROW_SAMPLE, responses)
+
+        # Models of thresholded images are searched by Hamming distance.
+        if self.sample_bits is not None:
+            self.model = BinaryKNearest()
+            self.model.train_packed(
+                self.sample_bits, samples.shape[1], responses)
+        else:
+            if BinaryKNearest.is_binary(samples):
+                self.model = BinaryKNearest()
+            self.model.train(samples, cv2.ml.ROW_SAMPLE, responses)
         self.trained = True
 
+        # Cached results belong to the old model.
+        self.model_version = self.model_version + 1
+        self.cache.clear()
+
     def extract_characters(self, img):
         img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
         img_chars = self.WHITE_STRING(img_hsv)
@@ -154,26 +215,19 @@ class CharacterRecoginizer(object):
         # isString = np.sum(img_fes_title_mask) > img_fes_title_mask.shape[
         #    0] * img_fes_title_mask.shape[1] * 16
 
-        # 文字と判断したところを 1 にして縦に足し算
-        img_chars1 = np.sum(img_chars / 255, axis=0)  # 列毎の検出dot数
+        # 文字と判断したところを縦に数える
+        img_chars1_hist_x = np.count_nonzero(img_chars, axis=0)  # 列毎の検出dot数
 
-        array0to1280 = np.array(range(1280), dtype=np.int32)
-        #img_chars1_hist_x = np.extract(img_chars1 > 0, array0to1280[0:len(img_chars1) -1])
-
-        # FixMe: 255 px まで
-        img_chars1_hist_x = np.minimum(
-            img_chars1, array0to1280[0:len(img_chars1)])
+        # FixMe: 以前の実装に合わせて左端の列は常に空とみなす
+        img_chars1_hist_x[0] = 0
 
         char_tuples = self.x_cutter.cut(img_chars, img_chars1_hist_x)
 
         characters = []
-        img_chars = np.sum(img_chars[:, :], axis=1)  # 行毎の検出dot数
-        img_char_extract_y = np.extract(
-            img_chars > 0, array0to1280[0:len(img_chars)])
+        extent_y = find_extent(np.count_nonzero(img_chars, axis=1))  # 行毎
 
-        if len(img_char_extract_y) > 1:
-            y1 = np.amin(img_char_extract_y)
-            y2 = np.amax(img_char_extract_y) + 1
+        if (extent_y is not None) and (extent_y[2] > 1):
+            y1, y2 = extent_y[0:2]
 
             if (y2 - y1) > 2:  # 最低高さ4ドットなければサンプルとして認識しない
                 for t in char_tuples:
@@ -195,10 +249,6 @@ class CharacterRecoginizer(object):
                 if (img.shape[1] < char_width[0]) or (char_width[1] < img.shape[1]):
                     continue
 
-            # Scale the character to match with KNN trained dataset.
-            img_scaled = cv2.resize(
-                img, (self.sample_width, self.sample_height), interpolation=cv2.INTER_NEAREST)
-
             samples.append(img)
 
         if num_digits is not None:
@@ -207,70 +257,109 @@ class CharacterRecoginizer(object):
 
         return samples
 
-    def match1(self, img):
-        if (img.shape[0] != self.sample_width) or (img.shape[1] != self.sample_height):
-            img = cv2.resize(
-                img, (self.sample_width, self.sample_height), interpolation=cv2.INTER_NEAREST)
-
+    ##
+    # Threshold the character image.
+    # @param img  Image of a character.
+    # @return Binary image of the character.
+    #
+    def binarize(self, img):
         if (len(img.shape) > 2):
             img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
         ret, img = cv2.threshold(img, 200, 255, cv2.THRESH_BINARY)
+        return img
+
+    def _normalize_binary(self, img):
+        if (img.shape[0] != self.sample_width) or (img.shape[1] != self.sample_height):
+            img = cv2.resize(
+                img, (self.sample_width, self.sample_height), interpolation=cv2.INTER_NEAREST)
 
         raito = np.sum(
             img) / (img.shape[0] * img.shape[1]) if np.sum(img) != 0 else 0.0
 
         if raito < 0.1:
             # ほぼ真っ黒
-            return 0
+            return None
 
-        sample = img.reshape((1, img.shape[0] * img.shape[1]))
-        sample = np.array(sample, np.float32)
+        # 学習データを集めたいときなど
+        if 0:
+            import time
+            cv2.imwrite('training/numbers/%s.png' % time.time(), img)
 
+        sample = img.reshape((1, img.shape[0] * img.shape[1]))
+        return np.array(sample, np.float32)
+
+    ##
+    # Normalize the character image into a sample vector for KNN.
+    # @param img  Image of a character.
+    # @return The sample (1xN float32 array), or None if it's almost blank.
+    #
+    def normalize_sample(self, img):
+        # Nearest-neighbor resize commutes with per-pixel conversions,
+        # so threshold first and resize the binary image.
+        return self._normalize_binary(self.binarize(img))
+
+    ##
+    # Look up the recognition cache. The key is the normalized sample, so
+    # characters which differ only by noise lost in normalization (e.g.
+    # re-encoded frames) share the result.
+    # @param img  Image of a character.
+    # @return (sample, key, response). response is None if not cached.
+    #         Almost blank characters have no sample, and response 0.
+    #
+    def lookup(self, img):
+        sample = self.normalize_sample(img)
+        if sample is None:
+            return None, None, 0
+
+        key = GlyphCache.key(sample, self.model_version)
+        return sample, key, self.cache.get(key)
+
+    ##
+    # Run KNN on the samples.
+    # @param samples  Stacked samples (MxN float32 array)
+    # @return Responses of the samples (M integers)
+    #
+    def find_nearest(self, samples):
         k = 3
 
-        retval, results, neigh_resp, dists = self.model.findNearest(sample, k)
+        retval, results, neigh_resp, dists = self.model.findNearest(samples, k)
+        return [int(r) for r in results.ravel()]
 
-        # 学習データを集めたいときなど
-        if 0:
-            import time
-            cv2.imwrite('training/numbers/%s.%s.png' %
-                        (retval, time.time()), img)
+    def match1(self, img):
+        sample, key, response = self.lookup(img)
+        if response is not None:
+            return response
+
+        response = self.find_nearest(sample)[0]
+        self.cache.put(key, response)
+        return response
 
-        d = int(results.ravel())
-        return d
+    def get_cache_stats(self):
+        return self.cache.get_stats()
 
     def match(self, img, num_digits=None, char_width=None, char_height=None):
         if not self.trained:
             return None
 
-        samples = self.find_samples(
+        batch = CharacterBatch(self)
+        batch.add(
             img,
             num_digits=num_digits,
             char_width=char_width,
             char_height=char_height,
         )
-
-        s = ''
-        for sample in samples:
-            c = chr(self.match1(sample))
-            s = s + c
-
-        return s
+        return batch.match()[0]
 
     def match_digits(self, img, num_digits=None, char_width=None, char_height=None):
-        try:
-            return int(self.match(img, num_digits=num_digits,
-                                  char_width=char_width, char_height=char_height))
-        except ValueError:
-            return None
+        return CharacterBatch.to_int(
+            self.match(img, num_digits=num_digits,
+                       char_width=char_width, char_height=char_height))
 
     def match_float(self, img, num_digits=None, char_width=None, char_height=None):
-        try:
-            return float(self.match(img, num_digits=num_digits,
-                                    char_width=char_width, char_height=char_height))
-        except ValueError:
-            return None
+        return CharacterBatch.to_float(
+            self.match(img, num_digits=num_digits,
+                       char_width=char_width, char_height=char_height))
 
     def __init__(self):
         self.trained = False
@@ -284,4 +373,95 @@ class CharacterRecoginizer(object):
 
         self.samples = None  # np.empty((0, 21 * 14))
         self.responses = []
+        self.sample_bits = None
         self.model = cv2.ml.KNearest_create()
+
+        self.model_version = 0
+        self.cache = GlyphCache(max_size=self.cache_size)
+
+
+# Recognize characters in several images at once.
+#
+# add() collects normalized samples from each image, then match() runs
+# one findNearest() over all the samples and splits the results by the
+# images. Results are the same as CharacterRecoginizer.match() on each
+# image.
+#
+class CharacterBatch(object):
+
+    @staticmethod
+    def to_int(s):
+        try:
+            return int(s)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def to_float(s):
+        try:
+            return float(s)
+        except ValueError:
+            return None
+
+    ##
+    # Add an image.
+    # @param img  The image. Same arguments as CharacterRecoginizer.match()
+    # @return Index of the result in match()
+    #
+    # May be called from several threads at once.
+    #
+    def add(self, img, num_digits=None, char_width=None, char_height=None):
+        samples = self.recoginizer.find_samples(
+            img,
+            num_digits=num_digits,
+            char_width=char_width,
+            char_height=char_height,
+        )
+
+        # Each character is [key, sample, response]. Cached characters
+        # are not searched again.
+        request = []
+        for sample in samples:
+            normalized, key, response = self.recoginizer.lookup(sample)
+            request.append([key, normalized, response])
+
+        with self._lock:
+            self._requests.append(request)
+            return len(self._requests) - 1
+
+    ##
+    # Recognize the images.
+    # @return List of strings, in the order of add() calls.
+    #
+    def match(self):
+        if not self.recoginizer.trained:
+            return [None] * len(self._requests)
+
+        pending = [c for request in self._requests
+                   for c in request if c[2] is None]
+
+        if len(pending) > 0:
+            responses = self.recoginizer.find_nearest(
+                np.vstack([c[1] for c in pending]))
+            for c, response in zip(pending, responses):
+                c[2] = response
+                self.recoginizer.cache.put(c[0], response)
+
+        results = []
+        for request in self._requests:
+            s = ''
+            for c in request:
+                s = s + chr(c[2])
+            results.append(s)
+        return results
+
+    def match_digits(self):
+        return [self.to_int(s) for s in self.match()]
+
+    def __len__(self):
+        return len(self._requests)
+
+    def __init__(self, recoginizer):
+        self.recoginizer = recoginizer
+        self._requests = []
+        self._lock = threading.Lock()
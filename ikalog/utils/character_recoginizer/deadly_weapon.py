@@ -41,16 +41,12 @@ class DeadlyWeaponRecoginizer(CharacterRecoginizer):
     def _normalize(self, img):
         img_weapon_b = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         # cv2.imshow('hoge', img)
-        array0to1280 = np.array(range(1280), dtype=np.int32)
-        img_chars = np.sum(img_weapon_b[:, :], axis=1)  # 行毎の検出dot数
-        img_char_extract_y = np.extract(
-            img_chars > 0, array0to1280[0:len(img_chars)])
+        extent_y = find_extent(np.count_nonzero(img_weapon_b, axis=1))  # 行毎
 
-        if len(img_char_extract_y) < 1:
+        if extent_y is None:
             return None
 
-        y1 = np.amin(img_char_extract_y)
-        y2 = np.amax(img_char_extract_y) + 1
+        y1, y2 = extent_y[0:2]
 
         if (y2 - y1) < 2:
             return None
@@ -64,16 +60,12 @@ class DeadlyWeaponRecoginizer(CharacterRecoginizer):
 
         # 横方向を crop
 
-        array0to1280 = np.array(range(1280), dtype=np.int32)
-        img_chars = np.sum(img_weapon_b32[:, :], axis=0)
-        img_char_extract_x = np.extract(
-            img_chars > 0, array0to1280[0:len(img_chars)])
+        extent_x = find_extent(np.count_nonzero(img_weapon_b32, axis=0))  # 列毎
 
-        if len(img_char_extract_x) < 1:
+        if extent_x is None:
             return None
 
-        x1 = np.amin(img_char_extract_x)
-        x2 = np.amax(img_char_extract_x) + 1
+        x1, x2 = extent_x[0:2]
 
         if (x2 - x1 > 160):
             x2 = x1 + 160
@@ -86,6 +78,9 @@ class DeadlyWeaponRecoginizer(CharacterRecoginizer):
         return img_weapon_final
 
     def match(self, img):
+        # The banner stays on the screen while the player is dead.
+        # match1() caches the result by the normalized sample, so noise
+        # in the frames doesn't make it recognize the banner again.
         try:
             img_normalized = self._normalize(img)
             r = super(DeadlyWeaponRecoginizer, self).match1(img_normalized)
@@ -93,8 +88,7 @@ class DeadlyWeaponRecoginizer(CharacterRecoginizer):
             print(img.shape)
             return 'Error'
 
-        name = self.id2name(r - ord('0'))
-        return name
+        return self.id2name(r - ord('0'))
 
     def _find_png_files(self, dir):
         list = []
@@ -107,17 +101,12 @@ class DeadlyWeaponRecoginizer(CharacterRecoginizer):
 
     # 保存項目追加のために save/load をオーバーライド
     def save_model_to_file(self, file):
-        f = open(file, 'wb')
-        pickle.dump([self.samples, self.responses, self.name2id_table], f)
-        f.close()
+        super(DeadlyWeaponRecoginizer, self).save_model_to_file(
+            file, meta={'names': self.name2id_table})
 
     def load_model_from_file(self, file):
-        f = open(file, 'rb')
-        l = pickle.load(f)
-        f.close()
-        self.samples = l[0]
-        self.responses = l[1]
-        self.name2id_table = l[2]
+        meta = super(DeadlyWeaponRecoginizer, self).load_model_from_file(file)
+        self.name2id_table = meta['names']
 
     def __new__(cls, *args, **kwargs):
 
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+import time
+
+
+# Clocks used by IkaEngine to measure intervals between scenes.
+#
+# time(context) returns the current time in seconds.
+#
+
+# Media time: the timestamp of the current frame.
+# Recorded files give the same results regardless of the decoding speed.
+class MediaClock(object):
+
+    def time(self, context):
+        msec = context['engine'].get('msec')
+        if msec is None:
+            return 0.0
+        return msec / 1000.0
+
+
+# Wall-clock time.
+class WallClock(object):
+
+    def time(self, context):
+        return time.time()
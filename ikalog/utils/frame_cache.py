@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+import cv2
+
+
+# Per-frame cache of color space conversions.
+#
+# Scenes and matchers often convert the same region of a frame to
+# grayscale or HSV. FrameCache converts each region once, and converts
+# the whole frame once if many regions of the frame are requested.
+#
+# ROIs are given as (left, top, width, height). Returned images are
+# read-only; copy() them before modifying.
+#
+class FrameCache(object):
+
+    # If the total area of ROIs converted to a color space exceeds this
+    # ratio of the frame, convert the whole frame instead.
+    full_frame_ratio = 0.3
+
+    _conversions = {
+        'gray': cv2.COLOR_BGR2GRAY,
+        'hsv': cv2.COLOR_BGR2HSV,
+    }
+
+    def is_color(self):
+        return len(self.frame.shape) > 2
+
+    def _crop(self, img, roi):
+        if roi is None:
+            return img
+        left, top, width, height = roi
+        return img[top:top + height, left:left + width]
+
+    def _convert(self, kind, roi):
+        full = self._full.get(kind)
+        if full is not None:
+            self.hits = self.hits + 1
+            return self._crop(full, roi)
+
+        img = self._cache.get((kind, roi))
+        if img is not None:
+            self.hits = self.hits + 1
+            return img
+
+        self.misses = self.misses + 1
+
+        if roi is None:
+            area = self.frame.shape[0] * self.frame.shape[1]
+        else:
+            area = roi[2] * roi[3]
+        self._area[kind] = self._area.get(kind, 0) + area
+
+        frame_area = self.frame.shape[0] * self.frame.shape[1]
+        if self._area[kind] > frame_area * self.full_frame_ratio:
+            full = cv2.cvtColor(self.frame, self._conversions[kind])
+            full.flags.writeable = False
+            self._full[kind] = full
+            return self._crop(full, roi)
+
+        img = cv2.cvtColor(self._crop(self.frame, roi),
+                           self._conversions[kind])
+        img.flags.writeable = False
+        self._cache[(kind, roi)] = img
+        return img
+
+    ##
+    # Get the BGR image of the region. This is a view of the frame.
+    # @param roi  (left, top, width, height), or None for the whole frame.
+    #
+    def bgr(self, roi=None):
+        return self._crop(self.frame, roi)
+
+    ##
+    # Get the grayscale image of the region.
+    # @param roi  (left, top, width, height), or None for the whole frame.
+    #
+    def gray(self, roi=None):
+        if not self.is_color():
+            return self._crop(self.frame, roi)
+        return self._convert('gray', roi)
+
+    ##
+    # Get the HSV image of the region.
+    # @param roi  (left, top, width, height), or None for the whole frame.
+    #
+    def hsv(self, roi=None):
+        assert self.is_color()
+        return self._convert('hsv', roi)
+
+    def get_stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'full_frame': sorted(self._full.keys()),
+        }
+
+    ##
+    # Get the FrameCache of the current frame in the context.
+    # A new FrameCache is created if the frame has been replaced.
+    #
+    @classmethod
+    def from_context(cls, context):
+        engine = context['engine']
+        frame = engine['frame']
+        cache = engine.get('frame_cache')
+        if (cache is None) or (cache.frame is not frame):
+            cache = cls(frame)
+            engine['frame_cache'] = cache
+        return cache
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+        self._full = {}
+        self._area = {}
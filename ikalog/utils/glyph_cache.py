@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import collections
+import hashlib
+import threading
+
+
+# LRU cache of glyph recognition results.
+#
+# Keys are content hashes of images (see key()), so the same glyph on
+# consecutive frames is recognized only once. Recognizers must include
+# their model version in the key, so that results of an old model are
+# never returned after re-training.
+#
+# The cache may be shared by threads (see ResultDetail.analyze()).
+#
+class GlyphCache(object):
+
+    ##
+    # Make a key for the image.
+    # @param img      The image (numpy array)
+    # @param version  Version of the model.
+    # @return The key.
+    #
+    @staticmethod
+    def key(img, version=0):
+        h = hashlib.blake2b(img.tobytes(), digest_size=16)
+        return (version, img.shape, img.dtype.str, h.digest())
+
+    ##
+    # Get the cached result.
+    # @param key      The key.
+    # @param default  Returned if not cached.
+    #
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses = self.misses + 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits = self.hits + 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    ##
+    # Constructor
+    # @param max_size  Max number of results to keep.
+    #
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
@@ -24,11 +24,17 @@ import numpy as np
 import os
 import pickle
 
+from ikalog.utils import model_file
+from ikalog.utils.glyph_cache import GlyphCache
+
 
 class IkaGlyphRecoginizer(object):
     # Models
     groups = []
 
+    # Max number of recognized images to remember.
+    cache_size = 256
+
     # Normalize the image. (for weapons)
     #
     # - Crop the image
@@ -55,7 +61,8 @@ class IkaGlyphRecoginizer(object):
         img_laplacian_abs = cv2.convertScaleAbs(img_laplacian)
         img_laplacian_gray = cv2.cvtColor(img_laplacian_abs, cv2.COLOR_BGR2GRAY)
         ret, img_laplacian_mask = cv2.threshold(img_laplacian_gray,laplacian_threshold,255,0)
-        img_contours, contours, hierarchy = cv2.findContours( img_laplacian_mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE )
+        # OpenCV 3 returns (image, contours, hierarchy), OpenCV 4 (contours, hierarchy)
+        contours, hierarchy = cv2.findContours( img_laplacian_mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE )[-2:]
         out_img = np.zeros(( h, w, 3), np.uint8)
         cv2.drawContours( out_img, contours, -1, (255,255,255), cv2.FILLED ) 
         img_mask = out_img.copy()
@@ -66,7 +73,7 @@ class IkaGlyphRecoginizer(object):
             cv2.imshow('orig', cv2.resize(img, (160,160)))
             cv2.imshow('laplacian_abs', cv2.resize(img_laplacian_abs, (160,160)))
             cv2.imshow('laplacian_gray', cv2.resize(img_laplacian_gray, (160,160)))
-            cv2.imshow('contours', cv2.resize(img_contours, (160,160)))
+            cv2.imshow('contours', cv2.resize(img_mask, (160,160)))
             cv2.imshow('out', cv2.resize(out_img, (160,160)))
             cv2.moveWindow('orig',80,20)
             cv2.moveWindow('laplacian_abs',80,220)
@@ -127,17 +134,57 @@ class IkaGlyphRecoginizer(object):
         if not self.trained:
             return None, None
 
+        return self.match_batch([img])[0]
+
+    # Normalize the image, and look up the cache. The key is the
+    # normalized 8x8 sample, so the same icon with noise that the
+    # normalization removes (e.g. a re-encoded frame) hits the cache.
+    # Thread safe, so that images can be prepared in parallel.
+    #
+    # @param img    the source image
+    # @return [key, sample, result] for match_prepared()
+    def prepare(self, img):
         param, dimg = self.analyze_image(img, debug=True)
         sample = param['hist']
-        sample_f = np.array(sample, np.float32).reshape((1, len(sample) * len(sample[0])))
+        sample = np.array(sample, np.float32).reshape(
+            (1, len(sample) * len(sample[0])))
+
+        key = GlyphCache.key(sample, self.model_version)
+        return [key, sample, self.cache.get(key)]
+
+    # Recognize prepared images with one findNearest() call.
+    #
+    # @param prepared   List of prepare() results
+    # @return List of (name, distance)
+    def match_prepared(self, prepared):
+        if not self.trained:
+            return [(None, None)] * len(prepared)
+
+        pending = [p for p in prepared if p[2] is None]
+        if len(pending) > 0:
+            k = 3
+            retval, results, neigh_resp, dists = self.model.findNearest(
+                np.vstack([p[1] for p in pending]), k)
+
+            for i, p in enumerate(pending):
+                id = int(results[i][0])
+                p[2] = (self.id2name(id), dists[i][0])
+                self.cache.put(p[0], p[2])
 
-        k = 3
-        retval, results, neigh_resp, dists = self.model.findNearest(
-            sample_f, k)
+        return [p[2] for p in prepared]
 
-        id = int(results.ravel())
-        name = self.id2name(id)
-        return name, dists[0][0]
+    # Recognize several images with one findNearest() call.
+    #
+    # @param imgs   List of source images
+    # @return List of (name, distance)
+    def match_batch(self, imgs):
+        if not self.trained:
+            return [(None, None)] * len(imgs)
+
+        return self.match_prepared([self.prepare(img) for img in imgs])
+
+    def get_cache_stats(self):
+        return self.cache.get_stats()
 
     def add_sample1(self, name, sample):
         id = self.name2id(name)
@@ -162,7 +209,7 @@ class IkaGlyphRecoginizer(object):
 
     def knn_train(self):
         # 終わったら
-        samples = np.array(self.samples, np.float32)
+        samples = np.asarray(self.samples, np.float32)
         responses = np.array(self.responses, np.float32)
         responses = responses.reshape((responses.size, 1))
 
@@ -171,6 +218,10 @@ class IkaGlyphRecoginizer(object):
         print('done model.train')
         self.trained = True
 
+        # Cached results belong to the old model.
+        self.model_version = self.model_version + 1
+        self.cache.clear()
+
     def learn_image_group(self, name=None, dir=None):
         group_info = {
             'name': name,
@@ -204,11 +255,22 @@ class IkaGlyphRecoginizer(object):
         return group_info
 
     def save_model_to_file(self, file):
-        f = open(file, 'wb')
-        pickle.dump([self.samples, self.responses, self.weapon_names], f)
-        f.close()
+        model_file.save_model(file, {
+            'samples': np.asarray(self.samples, np.float32),
+            'responses': np.asarray(self.responses, np.int32),
+        }, {
+            'names': self.weapon_names,
+        })
 
     def load_model_from_file(self, file):
+        if model_file.is_model_file(file):
+            arrays, meta = model_file.load_model(file)
+            self.samples = arrays['samples']
+            self.responses = arrays['responses'].tolist()
+            self.weapon_names = meta['names']
+            return
+
+        # Former format: pickled [samples, responses, weapon_names]
         f = open(file, 'rb')
         l = pickle.load(f)
         f.close()
@@ -217,6 +279,8 @@ class IkaGlyphRecoginizer(object):
         self.weapon_names = l[2]
 
     def __init__(self):
+        self.model_version = 0
+        self.cache = GlyphCache(max_size=self.cache_size)
         self.weapon_names = []
         self.knn_reset()
         self.groups = []
@@ -20,60 +20,103 @@
 
 import traceback
 from ikalog.utils.ikautils import *
+from ikalog.utils.frame_cache import FrameCache
 
 
-class MM_WHITE(object):
+# Pixels with values >= 171 are "white" for IkaMatcher (the top bin of
+# 3-bin histograms over [0, 256)).
+MATCH_LEVEL = 171
 
-    def evaluate_gray_image(self, img_gray):
-        assert(len(img_gray.shape) == 2)
 
-        vis_min = min(self.visibility_range)
-        vis_max = max(self.visibility_range)
+##
+# Pack pixels of the 8-bit image into bits. A bit is set if the pixel is
+# white (>= MATCH_LEVEL).
+#
+def pack_bits(img):
+    return np.packbits(img.reshape(-1) >= MATCH_LEVEL)
 
-        assert(vis_min >= 0 and vis_max <= 256)
 
-        img_match_v = cv2.inRange(img_gray, vis_min, vis_max)
-        return img_match_v
+_popcount_table = np.array([bin(i).count('1') for i in range(256)],
+                           dtype=np.uint8)
 
-    def evaluate(self, img_bgr=None, img_gray=None):
-        if (img_bgr is None):
-            return self.evaluate_gray_image(img_gray)
 
-        # カラー画像から白い部分だけ抜き出した白黒画像を作る
+##
+# Count set bits in the packed array.
+#
+def popcount(bits):
+    if hasattr(np, 'bitwise_count'):
+        return int(np.sum(np.bitwise_count(bits)))
+    return int(np.sum(_popcount_table[bits]))
+
+
+# Color filters.
+#
+# Each filter is compiled at construction into lower/upper bounds for a
+# single cv2.inRange() call. evaluate() returns a binary image (0 or 255).
+# If out is given, the result is written into it (must be a uint8 image
+# of the same size).
+#
+
+def _check_range(r, limit=256):
+    lower = min(r)
+    upper = max(r)
+    assert(lower >= 0 and upper <= limit)
+    return lower, upper
+
+
+class MM_WHITE(object):
+
+    # evaluate() uses img_hsv if given
+    needs_hsv = True
 
-        assert(len(img_bgr.shape) == 3)
-        assert(img_bgr.shape[2] == 3)
+    def _compile(self):
+        sat_min, sat_max = _check_range(self.sat_range)
+        vis_min, vis_max = _check_range(self.visibility_range)
 
-        sat_min = min(self.sat_range)
-        sat_max = max(self.sat_range)
-        vis_min = min(self.visibility_range)
-        vis_max = max(self.visibility_range)
+        self._gray_lower = vis_min
+        self._gray_upper = vis_max
+        self._hsv_lower = (0, sat_min, vis_min)
+        self._hsv_upper = (255, sat_max, vis_max)
 
-        assert(sat_min >= 0 and sat_max <= 256)
-        assert(vis_min >= 0 and vis_max <= 256)
+    def evaluate_gray_image(self, img_gray, out=None):
+        assert(len(img_gray.shape) == 2)
+        return cv2.inRange(img_gray, self._gray_lower, self._gray_upper, out)
+
+    def evaluate(self, img_bgr=None, img_gray=None, img_hsv=None, out=None):
+        if (img_bgr is None) and (img_hsv is None):
+            return self.evaluate_gray_image(img_gray, out=out)
+
+        # カラー画像から白い部分だけ抜き出した白黒画像を作る
+
+        if img_hsv is None:
+            assert(len(img_bgr.shape) == 3)
+            assert(img_bgr.shape[2] == 3)
+            img_hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
 
-        img_hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
-        img_match_s = cv2.inRange(img_hsv[:, :, 1], sat_min, sat_max)
-        img_match_v = cv2.inRange(img_hsv[:, :, 2], vis_min, vis_max)
-        img_match = np.minimum(img_match_s, img_match_v)
-        return img_match
+        return cv2.inRange(img_hsv, self._hsv_lower, self._hsv_upper, out)
 
     def __init__(self, sat=(0, 32), visibility=(230, 256)):
         self.sat_range = sat  # assume tuple
         self.visibility_range = visibility  # assume tuple
+        self._compile()
 
 
 class MM_NOT_WHITE(MM_WHITE):
 
-    def evaluate(self, img_bgr=None, img_gray=None):
+    def evaluate(self, img_bgr=None, img_gray=None, img_hsv=None, out=None):
         img_result = super(MM_NOT_WHITE, self).evaluate(
-            img_bgr=img_bgr, img_gray=img_gray)
-        return 255 - img_result
+            img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv, out=out)
+        return cv2.bitwise_not(img_result, img_result)
 
 
 class MM_BLACK(object):
 
-    def evaluate(self, img_bgr=None, img_gray=None):
+    needs_hsv = False
+
+    def _compile(self):
+        self._lower, self._upper = _check_range(self.visibility_range)
+
+    def evaluate(self, img_bgr=None, img_gray=None, img_hsv=None, out=None):
         assert((img_bgr is not None) or (img_gray is not None))
 
         if (img_gray is None):
@@ -81,15 +124,11 @@ class MM_BLACK(object):
             assert(img_bgr.shape[2] == 3)
             img_gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
 
-        vis_min = min(self.visibility_range)
-        vis_max = max(self.visibility_range)
-
-        assert(vis_min >= 0 and vis_max <= 256)
-        img_match_v = cv2.inRange(img_gray[:, :], vis_min, vis_max)
-        return img_match_v
+        return cv2.inRange(img_gray, self._lower, self._upper, out)
 
     def __init__(self, visibility=(0, 32)):
         self.visibility_range = visibility
+        self._compile()
 
 
 class MM_DARK(MM_BLACK):
@@ -100,69 +139,93 @@ class MM_DARK(MM_BLACK):
 
 class MM_NOT_BLACK(MM_BLACK):
 
-    def evaluate(self, img_bgr=None, img_gray=None):
+    def evaluate(self, img_bgr=None, img_gray=None, img_hsv=None, out=None):
         img_result = super(MM_NOT_BLACK, self).evaluate(
-            img_bgr=img_bgr, img_gray=img_gray)
-        return 255 - img_result
+            img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv, out=out)
+        return cv2.bitwise_not(img_result, img_result)
 
 # MM_COLOR_BY_HUE:
+#
+# The hue range may wrap around 0/180. For example hue=(-10, 10) or
+# hue=(170, 190) matches hues 170..179 and 0..10.
 
 
 class MM_COLOR_BY_HUE(object):
 
-    def _hue_range_to_list(self, r):
-        # FIXME: 0, 180をまたぐ場合にふたつに分ける
-        return [r]
+    needs_hsv = True
 
-    def evaluate(self, img_bgr=None, img_gray=None):
-        assert(img_bgr is not None)
-        assert(len(img_bgr.shape) >= 3)
-        assert(img_bgr.shape[2] == 3)
-        assert(len(self._hue_range_to_list(self.hue_range)) == 1)  # FIXME
+    def _compile(self):
+        hue_min = min(self.hue_range)
+        hue_max = max(self.hue_range)
+        vis_min, vis_max = _check_range(self.visibility_range)
 
-        img_hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+        self._lut = None
+        if (hue_min < 0) or (hue_max > 180):
+            # Rotate hues by a LUT so that the range starts at 0.
+            assert(hue_max - hue_min < 180)
+            hue_start = hue_min % 180
 
-        vis_min = min(self.visibility_range)
-        vis_max = max(self.visibility_range)
+            lut = np.empty((256, 1, 3), dtype=np.uint8)
+            lut[:, 0, 0] = 255  # Not a hue
+            lut[0:180, 0, 0] = (np.arange(180) - hue_start) % 180
+            lut[:, 0, 1] = np.arange(256)
+            lut[:, 0, 2] = np.arange(256)
+            self._lut = lut
 
-        assert(vis_min >= 0)
-        assert(vis_max <= 256)
+            hue_min, hue_max = 0, hue_max - hue_min
 
-        for hue_range in self._hue_range_to_list(self.hue_range):
-            hue_min = min(self.hue_range)
-            hue_max = max(self.hue_range)
+        assert(hue_min >= 0)
+        assert(hue_max <= 256)
+
+        self._hsv_lower = (hue_min, 0, vis_min)
+        self._hsv_upper = (hue_max, 255, vis_max)
+
+    def evaluate(self, img_bgr=None, img_gray=None, img_hsv=None, out=None):
+        if img_hsv is None:
+            assert(img_bgr is not None)
+            assert(len(img_bgr.shape) >= 3)
+            assert(img_bgr.shape[2] == 3)
+            img_hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
 
-            assert(hue_min >= 0)
-            assert(hue_max <= 256)
+        if self._lut is not None:
+            img_hsv = cv2.LUT(img_hsv, self._lut)
 
-            #print('vis_min %d vis_max %d hue_min %d hue_max %d' % (vis_min, vis_max, hue_min, hue_max))
-            img_match_h = cv2.inRange(img_hsv[:, :, 0], hue_min, hue_max)
-            img_match_v = cv2.inRange(img_hsv[:, :, 2], vis_min, vis_max)
-            img_match = np.minimum(img_match_h, img_match_v)
-        return img_match
+        return cv2.inRange(img_hsv, self._hsv_lower, self._hsv_upper, out)
 
     def __init__(self, hue=None, visibility=None):
         self.hue_range = hue  # assume tuple
         self.visibility_range = visibility  # assume tuple
+        self._compile()
 
 
 class MM_NOT_COLOR_BY_HUE(MM_COLOR_BY_HUE):
 
-    def evaluate(self, img_bgr=None, img_gray=None):
+    def evaluate(self, img_bgr=None, img_gray=None, img_hsv=None, out=None):
         img_result = super(MM_NOT_COLOR_BY_HUE, self).evaluate(
-            img_bgr=img_bgr, img_gray=img_gray)
-        return 255 - img_result
+            img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv, out=out)
+        return cv2.bitwise_not(img_result, img_result)
 
 
 class IkaMatcher(object):
 
-        # Match the image.
-        # @param self   The object.
-        # @param img    Frame data.
-        # @param debug  If true, show debug information.
-    def match_score(self, img, debug=None):
-        if debug is None:
-            debug = self.debug
+    def _needs_hsv(self, method):
+        return getattr(method, 'needs_hsv', False)
+
+    def _prepare_images(self, img, needs_hsv=None):
+        if isinstance(img, FrameCache):
+            # Conversions are shared with other matchers on the frame
+            roi = (self.left, self.top, self.width, self.height)
+            if not img.is_color():
+                return None, img.gray(roi), None
+
+            if needs_hsv is None:
+                needs_hsv = self._needs_hsv(self.bg_method) or \
+                    self._needs_hsv(self.fg_method)
+
+            img_hsv = None
+            if needs_hsv:
+                img_hsv = img.hsv(roi)
+            return img.bgr(roi), img.gray(roi), img_hsv
 
         # Crop
         cropped = (img.shape[0] == self.height) and (
@@ -173,41 +236,46 @@ class IkaMatcher(object):
 
         # Grayscale
         if len(img.shape) > 2:
-            img_bgr = img
-            img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        else:
-            img_bgr = None
-            img_gray = img
+            return img, cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), None
+
+        return None, img, None
+
+        # Match the image.
+        # @param self   The object.
+        # @param img    Frame data, or FrameCache of the frame.
+        # @param debug  If true, show debug information.
+    def match_score(self, img, debug=None):
+        if debug is None:
+            debug = self.debug
+
+        img_bgr, img_gray, img_hsv = self._prepare_images(img)
 
         # Check background score
         try:
-            img_bg = 255 - \
-                self.bg_method.evaluate(img_bgr=img_bgr, img_gray=img_gray)
-            img_bg = np.minimum(img_bg, self.mask_img)
+            img_bg = 255 - self.bg_method.evaluate(
+                img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv)
         except:
             IkaUtils.dprint('%s (%s): bg_method %s caused a exception.' % (
                 self, self.label, self.bg_method.__class__.__name__))
             IkaUtils.dprint(traceback.format_exc())
 
-        img_bg = np.minimum(img_bg, self.mask_img)
-
-        orig_hist = cv2.calcHist([img_bg], [0], None, [3], [0, 256])
-        orig_raito = (orig_hist[2] / np.sum(orig_hist))[0]
+        # count(min(img_bg, mask))
+        orig_count = popcount(pack_bits(img_bg) & self._mask_bits)
+        orig_raito = np.float32(orig_count) / self._num_pixels
 
         if orig_raito > self.orig_threshold:
             raito = 0.0
             match = False
-            img_added = None
             img_fg = None
         else:
             # フォアグラウンド色の一致を調べる
             img_fg = self.fg_method.evaluate(
-                img_bgr=img_bgr, img_gray=img_gray)
-            img_added = np.maximum(img_fg, self.mask_img)
-
-            hist = cv2.calcHist([img_added], [0], None, [3], [0, 256])
+                img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv)
 
-            raito = (hist[2] / np.sum(hist))[0]
+            # count(max(img_fg, mask))
+            fg_count = self._mask_count + \
+                popcount(pack_bits(img_fg) & self._mask_bits_inv)
+            raito = np.float32(fg_count) / self._num_pixels
             match = (raito > self.threshold)
 
         if debug:  # and (match > threshold):
@@ -217,11 +285,11 @@ class IkaMatcher(object):
             # FIXME: 一枚の画像として表示する
             cv2.imshow('mask: %s' % label, self.mask_img)
             cv2.imshow('img_gray: %s' % label, img_gray)
-            cv2.imshow('img_bg: %s' % label, img_bg)
+            cv2.imshow('img_bg: %s' % label, np.minimum(img_bg, self.mask_img))
             if img_fg is not None:
                 cv2.imshow('img_fg: %s' % label, img_fg)
-            if img_added is not None:
-                cv2.imshow('result: %s' % label, img_added)
+                cv2.imshow('result: %s' % label,
+                           np.maximum(img_fg, self.mask_img))
         return (match, raito, orig_raito)
 
     def match(self, img, debug=None):
@@ -281,3 +349,178 @@ class IkaMatcher(object):
             self.mask_img = img
         else:
             self.mask_img = img[top: top + height, left: left + width]
+
+        # Compile the mask into bits
+        self._mask_bits = pack_bits(self.mask_img)
+        self._mask_bits_inv = np.invert(self._mask_bits)
+        self._mask_count = popcount(self._mask_bits)
+        self._num_pixels = np.float32(self.mask_img.size)
+
+
+# A set of IkaMatchers which share the same ROI.
+#
+# The region is cropped and converted once, each distinct bg/fg filter is
+# evaluated once, and all the masks are scored by one matrix product.
+# Results are the same as IkaMatcher.match_score() of each matcher.
+#
+class MatcherBank(object):
+
+    def _filter_key(self, method):
+        params = [(k, v) for k, v in vars(method).items()
+                  if not k.startswith('_')]
+        return (method.__class__.__name__, tuple(sorted(params)))
+
+    def _group_by_filter(self, attr):
+        groups = {}
+        for i in range(len(self.matchers)):
+            method = getattr(self.matchers[i], attr)
+            key = self._filter_key(method)
+            if not key in groups:
+                groups[key] = (method, [])
+            groups[key][1].append(i)
+
+        return [(method, np.array(indexes)) for method, indexes in groups.values()]
+
+    def _build(self):
+        masks = [(m.mask_img >= MATCH_LEVEL).reshape(-1)
+                 for m in self.matchers]
+        self._masks = np.array(masks, dtype=np.float32)
+        self._mask_counts = np.sum(self._masks, axis=1)
+        self._bg_groups = self._group_by_filter('bg_method')
+        self._fg_groups = self._group_by_filter('fg_method')
+
+        m = self.matchers[0]
+        self._needs_hsv = False
+        for matcher in self.matchers:
+            self._needs_hsv = self._needs_hsv or \
+                m._needs_hsv(matcher.bg_method) or \
+                m._needs_hsv(matcher.fg_method)
+
+    # Count white pixels of the evaluated image for each mask in indexes.
+    def _count(self, img, indexes):
+        v = (img.reshape(-1) >= MATCH_LEVEL).astype(np.float32)
+        return np.dot(self._masks[indexes], v), np.sum(v)
+
+    ##
+    # Add a matcher.
+    # @param matcher  IkaMatcher. The ROI must be the same as others.
+    # @param key      Any object to identify the matcher in results.
+    #
+    def add(self, matcher, key=None):
+        if len(self.matchers):
+            m = self.matchers[0]
+            if (m.left, m.top, m.width, m.height) != \
+                    (matcher.left, matcher.top, matcher.width, matcher.height):
+                raise Exception('%s: ROI of %s differs from %s' %
+                                (self, matcher.label, m.label))
+
+        self.matchers.append(matcher)
+        self.keys.append(matcher if key is None else key)
+        self._masks = None
+
+    ##
+    # Score all the matchers.
+    # @param img    Frame data, or FrameCache of the frame.
+    # @return List of (matched, fg_score, bg_score) in order of add().
+    #
+    def match_scores(self, img):
+        if len(self.matchers) == 0:
+            return []
+
+        if self.debug:
+            return [m.match_score(img) for m in self.matchers]
+
+        if self._masks is None:
+            self._build()
+
+        m = self.matchers[0]
+        img_bgr, img_gray, img_hsv = m._prepare_images(
+            img, needs_hsv=self._needs_hsv)
+        if self._needs_hsv and (img_hsv is None) and (img_bgr is not None):
+            img_hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+
+        num_pixels = np.float32(m.width * m.height)
+        num_matchers = len(self.matchers)
+
+        # Check background scores
+        orig_counts = np.zeros(num_matchers, dtype=np.float32)
+        for method, indexes in self._bg_groups:
+            img_bg = 255 - method.evaluate(
+                img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv)
+            orig_counts[indexes], unused = self._count(img_bg, indexes)
+
+        candidates = []
+        for i in range(num_matchers):
+            orig_raito = orig_counts[i] / num_pixels
+            candidates.append(
+                not (orig_raito > self.matchers[i].orig_threshold))
+
+        # フォアグラウンド色の一致を調べる
+        fg_counts = np.zeros(num_matchers, dtype=np.float32)
+        for method, indexes in self._fg_groups:
+            indexes = np.array([i for i in indexes if candidates[i]])
+            if len(indexes) == 0:
+                continue
+
+            img_fg = method.evaluate(
+                img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv)
+            counts, fg_pixels = self._count(img_fg, indexes)
+
+            # max(fg, mask) = count(mask) + count(fg) - count(fg & mask)
+            fg_counts[indexes] = self._mask_counts[indexes] + \
+                fg_pixels - counts
+
+        results = []
+        for i in range(num_matchers):
+            orig_raito = orig_counts[i] / num_pixels
+            if candidates[i]:
+                raito = fg_counts[i] / num_pixels
+                match = (raito > self.matchers[i].threshold)
+            else:
+                raito = 0.0
+                match = False
+            results.append((match, raito, orig_raito))
+        return results
+
+    ##
+    # Score all the matchers, best first.
+    # @param img    Frame data, or FrameCache of the frame.
+    # @return List of (key, matched, fg_score, bg_score) sorted by fg_score.
+    #         Matchers with the same score are in order of add().
+    #
+    def ranked_scores(self, img):
+        scores = self.match_scores(img)
+        ranked = [(self.keys[i],) + tuple(scores[i])
+                  for i in range(len(scores))]
+        return sorted(ranked, key=lambda r: r[2], reverse=True)
+
+    ##
+    # Get the key of the best matched matcher.
+    # @param img    Frame data, or FrameCache of the frame.
+    # @return The key, or None if no matchers matched.
+    #
+    def best_match(self, img):
+        for key, matched, fg_score, bg_score in self.ranked_scores(img):
+            if matched and (fg_score > 0):
+                return key
+        return None
+
+    def __str__(self):
+        return '%s(%d matchers)' % (self.__class__.__name__, len(self.matchers))
+
+    ##
+    # Constructor.
+    # @param matchers  List of IkaMatcher, or (IkaMatcher, key) tuples.
+    # @param debug     If true, score matchers one by one with debug output.
+    #
+    def __init__(self, matchers=[], debug=False):
+        self.debug = debug
+        self.matchers = []
+        self.keys = []
+        self._masks = None
+
+        for matcher in matchers:
+            if isinstance(matcher, tuple):
+                self.add(*matcher)
+            else:
+                self.add(matcher)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import struct
+
+import numpy as np
+
+
+# Model file format for recognizers.
+#
+#   offset  size  contents
+#   0       8     MAGIC
+#   8       4     FORMAT_VERSION (uint32, little endian)
+#   12      4     Length of the header (uint32, little endian)
+#   16      n     Header (JSON, UTF-8)
+#   ...           Arrays, each starts at a multiple of ALIGNMENT
+#
+# The header has "arrays", which maps array names to their dtype, shape
+# and offset in the file, and "meta", any JSON-serializable data such as
+# name tables.
+#
+# Arrays are stored raw, so load_model() maps them into memory without
+# parsing or copying.
+#
+
+MAGIC = b'IKAMODEL'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_prologue = struct.Struct('<8sII')
+
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+##
+# Check if the file is a model file.
+# @param filename  Filename.
+# @return True if the file starts with MAGIC.
+#
+def is_model_file(filename):
+    try:
+        f = open(filename, 'rb')
+    except IOError:
+        return False
+
+    magic = f.read(len(MAGIC))
+    f.close()
+    return magic == MAGIC
+
+
+##
+# Save a model.
+# @param filename  Filename.
+# @param arrays    Dictionary of numpy arrays.
+# @param meta      Additional JSON-serializable data.
+#
+def save_model(filename, arrays, meta=None):
+    arrays = dict((name, np.ascontiguousarray(a)) for name, a in arrays.items())
+
+    names = sorted(arrays.keys())
+    layout = {}
+    for name in names:
+        layout[name] = {
+            'dtype': arrays[name].dtype.str,
+            'shape': list(arrays[name].shape),
+            'offset': 0,
+        }
+    header = {'meta': meta or {}, 'arrays': layout}
+
+    # Offsets are a part of the header. Retry until they fit.
+    data_offset = 0
+    while True:
+        header_bytes = json.dumps(header).encode('utf-8')
+        if _prologue.size + len(header_bytes) <= data_offset:
+            break
+
+        data_offset = _align(_prologue.size + len(header_bytes))
+        offset = data_offset
+        for name in names:
+            layout[name]['offset'] = offset
+            offset = _align(offset + arrays[name].nbytes)
+
+    f = open(filename, 'wb')
+    f.write(_prologue.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+    f.write(header_bytes)
+    for name in names:
+        f.seek(layout[name]['offset'])
+        f.write(arrays[name].tobytes())
+    f.close()
+
+
+##
+# Load a model.
+# @param filename  Filename.
+# @param mmap      If True, arrays are read-only memory maps of the file.
+# @return (arrays, meta)
+#
+def load_model(filename, mmap=True):
+    f = open(filename, 'rb')
+    magic, version, header_size = _prologue.unpack(f.read(_prologue.size))
+    if magic != MAGIC:
+        f.close()
+        raise ValueError('%s is not a model file' % filename)
+
+    if version > FORMAT_VERSION:
+        f.close()
+        raise ValueError('%s: unsupported format version %d' %
+                         (filename, version))
+
+    header = json.loads(f.read(header_size).decode('utf-8'))
+
+    arrays = {}
+    for name, l in header['arrays'].items():
+        dtype = np.dtype(l['dtype'])
+        shape = tuple(l['shape'])
+        count = int(np.prod(shape))
+
+        if count == 0:
+            arrays[name] = np.empty(shape, dtype)
+        elif mmap:
+            arrays[name] = np.memmap(filename, dtype=dtype, mode='r',
+                                     offset=l['offset'], shape=shape)
+        else:
+            f.seek(l['offset'])
+            arrays[name] = np.fromfile(f, dtype=dtype, count=count) \
+                .reshape(shape)
+
+    f.close()
+    return arrays, header['meta']
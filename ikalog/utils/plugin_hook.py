@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+import time
+
+
+# A callback registered by a plugin, with call statistics.
+#
+# If the plugin doesn't have the handler but has onUncatchedEvent(),
+# the hook calls onUncatchedEvent(event_name, ...) instead.
+#
+class PluginHook(object):
+
+    def __call__(self, *args):
+        t1 = time.perf_counter()
+        try:
+            if self.uncatched:
+                return self._func(self.event_name, *args)
+            return self._func(*args)
+        finally:
+            elapsed = time.perf_counter() - t1
+            self.calls = self.calls + 1
+            self.total_time = self.total_time + elapsed
+            if elapsed > self.worst_time:
+                self.worst_time = elapsed
+
+    def get_stats(self):
+        return {
+            'calls': self.calls,
+            'total': self.total_time,
+            'worst': self.worst_time,
+            'average': (self.total_time / self.calls) if self.calls else 0.0,
+        }
+
+    def reset_stats(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.worst_time = 0.0
+
+    def __str__(self):
+        if self.uncatched:
+            return '%s.onUncatchedEvent(%s)' % (
+                self.plugin.__class__.__name__, self.event_name)
+        return '%s.%s' % (self.plugin.__class__.__name__, self.event_name)
+
+    ##
+    # Create a hook for the plugin.
+    # @param plugin      The plugin.
+    # @param event_name  Name of the event.
+    # @param fallback    If True, use onUncatchedEvent() if available.
+    # @return PluginHook, or None if the plugin doesn't handle the event.
+    #
+    @classmethod
+    def create(cls, plugin, event_name, fallback=True):
+        func = getattr(plugin, event_name, None)
+        if func is not None:
+            return cls(plugin, event_name, func)
+
+        func = getattr(plugin, 'onUncatchedEvent', None)
+        if fallback and (func is not None):
+            return cls(plugin, event_name, func, uncatched=True)
+
+        return None
+
+    def __init__(self, plugin, event_name, func, uncatched=False):
+        self.plugin = plugin
+        self.event_name = event_name
+        self.uncatched = uncatched
+        self._func = func
+        self.reset_stats()
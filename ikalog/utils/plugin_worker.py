@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import queue
+import threading
+import time
+
+from ikalog.utils.ikautils import IkaUtils
+
+
+# Worker thread which delivers events to a single output plugin.
+#
+# Events are processed in the order they were queued. The queue holds up
+# to max_queue events. When it is full, droppable events are dropped at
+# once, and other events (e.g. results to upload) wait up to put_timeout
+# seconds for the plugin before they are dropped. Dropped events are
+# counted as overflows.
+#
+class PluginWorker(object):
+
+    # Events which may be lost when the plugin is too slow. They are
+    # sent repeatedly, and a later one supersedes them.
+    droppable_events = [
+        'on_game_paint_score_update',
+        'on_lobby_matching',
+    ]
+
+    # Seconds to wait for a room in the queue for other events.
+    put_timeout = 1.0
+
+    def _thread_func(self):
+        while True:
+            item = self._queue.get()
+            if (item is None) or self._abandoned:
+                break
+
+            event_name, context = item
+            self._callback(self.plugin, event_name, context)
+            self.processed_events = self.processed_events + 1
+
+            # stop() was called by the plugin itself.
+            if self._stopping and self._queue.empty():
+                break
+
+    ##
+    # Queue an event.
+    # @param event_name  Name of the event.
+    # @param context     Snapshot of the context (not modified by IkaEngine)
+    # @return True if queued, False if the queue overflowed.
+    #
+    def put(self, event_name, context):
+        try:
+            if event_name in self.droppable_events:
+                self._queue.put_nowait((event_name, context))
+            else:
+                self._queue.put((event_name, context),
+                                timeout=self.put_timeout)
+        except queue.Full:
+            self.overflows = self.overflows + 1
+            IkaUtils.dprint('%s: queue is full. Dropped event %s (overflows %d)' %
+                            (self, event_name, self.overflows))
+            return False
+
+        return True
+
+    ##
+    # Process all queued events, then stop the thread.
+    # @param timeout  Max seconds to wait for the plugin. Events still
+    #                 queued after that are abandoned.
+    # @return True if all the events are processed.
+    #
+    def stop(self, timeout=5.0):
+        if self._stopping:
+            return not self._thread.is_alive()
+        self._stopping = True
+
+        if not self._thread.is_alive():
+            return True
+
+        if self._thread is threading.current_thread():
+            # The thread exits when the queue becomes empty.
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+            return False
+
+        # The sentinel waits for a room in the queue, as events do.
+        deadline = time.time() + timeout
+        queued = 0
+        try:
+            self._queue.put(None, timeout=timeout)
+            queued = 1
+            self._thread.join(max(0.0, deadline - time.time()))
+        except queue.Full:
+            pass
+
+        if not self._thread.is_alive():
+            return True
+
+        # The plugin is hung. Let the thread exit after the current event.
+        self._abandoned = True
+        self.abandoned_events = max(0, self._queue.qsize() - queued)
+        IkaUtils.dprint('%s: plugin did not finish in %s seconds. Abandoned %d queued events' %
+                        (self, timeout, self.abandoned_events))
+        return False
+
+    def get_stats(self):
+        return {
+            'processed': self.processed_events,
+            'queued': self._queue.qsize(),
+            'overflows': self.overflows,
+            'abandoned': self.abandoned_events,
+        }
+
+    def __str__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           self.plugin.__class__.__name__)
+
+    ##
+    # Constructor
+    # @param plugin     The output plugin.
+    # @param callback   Called as callback(plugin, event_name, context).
+    # @param max_queue  Max number of events waiting in the queue.
+    #
+    def __init__(self, plugin, callback, max_queue=64):
+        self.plugin = plugin
+        self.max_queue = max_queue
+        self.processed_events = 0
+        self.overflows = 0
+        self.abandoned_events = 0
+
+        self._callback = callback
+        self._queue = queue.Queue(max_queue)
+        self._stopping = False
+        self._abandoned = False
+        self._thread = threading.Thread(target=self._thread_func)
+        self._thread.daemon = True
+        self._thread.start()
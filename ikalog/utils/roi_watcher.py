@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+from ikalog.utils.stability_detector import make_fingerprint, same_fingerprint
+
+
+# Change detection of regions of the screen, shared by the scenes.
+#
+# Many regions (the paint score, the kill messages, ...) stay the same
+# for many frames. Scenes register their regions by name, and skip the
+# recognition while the content of the region is unchanged.
+#
+# IkaEngine provides one in context['engine']['service']['roi_watcher'].
+#
+class RoiWatcher(object):
+
+    ##
+    # Register a region. Nothing happens if already registered.
+    # @param name       Name of the region, e.g. 'in_game/dead'.
+    # @param roi        (left, top, width, height)
+    # @param tolerance  Max difference of the pixels of fingerprints to
+    #                   be the same content.
+    # @param scale      Fingerprints are 1/scale of the region.
+    #
+    def register(self, name, roi, tolerance=8, scale=4):
+        if name in self._regions:
+            return
+
+        self._regions[name] = {
+            'roi': roi,
+            'tolerance': tolerance,
+            'scale': scale,
+            'fingerprint': None,
+            'has_result': False,
+            'result': None,
+            'checks': 0,
+            'skips': 0,
+        }
+
+    def _fingerprint(self, region, frame):
+        fingerprint = make_fingerprint(frame, region['roi'], region['scale'])
+        same = same_fingerprint(
+            fingerprint, region['fingerprint'], region['tolerance'])
+        return same, fingerprint
+
+    def _count(self, region, skipped):
+        region['checks'] = region['checks'] + 1
+        if skipped:
+            region['skips'] = region['skips'] + 1
+
+    ##
+    # Check if the region has changed since the last time it changed.
+    # @param name   Name of the region.
+    # @param frame  The frame (numpy array) or FrameCache.
+    # @return True if changed (or checked for the first time).
+    #
+    def changed(self, name, frame):
+        region = self._regions[name]
+        same, fingerprint = self._fingerprint(region, frame)
+        self._count(region, same)
+        if not same:
+            region['fingerprint'] = fingerprint
+        return not same
+
+    ##
+    # Call func() only if the region has changed. Otherwise return the
+    # result of the last call.
+    # @param name   Name of the region.
+    # @param frame  The frame (numpy array) or FrameCache.
+    # @param func   Function to recognize the region.
+    # @return The result of func()
+    #
+    # The result is not remembered if func() raised a exception.
+    #
+    def call(self, name, frame, func, *args):
+        region = self._regions[name]
+        same, fingerprint = self._fingerprint(region, frame)
+        skipped = same and region['has_result']
+        self._count(region, skipped)
+        if skipped:
+            return region['result']
+
+        region['has_result'] = False
+        result = func(*args)
+
+        region['fingerprint'] = fingerprint
+        region['result'] = result
+        region['has_result'] = True
+        return result
+
+    ##
+    # Forget the fingerprints, e.g. when the capture source is changed.
+    #
+    def reset(self):
+        for region in self._regions.values():
+            region['fingerprint'] = None
+            region['has_result'] = False
+            region['result'] = None
+
+    ##
+    # Get the statistics.
+    # @return {name: {'checks', 'skips', 'skip_ratio'}}
+    #
+    def get_stats(self):
+        stats = {}
+        for name, region in self._regions.items():
+            checks = region['checks']
+            stats[name] = {
+                'checks': checks,
+                'skips': region['skips'],
+                'skip_ratio': region['skips'] / checks if checks else 0.0,
+            }
+        return stats
+
+    ##
+    # Call func() through the RoiWatcher of the context, if any.
+    # @param context  The context.
+    # @param name     Name of the region.
+    # @param roi      (left, top, width, height)
+    # @param func     Function to recognize the region.
+    # @param tolerance, scale  See register().
+    # @return The result of func()
+    #
+    @staticmethod
+    def call_in_context(context, name, roi, func, *args,
+                        tolerance=8, scale=4):
+        service = context['engine'].get('service', {})
+        watcher = service.get('roi_watcher')
+        if watcher is None:
+            return func(*args)
+
+        watcher.register(name, roi, tolerance=tolerance, scale=scale)
+        return watcher.call(name, context['engine']['frame'], func, *args)
+
+    def __init__(self):
+        self._regions = {}
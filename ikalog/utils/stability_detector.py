@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import cv2
+import numpy as np
+
+from ikalog.utils.frame_cache import FrameCache
+
+
+##
+# Make a low-resolution fingerprint of the region.
+# @param frame  The frame (numpy array) or FrameCache.
+# @param roi    (left, top, width, height), or None for the whole frame.
+# @param scale  The fingerprint is 1/scale of the region.
+# @return The fingerprint (int16 array)
+#
+def make_fingerprint(frame, roi=None, scale=8):
+    if isinstance(frame, FrameCache):
+        img = frame.bgr(roi)
+    elif roi is None:
+        img = frame
+    else:
+        left, top, width, height = roi
+        img = frame[top:top + height, left:left + width]
+
+    height, width = img.shape[0:2]
+    size = (max(1, width // scale), max(1, height // scale))
+    return np.int16(cv2.resize(img, size, interpolation=cv2.INTER_AREA))
+
+
+##
+# Check if two fingerprints agree.
+# @param tolerance  Max difference of the pixels.
+#
+def same_fingerprint(a, b, tolerance):
+    if (a is None) or (b is None) or (a.shape != b.shape):
+        return False
+    return np.max(np.abs(a - b)) <= tolerance
+
+
+# Detects that a region of the screen stopped changing (e.g. animations
+# of the result screens are finished).
+#
+# Each frame is reduced to a low-resolution fingerprint of the region.
+# The region is stable once the fingerprints of the last N frames agree
+# within the tolerance.
+#
+class StabilityDetector(object):
+
+    ##
+    # Make the fingerprint of the region.
+    # @param frame  The frame (numpy array) or FrameCache.
+    #
+    def fingerprint(self, frame):
+        return make_fingerprint(frame, self.roi, self.scale)
+
+    ##
+    # Feed a frame.
+    # @param frame  The frame (numpy array) or FrameCache.
+    # @param t      Time of the frame in seconds (for the timeout)
+    # @return True if the region is stable.
+    #
+    def update(self, frame, t=None):
+        if (self.t_start is None) and (t is not None):
+            self.t_start = t
+
+        fingerprint = self.fingerprint(frame)
+        last = self._last_fingerprint
+        self._last_fingerprint = fingerprint
+
+        if not same_fingerprint(fingerprint, last, self.tolerance):
+            self.stable_frames = 1
+        else:
+            self.stable_frames = self.stable_frames + 1
+
+        return self.is_stable()
+
+    def is_stable(self):
+        return self.stable_frames >= self.frames
+
+    ##
+    # Check if the region has been unstable for too long.
+    # @param t  Current time in seconds.
+    #
+    def is_timed_out(self, t):
+        if (self.timeout is None) or (self.t_start is None):
+            return False
+        return (t - self.t_start) >= self.timeout
+
+    ##
+    # Forget the previous frames.
+    # @param t  Time to start the timeout from, in seconds.
+    #
+    def reset(self, t=None):
+        self.t_start = t
+        self.stable_frames = 0
+        self._last_fingerprint = None
+
+    ##
+    # Constructor
+    # @param roi        (left, top, width, height) to watch. None for
+    #                   the whole frame.
+    # @param frames     Number of agreeing frames to be stable.
+    # @param tolerance  Max difference of pixels of the fingerprints.
+    # @param timeout    is_timed_out() after this time (in seconds).
+    # @param scale      Fingerprints are 1/scale of the region.
+    #
+    def __init__(self, roi=None, frames=3, tolerance=16, timeout=None,
+                 scale=8):
+        self.roi = roi
+        self.frames = frames
+        self.tolerance = tolerance
+        self.timeout = timeout
+        self.scale = scale
+        self.reset()
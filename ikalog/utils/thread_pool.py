@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Thread pool shared by scenes to analyze independent parts of a frame
+# (e.g. the eight players on the result screen) in parallel. Most OpenCV
+# functions release the GIL, so this works well with threads.
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Max number of worker threads.
+max_workers = min(8, os.cpu_count() or 1)
+
+
+##
+# Get the shared thread pool. It is created on the first call.
+# @return concurrent.futures.ThreadPoolExecutor, or None if only one
+#         worker is allowed (run the work serially).
+#
+def get_thread_pool():
+    global _pool
+
+    if max_workers < 2:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max_workers,
+                                       thread_name_prefix='IkaLogAnalysis')
+        return _pool
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import numpy as np
+
+
+# Time series of samples in a game, e.g. context['game']['livesTrack'].
+#
+# Samples are stored in a NumPy structured array with a 'msec' column,
+# which grows by doubling. Most of the values don't change for many
+# frames, so only the first and the last samples of a run of the same
+# values are kept. Lines between the samples are the same as drawing
+# every frame. To read a sample per frame, as they were appended, use
+# samples(step=sample_interval).
+#
+class TimeSeries(object):
+
+    # [(name, dtype), ...] of the columns except 'msec'
+    fields = []
+
+    def _grow(self, size):
+        if size <= len(self._data):
+            return
+
+        data = np.zeros(max(size, len(self._data) * 2), dtype=self.dtype)
+        data[:self._len] = self._data[:self._len]
+        self._data = data
+
+    ##
+    # Append a sample.
+    # @param msec    Time of the sample. Must not go backwards.
+    # @param values  Values of the columns.
+    #
+    def append(self, msec, *values):
+        if (self._last_msec is not None) and (msec > self._last_msec):
+            interval = msec - self._last_msec
+            if (self.sample_interval is None) or \
+                    (interval < self.sample_interval):
+                self.sample_interval = interval
+        self._last_msec = msec
+
+        if values == self._last_values:
+            if self._run_rows > 1:
+                # 同じ値が続いている間は、最後のサンプルの時刻だけ進める
+                self._data['msec'][self._len - 1] = msec
+                return
+            self._run_rows = self._run_rows + 1
+        else:
+            self._last_values = values
+            self._run_rows = 1
+
+        self._grow(self._len + 1)
+        self._data[self._len] = (msec,) + values
+        self._len = self._len + 1
+
+    def __len__(self):
+        return self._len
+
+    ##
+    # The samples (a view of the structured array).
+    #
+    @property
+    def data(self):
+        return self._data[:self._len]
+
+    @property
+    def msec(self):
+        return self.data['msec']
+
+    def column(self, name):
+        return self.data[name]
+
+    ##
+    # Index of the sample in effect at the time.
+    # @return The index, or -1 if before the first sample.
+    #
+    def index_at(self, msec):
+        return int(np.searchsorted(self.msec, msec, side='right')) - 1
+
+    ##
+    # Times to read the samples at.
+    # @param step  Interval in msec. None for the samples as recorded.
+    # @return (msec, rows) arrays. rows are indexes of the samples in
+    #         effect at the times.
+    #
+    def _resample(self, step):
+        msec = self.msec
+        if step is None:
+            return msec, np.arange(len(msec))
+
+        times = np.arange(msec[0], msec[-1] + 1, step)
+        return times, np.searchsorted(msec, times, side='right') - 1
+
+    ##
+    # Get the samples in a period.
+    # @param msec_from  Start of the period. None from the first.
+    # @param msec_to    End of the period (exclusive). None to the last.
+    # @return A new time series of the same class.
+    #
+    def slice(self, msec_from=None, msec_to=None):
+        msec = self.msec
+        start = 0 if msec_from is None else \
+            np.searchsorted(msec, msec_from, side='left')
+        end = len(msec) if msec_to is None else \
+            np.searchsorted(msec, msec_to, side='left')
+        return self._from_array(self.data[start:end])
+
+    def _from_array(self, data):
+        series = self.__class__()
+        series._data = np.array(data, dtype=self.dtype)
+        series._len = len(data)
+        series.sample_interval = self.sample_interval
+        return series
+
+    def copy(self):
+        series = self._from_array(self.data)
+        series._last_values = self._last_values
+        series._run_rows = self._run_rows
+        series._last_msec = self._last_msec
+        return series
+
+    # Snapshots of the context (copy.deepcopy) copy the arrays at once.
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    ##
+    # Write the samples as CSV.
+    # @param filename  Filename to write.
+    #
+    def to_csv(self, filename):
+        names = self.dtype.names
+        with open(filename, 'w') as f:
+            f.write('%s\n' % ','.join(names))
+            for row in self.data.tolist():
+                f.write('%s\n' % ','.join([str(v) for v in row]))
+
+    ##
+    # Write the samples as NumPy .npz file, one array per column.
+    # @param filename  Filename to write.
+    #
+    def save_npz(self, filename):
+        data = self.data
+        np.savez_compressed(
+            filename, **dict((name, data[name]) for name in self.dtype.names))
+
+    ##
+    # Read the samples written by save_npz().
+    # @param filename  Filename to read.
+    #
+    @classmethod
+    def load_npz(cls, filename):
+        series = cls()
+        with np.load(filename) as npz:
+            data = np.zeros(len(npz['msec']), dtype=series.dtype)
+            for name in series.dtype.names:
+                data[name] = npz[name]
+        return series._from_array(data)
+
+    ##
+    # Constructor
+    # @param capacity  Number of the samples to allocate first.
+    #
+    def __init__(self, capacity=256):
+        self.dtype = np.dtype([('msec', np.int64)] + self.fields)
+        self._data = np.zeros(capacity, dtype=self.dtype)
+        self._len = 0
+        self._last_values = None
+        self._run_rows = 0
+        self._last_msec = None
+
+        # Shortest interval of append() in msec, e.g. one frame.
+        self.sample_interval = None
+
+
+# Number of the bits set in a byte
+_bit_counts = np.array([bin(i).count('1') for i in range(256)], np.uint8)
+
+
+# context['game']['livesTrack']: alive squids of the teams.
+#
+# Lives of the four squids of a team are packed into bits of a byte.
+#
+class LivesTrack(TimeSeries):
+
+    fields = [('team1', np.uint8), ('team2', np.uint8)]
+
+    @staticmethod
+    def pack(lives):
+        bits = 0
+        for i, alive in enumerate(lives):
+            if alive:
+                bits = bits | (1 << i)
+        return bits
+
+    @staticmethod
+    def unpack(bits, num=4):
+        return [bool(bits & (1 << i)) for i in range(num)]
+
+    ##
+    # Append a sample.
+    # @param team1  List of bools (alive or not) of team 1.
+    # @param team2  List of bools (alive or not) of team 2.
+    #
+    def append(self, msec, team1, team2):
+        super(LivesTrack, self).append(
+            msec, self.pack(team1), self.pack(team2))
+
+    ##
+    # Read the samples.
+    # @param step  Interval of the samples in msec. None for the samples
+    #              as recorded.
+    # @return Generator of (msec, team1, team2). Lives are of the last
+    #         sample.
+    #
+    def samples(self, step=None):
+        data = self.data
+        if len(data) == 0:
+            return
+
+        msec, rows = self._resample(step)
+        team1 = data['team1'][rows]
+        team2 = data['team2'][rows]
+        for t, bits1, bits2 in zip(msec.tolist(), team1.tolist(),
+                                   team2.tolist()):
+            yield t, self.unpack(bits1), self.unpack(bits2)
+
+    ##
+    # Numbers of the alive squids.
+    # @return (msec, team1, team2) arrays
+    #
+    def alive_counts(self):
+        data = self.data
+        return (data['msec'], _bit_counts[data['team1']],
+                _bit_counts[data['team2']])
+
+
+# context['game']['towerTrack']: position of the tower (or rainmaker).
+#
+class TowerTrack(TimeSeries):
+
+    fields = [('pos', np.int16), ('max', np.int16), ('min', np.int16)]
+
+    ##
+    # Append a sample.
+    # @param tower  {'pos', 'max', 'min'}
+    #
+    def append(self, msec, tower):
+        super(TowerTrack, self).append(
+            msec, tower['pos'], tower['max'], tower['min'])
+
+    ##
+    # Read the samples.
+    # @param step  Interval of the samples in msec. None for the samples
+    #              as recorded.
+    # @return Generator of (msec, {'pos', 'max', 'min'}). 'pos' is
+    #         linearly interpolated between the samples. 'max' and 'min'
+    #         are of the last sample.
+    #
+    def samples(self, step=None):
+        data = self.data
+        if len(data) == 0:
+            return
+
+        msec, rows = self._resample(step)
+        if step is None:
+            pos = data['pos']
+        else:
+            pos = np.round(np.interp(msec, data['msec'], data['pos']))
+
+        for t, p, row in zip(msec.tolist(), pos.tolist(), rows.tolist()):
+            yield t, {
+                'pos': int(p),
+                'max': int(data['max'][row]),
+                'min': int(data['min'][row]),
+            }
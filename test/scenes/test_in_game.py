@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for InGame.lives() and kill messages
+
+import unittest
+
+import cv2
+import numpy as np
+
+
+class TestInGameLives(unittest.TestCase):
+
+    # The original pixel-stepping loop, for one team.
+    def _find_squids_loop(self, img_gray3, x, direction):
+        squids = []
+        inner = x
+        for i in range(4):
+            while img_gray3[x] < 128:
+                inner = x
+                x = x + direction
+            while img_gray3[x] > 128:
+                x = x + direction
+            squids.append(int((x + inner) / 2))
+        return squids
+
+    def _frame(self, rng, alive):
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        meter = frame[55, 399:399 + 485]
+        eyes = frame[44:50, 399:399 + 485]
+
+        vs = 240 + rng.randint(-10, 10)
+        meter[vs - 8:vs + 8] = 255
+
+        # Icons are placed from the VS outwards.
+        colors = [(0, 128, 255), (255, 64, 0)]
+        for team, direction in [(0, -1), (1, 1)]:
+            x = vs + direction * rng.randint(22, 30)
+            for i in range(4):
+                width = rng.randint(14, 24)
+                x1, x2 = sorted([x, x + direction * width])
+                meter[x1:x2] = colors[team]
+                center = (x1 + x2) // 2
+                if alive[team * 4 + i]:
+                    eyes[:, center - 2:center + 2] = 255
+                x = x + direction * (width + rng.randint(6, 12))
+        return frame
+
+    def _context(self, frame):
+        return {
+            'engine': {
+                'frame': frame,
+                'inGame': True,
+                'service': {'callPlugins': lambda event: None},
+            },
+            'game': {},
+        }
+
+    def test_lives(self):
+        from ikalog.scenes.in_game import InGame
+        obj = InGame()
+
+        rng = np.random.RandomState(0)
+        for n in range(20):
+            alive = rng.randint(0, 2, 8).astype(bool)
+            frame = self._frame(rng, alive)
+            frame_orig = frame.copy()
+
+            context = self._context(frame)
+            a, b = obj.lives(context)
+            # lives() returns the icons from left to right.
+            self.assertEqual(a, alive[3::-1].tolist())
+            self.assertEqual(b, alive[4:8].tolist())
+            self.assertTrue(np.array_equal(frame, frame_orig))
+
+            # Same icon positions as the original loop
+            gray = cv2.cvtColor(frame[55:56, 399:399 + 485],
+                                cv2.COLOR_BGR2GRAY)[0]
+            img_gray3 = np.where(gray >= 48, 255, 0)
+            vs_x = np.average(np.flatnonzero(
+                (frame[55, 399:399 + 485] == 255).all(axis=1)))
+            expected = sorted(
+                self._find_squids_loop(img_gray3, int(vs_x - 20), -3)) + \
+                self._find_squids_loop(img_gray3, int(vs_x + 20), 3)
+
+            bright = gray >= 48
+            squids = np.concatenate((
+                np.sort(obj.find_squids(bright, int(vs_x - 20), -3)),
+                obj.find_squids(bright, int(vs_x + 20), 3)))
+            self.assertEqual(squids.tolist(), expected)
+
+            if any(a) and any(b):
+                self.assertEqual(
+                    context['game']['team_color_bgr'][0].tolist(), [0, 128, 255])
+
+    def test_no_vs(self):
+        from ikalog.scenes.in_game import InGame
+        obj = InGame()
+
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        self.assertEqual(obj.lives(self._context(frame)), (None, None))
+
+    def test_debug_overlay(self):
+        from ikalog.scenes.in_game import InGame
+        obj = InGame(debug=True)
+
+        frame = self._frame(np.random.RandomState(1), [True] * 8)
+        frame_orig = frame.copy()
+        obj.lives(self._context(frame))
+        self.assertTrue(np.array_equal(frame, frame_orig))
+
+        overlay = obj.draw_lives_overlay(frame.copy())
+        self.assertFalse(np.array_equal(overlay, frame_orig))
+
+
+class TestInGameKills(unittest.TestCase):
+
+    # The original implementation: threshold the whole column.
+    def _match_kills_column(self, obj, frame, stop):
+        img_gray = cv2.cvtColor(frame[:, 502:778], cv2.COLOR_BGR2GRAY)
+        ret, img_thresh = cv2.threshold(img_gray, 90, 255, cv2.THRESH_BINARY)
+
+        kills = 0
+        for y in [652, 652 - 40, 652 - 80, 652 - 120]:
+            if obj.mask_killed.match(img_thresh[y:y + 30, :]):
+                kills = kills + 1
+            elif stop:
+                break
+        return kills
+
+    def _frame(self, rng, slots):
+        mask = cv2.imread('masks/ui_killed.png')
+        frame = rng.randint(0, 80, (720, 1280, 3)).astype(np.uint8)
+        for n, state in enumerate(slots):
+            y = 652 - 40 * n
+            if state == 'killed':
+                frame[y:y + 30, 502:552] = np.where(mask < 171, 230, 20)
+            elif state == 'noise':
+                frame[y:y + 30, 502:552] = rng.randint(0, 256, (30, 50, 3))
+        return frame
+
+    def test_match_kills(self):
+        from ikalog.scenes.in_game import InGame
+        obj = InGame()
+
+        rng = np.random.RandomState(0)
+        for n in range(50):
+            slots = rng.choice(['killed', 'noise', 'empty'], 4)
+            frame = self._frame(rng, slots)
+            frame_orig = frame.copy()
+            context = {'engine': {'frame': frame}}
+
+            self.assertEqual(obj.match_kills1(context),
+                             self._match_kills_column(obj, frame, True))
+            self.assertEqual(obj.matchKilled(context),
+                             self._match_kills_column(obj, frame, False))
+            self.assertTrue(np.array_equal(frame, frame_orig))
+
+        frame = self._frame(rng, ['killed', 'killed', 'empty', 'killed'])
+        context = {'engine': {'frame': frame}}
+        self.assertEqual(obj.match_kills1(context), 2)
+        self.assertEqual(obj.matchKilled(context), 3)
+
+
+class TestInGameDeathReason(unittest.TestCase):
+
+    class Recoginizer(object):
+
+        def match(self, img):
+            return self.results.pop(0)
+
+    def _run(self, obj, results, frames):
+        events = []
+        context = {
+            'engine': {
+                'frame': np.zeros((720, 1280, 3), dtype=np.uint8),
+                'inGame': True,
+                'msec': 0,
+                'service': {'callPlugins': events.append},
+            },
+            'game': {'death_reasons': {}},
+            'scenes': {'in_game': {}},
+        }
+
+        recoginizer = self.Recoginizer()
+        recoginizer.results = list(results)
+        obj.deadly_weapon_recoginizer = recoginizer
+
+        dead = [True] * frames
+        obj.match_dead = lambda context: dead.pop(0) if dead else False
+
+        loop = obj.match_death_loop()
+        loop.send(None)
+        reasons = []
+        for i in range(frames + 10):
+            context['engine']['msec'] = i * 500
+            loop.send(context)
+            reasons.append(
+                (len(events), context['game'].get('last_death_reason')))
+        return events, reasons, recoginizer.results
+
+    def test_decided_early(self):
+        from ikalog.scenes.in_game import InGame
+        obj = InGame()
+
+        events, reasons, left = self._run(
+            obj, ['a', 'b', 'a', 'a', 'a', 'b', 'b'], 7)
+
+        self.assertEqual(
+            events, ['on_game_dead', 'on_game_death_reason_identified'])
+        # Identified on the 5th vote, then no more recognition
+        self.assertEqual(reasons[5], (1, None))
+        self.assertEqual(reasons[6], (2, 'a'))
+        self.assertEqual(left, ['b', 'b'])
+
+    def test_undecided(self):
+        from ikalog.scenes.in_game import InGame
+        obj = InGame()
+
+        events, reasons, left = self._run(obj, ['b', 'a', 'b', 'a'], 4)
+        self.assertEqual(
+            events, ['on_game_dead', 'on_game_death_reason_identified'])
+        # The leader wins after the respawn
+        self.assertEqual(reasons[-1], (2, 'b'))
+        self.assertEqual(left, ['a'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Regression test for kill messages (InGame.match_kills1) over the
+#  kill/death videos in test_data/movies/in_game/, and a clip generated
+#  from masks/ui_killed.png.
+#
+#  on_game_killed must be triggered exactly as by the original
+#  implementation, which thresholded the whole column of the frame.
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+
+class TestInGameKillsVideos(unittest.TestCase):
+
+    scene_name = 'in_game'
+
+    def _match_kills_column(self, obj, context):
+        img_gray = cv2.cvtColor(
+            context['engine']['frame'][:, 502:778], cv2.COLOR_BGR2GRAY)
+        ret, img_thresh = cv2.threshold(img_gray, 90, 255, cv2.THRESH_BINARY)
+
+        kills = 0
+        for y in [652, 652 - 40, 652 - 80, 652 - 120]:
+            if not obj.mask_killed.match(img_thresh[y:y + 30, :]):
+                break
+            kills = kills + 1
+        return kills
+
+    def _read_frames(self, filename):
+        capture = cv2.VideoCapture(filename)
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            if frame.shape[0:2] != (720, 1280):
+                frame = cv2.resize(frame, (1280, 720))
+            yield capture.get(cv2.CAP_PROP_POS_MSEC), frame
+
+    # Count on_game_killed of match_kills_loop() with the function.
+    def _count_killed(self, filename, match_kills1):
+        from ikalog.scenes.in_game import InGame
+        obj = InGame()
+        obj.match_kills1 = lambda context: match_kills1(obj, context)
+
+        events = []
+        context = {
+            'engine': {
+                'service': {'callPlugins': events.append},
+            },
+            'game': {'kills': 0},
+            'scenes': {'in_game': {}},
+        }
+
+        loop = obj.match_kills_loop()
+        loop.send(None)
+        loop.send(context)
+        for msec, frame in self._read_frames(filename):
+            context['engine']['msec'] = msec
+            context['engine']['frame'] = frame
+            loop.send(context)
+
+        return events.count('on_game_killed'), context['game']['kills']
+
+    # (seconds, number of kill messages on the screen)
+    clip_schedule = [
+        (2.0, 0), (1.0, 1), (2.0, 2), (2.0, 0),
+        (1.0, 1), (0.5, 2), (1.5, 3), (3.0, 0),
+        (1.0, 1), (2.0, 0),
+    ]
+    clip_fps = 10
+
+    # Write a clip of kill messages, encoded as a capture would be.
+    def _write_clip(self, filename):
+        mask = cv2.imread('masks/ui_killed.png')
+        img_killed = np.where(mask < 171, 230, 20).astype(np.uint8)
+
+        rng = np.random.RandomState(0)
+        background = cv2.resize(
+            rng.randint(0, 100, (72, 128, 3)).astype(np.uint8), (1280, 720))
+
+        writer = cv2.VideoWriter(
+            filename, cv2.VideoWriter_fourcc(*'MJPG'), self.clip_fps,
+            (1280, 720))
+        assert writer.isOpened(), 'Failed to open %s' % filename
+
+        for seconds, num_kills in self.clip_schedule:
+            for i in range(int(seconds * self.clip_fps)):
+                frame = np.roll(background, i * 8, axis=1)
+                for n in range(num_kills):
+                    y = 652 - 40 * n
+                    frame[y:y + 30, 502:552] = img_killed
+                    frame[y:y + 30, 560:760] = 200
+                writer.write(frame)
+        writer.release()
+
+    def _assert_same_kills(self, filename):
+        from ikalog.scenes.in_game import InGame
+
+        expected = self._count_killed(filename, self._match_kills_column)
+        result = self._count_killed(
+            filename, lambda obj, context: InGame.match_kills1(obj, context))
+        self.assertEqual(result, expected, filename)
+        return result
+
+    def test_kills(self):
+        dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dir, 'kills.avi')
+            self._write_clip(filename)
+            result = self._assert_same_kills(filename)
+        finally:
+            shutil.rmtree(dir)
+
+        # (on_game_killed events, context['game']['kills'])
+        self.assertEqual(result, (6, 6))
+
+        for filename in sorted(glob.glob(os.path.join(
+                'test_data', 'movies', self.scene_name, '*.mp4'))):
+            self._assert_same_kills(filename)
+
+if __name__ == '__main__':
+    unittest.main()
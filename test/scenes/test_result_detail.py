@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for ResultDetail.auto_offset() and analyze()
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+class TestResultDetailOffset(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from ikalog.scenes.result_detail import ResultDetail
+        cls.obj = ResultDetail()
+
+        # Synthetic frame: white where the mask expects text.
+        mask = cv2.imread('masks/result_detail.png')
+        assert mask is not None
+        cls.frame = np.where(mask < 171, 255, 0).astype(np.uint8)
+
+    def _context(self, frame):
+        return {'engine': {'frame': frame}}
+
+    def test_estimate_offset(self):
+        obj = self.obj
+        for offset in [(0, 0), (3, -2), (-5, 5), (1, 1), (-4, 0)]:
+            # Move the content by -offset; auto_offset() moves it back.
+            frame = obj._shift_frame(self.frame, (-offset[0], -offset[1]))
+
+            ox, oy = obj.estimate_offset(frame)
+            self.assertAlmostEqual(ox, offset[0], delta=0.5)
+            self.assertAlmostEqual(oy, offset[1], delta=0.5)
+
+            obj.reset_offset()
+            img = obj.auto_offset(self._context(frame))
+            self.assertEqual(obj.offset, offset)
+            self.assertTrue(obj.mask_win.match(img))
+
+    def test_cached_offset(self):
+        obj = self.obj
+        frame = obj._shift_frame(self.frame, (2, 1))
+
+        obj.reset_offset()
+        obj.auto_offset(self._context(frame))
+        self.assertEqual(obj.offset, (-2, -1))
+
+        # The cache survives frames which don't match at all.
+        blank = np.zeros(frame.shape, dtype=np.uint8)
+        self.assertIs(obj.auto_offset(self._context(blank)), blank)
+        self.assertEqual(obj.offset, (-2, -1))
+
+        img = obj.auto_offset(self._context(frame))
+        self.assertTrue(obj.mask_win.match(img))
+
+
+class TestResultDetailAnalyze(unittest.TestCase):
+
+    def _frame(self):
+        mask = cv2.imread('masks/result_detail.png')
+        frame = np.where(mask < 171, 255, 0).astype(np.uint8)
+
+        rng = np.random.RandomState(0)
+        for top in [101, 166, 231, 296, 431, 496, 561, 626]:
+            frame[top:top + 45, 610:1220] = rng.randint(0, 120, (45, 610, 3))
+            for x in [650, 1000, 1190]:
+                cv2.putText(frame, str(rng.randint(0, 100)), (x, top + 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+        # The player (white marker on the left)
+        frame[231:231 + 45, 610:653] = 255
+        return frame
+
+    def _analyze(self, obj, frame):
+        context = {'engine': {'frame': frame}, 'game': {}}
+        obj.analyze(context)
+        players = [{k: v for k, v in e.items() if not k.startswith('img_')}
+                   for e in context['game']['players']]
+        return context['game']['won'], players
+
+    def test_parallel(self):
+        from ikalog.scenes.result_detail import ResultDetail
+        obj = ResultDetail()
+        frame = self._frame()
+
+        obj.thread_pool = None
+        expected = self._analyze(obj, frame)
+        self.assertEqual(expected[0], True)
+        self.assertEqual([e['me'] for e in expected[1]],
+                         [False, False, True] + [False] * 5)
+
+        obj.thread_pool = ThreadPoolExecutor(max_workers=4)
+        for i in range(3):
+            obj.weapons.cache.clear()
+            obj.number_recoginizer.cache.clear()
+            self.assertEqual(self._analyze(obj, frame), expected)
+        obj.thread_pool.shutdown()
+
+    def test_images_are_copied(self):
+        from ikalog.scenes.result_detail import ResultDetail
+        obj = ResultDetail()
+        frame = self._frame()
+
+        context = {'engine': {'frame': frame}, 'game': {}}
+        obj.analyze(context)
+        images = [(e[k], e[k].copy()) for e in context['game']['players']
+                  for k in e if k.startswith('img_')]
+
+        # The frame buffer is recycled for the next frame.
+        frame[:] = 0
+        for img, orig in images:
+            self.assertTrue(np.array_equal(img, orig))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for SceneScheduler
+
+import unittest
+
+
+class Lobby(object):
+    phase = 'lobby'
+    successors = ['game_start']
+
+
+class GameStart(object):
+    phase = 'game_start'
+    predecessors = ['lobby']
+    successors = ['in_game']
+
+
+class InGame(object):
+    phase = 'in_game'
+    successors = ['game_finish']
+
+
+class NoPhase(object):
+    pass
+
+
+class TestSceneScheduler(unittest.TestCase):
+
+    def _scheduler(self):
+        from ikalog.scenes.scheduler import SceneScheduler
+        return SceneScheduler(
+            [Lobby, GameStart, InGame, NoPhase], sweep_interval=3000)
+
+    def _frame(self, scheduler, msec):
+        scheduler.new_frame({'engine': {'msec': msec}})
+        phases = ['lobby', 'game_start', 'in_game', 'game_finish']
+        return [p for p in phases if scheduler.should_run(p)]
+
+    def test_graph(self):
+        scheduler = self._scheduler()
+        self.assertEqual(scheduler.get_successors('lobby'), set(['game_start']))
+        self.assertEqual(scheduler.get_successors('game_start'),
+                         set(['in_game']))
+        self.assertEqual(scheduler.get_successors('game_finish'), set())
+
+    def test_successors(self):
+        scheduler = self._scheduler()
+
+        # Unknown phase: everything is evaluated.
+        self.assertEqual(len(self._frame(scheduler, 0)), 4)
+
+        scheduler.enter('lobby')
+        self.assertEqual(self._frame(scheduler, 100), ['lobby', 'game_start'])
+
+        scheduler.enter('game_start')
+        self.assertEqual(self._frame(scheduler, 200),
+                         ['game_start', 'in_game'])
+
+        stats = scheduler.get_stats()
+        self.assertEqual(stats['phase'], 'game_start')
+        self.assertEqual(stats['evaluated'], 8)
+        self.assertEqual(stats['skipped'], 4)
+
+    def test_sweep(self):
+        scheduler = self._scheduler()
+        self._frame(scheduler, 0)
+        scheduler.enter('in_game')
+
+        self.assertEqual(self._frame(scheduler, 2999),
+                         ['in_game', 'game_finish'])
+        # Every sweep_interval, all the scenes are evaluated.
+        self.assertEqual(len(self._frame(scheduler, 3000)), 4)
+        self.assertEqual(self._frame(scheduler, 3100),
+                         ['in_game', 'game_finish'])
+
+        # Rewinded (e.g. another file)
+        self.assertEqual(len(self._frame(scheduler, 1000)), 4)
+        self.assertEqual(scheduler.get_stats()['sweeps'], 3)
+
+    def test_reset_on_set_capture(self):
+        from ikalog.engine import IkaEngine
+
+        engine = IkaEngine(enable_capture_thread=False)
+        scheduler = engine.scene_scheduler
+        scheduler.new_frame({'engine': {'msec': 0}})
+        scheduler.enter('in_game')
+        scheduler.new_frame({'engine': {'msec': 100}})
+        self.assertFalse(scheduler.should_run('lobby'))
+
+        engine.set_capture(object())
+        self.assertIsNone(scheduler.phase)
+        scheduler.new_frame({'engine': {'msec': 100}})
+        self.assertTrue(scheduler.should_run('lobby'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for TowerTracker and the tower track
+
+import unittest
+
+import cv2
+import numpy as np
+
+
+class TestTowerTracker(unittest.TestCase):
+
+    # The original implementation, without the debug images.
+    def _tower_pos_orig(self, obj, frame):
+        img = frame[obj.tower_line_top:obj.tower_line_top + obj.tower_line_height,
+                    obj.tower_left:obj.tower_left + obj.tower_width]
+        img3 = np.minimum(img, obj.ui_tower_mask)
+        img3_hsv = cv2.cvtColor(img3, cv2.COLOR_BGR2HSV)
+        white_mask_s = cv2.inRange(img3_hsv[:, :, 1], 0, 8)
+        white_mask_v = cv2.inRange(img3_hsv[:, :, 2], 248, 256)
+        white_mask = np.minimum(white_mask_s, white_mask_v)
+        x_list = np.arange(obj.tower_width)
+        tower_x = np.extract(white_mask[3, :] > 128, x_list)
+        if len(tower_x) == 0:
+            return float('nan')
+        tower_xPos = np.average(tower_x)
+        xPos_pct = (tower_xPos - obj.tower_width / 2) / \
+            (obj.tower_width * 0.86 / 2) * 100
+        return xPos_pct
+
+    def _frame(self, rng, x):
+        frame = rng.randint(0, 200, (720, 1280, 3)).astype(np.uint8)
+        if x is not None:
+            frame[93:98, x:x + rng.randint(4, 20)] = 255 - rng.randint(0, 8)
+        return frame
+
+    def test_tower_pos(self):
+        from ikalog.scenes.tower_tracker import TowerTracker
+        obj = TowerTracker()
+
+        rng = np.random.RandomState(0)
+        found = 0
+        for x in list(rng.randint(350, 920, 50)):
+            frame = self._frame(rng, x)
+            context = {'engine': {'frame': frame}}
+            pos = obj.tower_pos(context)
+
+            # Out of the mask, the tower is not found.
+            pos_orig = self._tower_pos_orig(obj, frame)
+            if pos_orig != pos_orig:
+                self.assertTrue(pos != pos)
+                continue
+
+            found = found + 1
+            self.assertAlmostEqual(pos, pos_orig)
+        self.assertTrue(found > 10)
+
+        frame = self._frame(rng, None)
+        pos = obj.tower_pos({'engine': {'frame': frame}})
+        self.assertTrue(pos != pos)
+
+    def test_track(self):
+        from ikalog.utils import TowerTrack
+
+        positions = [0, 0, 0, 0, 10, 20, 20, 20, 20]
+        track = TowerTrack()
+        for i, pos in enumerate(positions):
+            track.append(i * 100, {'pos': pos, 'max': pos, 'min': 0})
+
+        self.assertEqual(
+            [(msec, tower['pos']) for msec, tower in track.samples()],
+            [(0, 0), (300, 0), (400, 10), (500, 20), (800, 20)])
+
+        self.assertEqual(track.sample_interval, 100)
+        samples = list(track.samples(step=track.sample_interval))
+        self.assertEqual([msec for msec, tower in samples],
+                         list(range(0, 900, 100)))
+        self.assertEqual([tower['pos'] for msec, tower in samples], positions)
+
+        samples = list(track.samples(step=50))
+        self.assertEqual(samples[7][1]['pos'], 5)
+        self.assertEqual(samples[7][1]['max'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for BallotBox
+
+import unittest
+
+
+class TestBallotBox(unittest.TestCase):
+
+    def test_margin(self):
+        from ikalog.utils import BallotBox
+
+        ballot = BallotBox(size=8, margin=3)
+        decided = [ballot.vote(c) for c in ['a', 'b', 'a', None, 'a', 'a']]
+        self.assertEqual(decided, [False, False, False, False, False, True])
+        self.assertEqual(ballot.decided(), 'a')
+        self.assertEqual(ballot.get_counts(), {'a': 4, 'b': 1})
+
+        ballot.reset()
+        self.assertEqual(ballot.decided(force=True), None)
+        ballot.vote('a')
+        ballot.vote('b')
+        self.assertEqual(ballot.decided(), None)
+        self.assertEqual(ballot.decided(force=True), 'a')
+
+    def test_ring_buffer(self):
+        from ikalog.utils import BallotBox
+
+        ballot = BallotBox(size=4, margin=2)
+        for c in ['a'] * 4 + ['b'] * 3:
+            ballot.vote(c)
+
+        # Only the last 4 votes count.
+        self.assertEqual(ballot.get_counts(), {'a': 1, 'b': 3})
+        self.assertEqual(ballot.decided(), 'b')
+
+    def test_period(self):
+        from ikalog.utils import BallotBox
+
+        ballot = BallotBox(size=16, margin=1, period=1000)
+        ballot.vote('a', 0)
+        ballot.vote('a', 500)
+        ballot.vote('b', 1200)
+        self.assertEqual(ballot.get_counts(), {'a': 1, 'b': 1})
+
+        ballot.expire(1600)
+        self.assertEqual(ballot.decided(), 'b')
+
+    def test_key(self):
+        from ikalog.utils import BallotBox
+
+        ballot = BallotBox(margin=1, key=lambda c: c['name'])
+        ballot.vote({'name': 'x', 'n': 1})
+        ballot.vote({'name': 'x', 'n': 2})
+        self.assertEqual(ballot.decided(), {'name': 'x', 'n': 2})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for CaptureThread
+
+import threading
+import time
+import unittest
+
+import numpy as np
+
+
+class SlowCapture(object):
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.reads = 0
+        self.threads = set()
+
+    def read(self):
+        self.threads.add(threading.current_thread())
+        time.sleep(self.interval)
+        self.reads = self.reads + 1
+        return np.full((4, 4, 3), self.reads % 256, np.uint8), self.reads
+
+
+def frame(value):
+    return np.full((4, 4, 3), value, np.uint8)
+
+
+class TestFrameRingBuffer(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        from ikalog.inputs.capture_thread import FrameRingBuffer
+
+        ring = FrameRingBuffer(num_slots=3)
+        for i in range(5):
+            self.assertTrue(ring.put(frame(i), i, block=False))
+
+        # Latest frames win.
+        self.assertEqual(ring.captured_frames, 5)
+        self.assertEqual(ring.dropped_frames, 2)
+        self.assertEqual(ring.queued_frames(), 3)
+
+        values = []
+        while ring.queued_frames():
+            img, t = ring.get(timeout=0)
+            values.append((int(img[0, 0, 0]), t))
+        self.assertEqual(values, [(2, 2), (3, 3), (4, 4)])
+
+    def test_lossless(self):
+        from ikalog.inputs.capture_thread import FrameRingBuffer
+
+        ring = FrameRingBuffer(num_slots=3)
+
+        def producer():
+            for i in range(10):
+                ring.put(frame(i), i, block=True)
+
+        thread = threading.Thread(target=producer)
+        thread.start()
+
+        values = []
+        for i in range(10):
+            img, t = ring.get(timeout=5.0)
+            values.append(t)
+            # The frame stays valid until the next get()
+            time.sleep(0.01)
+            self.assertEqual(int(img[0, 0, 0]), t)
+        thread.join(5.0)
+
+        self.assertEqual(values, list(range(10)))
+        self.assertEqual(ring.captured_frames, 10)
+        self.assertEqual(ring.dropped_frames, 0)
+        self.assertEqual(ring.queued_frames(), 0)
+
+    def test_read_failure(self):
+        from ikalog.inputs.capture_thread import FrameRingBuffer
+
+        ring = FrameRingBuffer(num_slots=3)
+        ring.put(None, None)
+        ring.put(None, None)
+        ring.put(frame(1), 1)
+
+        # Failures are coalesced.
+        self.assertEqual(ring.queued_frames(), 2)
+        self.assertEqual(ring.get(timeout=0), (None, None))
+        self.assertEqual(ring.get(timeout=0)[1], 1)
+        self.assertEqual(ring.get(timeout=0), (None, None))
+
+    def test_close_wakes_producer(self):
+        from ikalog.inputs.capture_thread import FrameRingBuffer
+
+        ring = FrameRingBuffer(num_slots=3)
+        for i in range(3):
+            ring.put(frame(i), i, block=True)
+
+        # No free slot; the producer waits for the consumer.
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(ring.put(frame(3), 3, block=True)))
+        thread.start()
+        time.sleep(0.1)
+        self.assertTrue(thread.is_alive())
+
+        ring.close()
+        thread.join(5.0)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(results, [False])
+        self.assertFalse(ring.put(frame(4), 4))
+
+
+class TestCaptureThread(unittest.TestCase):
+
+    def test_stats(self):
+        from ikalog.inputs.capture_thread import CaptureThread
+
+        capture = SlowCapture(interval=0.01)
+        thread = CaptureThread(capture, num_slots=3, drop_frames=True)
+        thread.start()
+        time.sleep(0.3)
+
+        thread.stop()
+        stats = thread.get_stats()
+        self.assertTrue(stats['captured'] > 3)
+        self.assertEqual(stats['queued'], 3)
+        self.assertEqual(stats['dropped'], stats['captured'] - 3)
+
+        thread = CaptureThread(capture, num_slots=3, drop_frames=False)
+        thread.start()
+        for i in range(10):
+            img, t = thread.read()
+            self.assertEqual(int(img[0, 0, 0]), t % 256)
+        stats = thread.get_stats()
+        thread.stop()
+        self.assertEqual(stats['dropped'], 0)
+        self.assertTrue(stats['captured'] >= 10)
+
+    def test_stop_while_reading(self):
+        from ikalog.inputs.capture_thread import CaptureThread
+
+        capture = SlowCapture(interval=1.0)
+        thread = CaptureThread(capture, read_timeout=10.0)
+        thread.start()
+
+        results = []
+        reader = threading.Thread(target=lambda: results.append(thread.read()))
+        reader.start()
+        time.sleep(0.1)
+
+        # read() is waiting for a frame.
+        t = time.time()
+        thread.stop()
+        reader.join(5.0)
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(results, [(None, None)])
+        self.assertTrue(time.time() - t < 3.5)
+
+        # Reading after stop() doesn't restart the thread.
+        reads = capture.reads
+        self.assertEqual(thread.read(), (None, None))
+        thread.start()
+        time.sleep(1.2)
+        self.assertTrue(capture.reads <= reads + 1)
+        self.assertEqual(len(capture.threads), 1)
+        self.assertFalse(list(capture.threads)[0].is_alive())
+
+if __name__ == '__main__':
+    unittest.main()
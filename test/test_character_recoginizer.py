@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for CharacterBatch, segmentation, BinaryKNearest and model files.
+
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+
+class TestCharacterBatch(unittest.TestCase):
+
+    def _load_images(self):
+        rng = np.random.RandomState(0)
+        imgs = []
+        for i in range(50):
+            img = np.zeros((45, 180, 3), dtype=np.uint8)
+            text = str(rng.randint(0, 10000))
+            cv2.putText(img, text, (rng.randint(0, 20), rng.randint(25, 40)),
+                        cv2.FONT_HERSHEY_SIMPLEX, rng.uniform(0.6, 1.2),
+                        (255, 255, 255), rng.randint(1, 3))
+            imgs.append(img)
+
+        # Nothing to recognize
+        imgs.append(np.zeros((45, 180, 3), dtype=np.uint8))
+        return imgs
+
+    def test_same_results_as_match(self):
+        from ikalog.utils.character_recoginizer import \
+            CharacterBatch, NumberRecoginizer
+
+        recoginizer = NumberRecoginizer()
+        imgs = self._load_images()
+
+        batch = CharacterBatch(recoginizer)
+        for i, img in enumerate(imgs):
+            self.assertEqual(batch.add(img), i)
+
+        self.assertEqual(batch.match(),
+                         [recoginizer.match(img) for img in imgs])
+        self.assertEqual(batch.match_digits(),
+                         [recoginizer.match_digits(img) for img in imgs])
+
+    def test_normalize_sample(self):
+        from ikalog.utils.character_recoginizer import NumberRecoginizer
+
+        recoginizer = NumberRecoginizer()
+        rng = np.random.RandomState(0)
+        for i in range(20):
+            h, w = rng.randint(5, 40, size=2)
+            img = rng.randint(0, 256, (h, w, 3)).astype(np.uint8)
+
+            # The former order: resize, then convert to binary
+            img_resized = cv2.resize(
+                img, (recoginizer.sample_width, recoginizer.sample_height),
+                interpolation=cv2.INTER_NEAREST)
+            img_gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY)
+            ret, img_binary = cv2.threshold(
+                img_gray, 200, 255, cv2.THRESH_BINARY)
+            expected = np.float32(img_binary.reshape((1, -1)))
+
+            self.assertTrue(np.array_equal(
+                recoginizer.normalize_sample(img), expected))
+
+    def test_cache(self):
+        from ikalog.utils.character_recoginizer import \
+            CharacterBatch, NumberRecoginizer
+
+        recoginizer = NumberRecoginizer()
+        imgs = self._load_images()
+
+        batch = CharacterBatch(recoginizer)
+        for img in imgs:
+            batch.add(img)
+        expected = batch.match()
+
+        recoginizer.cache.reset_stats()
+        batch = CharacterBatch(recoginizer)
+        for img in imgs:
+            batch.add(img)
+        self.assertEqual(batch.match(), expected)
+
+        stats = recoginizer.get_cache_stats()
+        self.assertEqual(stats['misses'], 0)
+        self.assertEqual(stats['hits'], sum([len(s) for s in expected]))
+
+        # Re-training invalidates the results
+        recoginizer.train()
+        self.assertEqual(len(recoginizer.cache), 0)
+
+
+class TestGlyphCacheKey(unittest.TestCase):
+
+    # Re-encode the image as a capture would, with some noise.
+    def _reencode(self, img, rng, quality=90, sigma=2.0, params=[]):
+        ret, buf = cv2.imencode(
+            '.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality] + params)
+        img = cv2.imdecode(buf, cv2.IMREAD_COLOR).astype(np.float32)
+        img = img + rng.normal(0, sigma, img.shape)
+        return np.clip(img, 0, 255).astype(np.uint8)
+
+    def test_deadly_weapon(self):
+        from ikalog.utils.character_recoginizer import DeadlyWeaponRecoginizer
+
+        # Thresholded as InGame does
+        def crop(img):
+            img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            ret, img_b = cv2.threshold(img_gray, 230, 255, cv2.THRESH_BINARY)
+            return cv2.cvtColor(img_b, cv2.COLOR_GRAY2BGR)
+
+        img = np.full((51, 410, 3), (40, 120, 60), dtype=np.uint8)
+        cv2.putText(img, 'Splattershot', (20, 38), cv2.FONT_HERSHEY_SIMPLEX,
+                    1.1, (255, 255, 255), 3, cv2.LINE_AA)
+        rng = np.random.RandomState(0)
+        crops = [crop(img), crop(self._reencode(img, rng))]
+        self.assertFalse(np.array_equal(crops[0], crops[1]))
+
+        recoginizer = DeadlyWeaponRecoginizer()
+        recoginizer.cache.clear()
+        recoginizer.cache.reset_stats()
+        names = [recoginizer.match(img_crop) for img_crop in crops]
+
+        self.assertEqual(names[0], names[1])
+        stats = recoginizer.get_cache_stats()
+        self.assertEqual((stats['misses'], stats['hits']), (1, 1))
+
+    def test_weapon_icon(self):
+        from ikalog.utils import IkaGlyphRecoginizer
+
+        img = np.full((46, 47, 3), (60, 60, 60), dtype=np.uint8)
+        cv2.circle(img, (25, 22), 12, (30, 200, 240), -1)
+        cv2.rectangle(img, (14, 18), (40, 26), (250, 250, 250), -1)
+        cv2.line(img, (12, 35), (38, 10), (0, 0, 180), 3)
+        rng = np.random.RandomState(0)
+        img_noisy = self._reencode(img, rng, quality=95, params=[
+            cv2.IMWRITE_JPEG_SAMPLING_FACTOR,
+            cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444])
+        self.assertFalse(np.array_equal(img, img_noisy))
+
+        weapons = IkaGlyphRecoginizer()
+        weapons.load_model_from_file('data/weapons.knn.data')
+        weapons.knn_train()
+        results = [weapons.match(img), weapons.match(img_noisy)]
+
+        self.assertEqual(results[0], results[1])
+        stats = weapons.get_cache_stats()
+        self.assertEqual((stats['misses'], stats['hits']), (1, 1))
+
+
+class TestSegmentation(unittest.TestCase):
+
+    # The original per-column loop of PerCharacter.cut()
+    def _cut_loop(self, hist):
+        chars = []
+        in_char = False
+        x_start = None
+        for x in range(len(hist)):
+            if in_char:
+                if hist[x] > 0:
+                    continue
+                if (x - 1) - x_start > 2:
+                    chars.append((x_start, x - 1))
+                in_char = False
+            elif hist[x] > 0:
+                x_start = x
+                in_char = True
+        return chars
+
+    def test_find_runs(self):
+        from ikalog.utils.character_recoginizer import PerCharacter
+
+        cutter = PerCharacter()
+        rng = np.random.RandomState(0)
+        for i in range(200):
+            hist = rng.randint(0, 5, rng.randint(0, 80))
+            hist[rng.uniform(size=len(hist)) < 0.3] = 0
+            self.assertEqual(cutter.cut(None, hist), self._cut_loop(hist))
+
+        # A run reaching the right edge is never closed.
+        hist = np.array([0, 1, 1, 1, 1, 0, 1, 1, 1, 1])
+        self.assertEqual(cutter.cut(None, hist), [(1, 4)])
+
+    def test_find_extent(self):
+        from ikalog.utils.character_recoginizer import find_extent
+
+        self.assertEqual(find_extent(np.zeros(10)), None)
+        self.assertEqual(find_extent(np.array([0, 0, 3, 0, 1, 0])), (2, 5, 2))
+
+
+class TestBinaryKNearest(unittest.TestCase):
+
+    def test_same_results_as_knearest(self):
+        from ikalog.utils import model_file
+        from ikalog.utils.binary_knearest import BinaryKNearest
+
+        rng = np.random.RandomState(0)
+        for model in ['number', 'udemae', 'fes_gender', 'fes_level']:
+            arrays, meta = model_file.load_model('data/%s.model' % model)
+            samples = np.array(arrays['samples'], np.float32)
+            responses = np.array(arrays['responses'], np.float32)
+            self.assertTrue(BinaryKNearest.is_binary(samples))
+
+            knn = cv2.ml.KNearest_create()
+            knn.train(samples, cv2.ml.ROW_SAMPLE, responses)
+            bknn = BinaryKNearest()
+            bknn.train(samples, cv2.ml.ROW_SAMPLE, responses)
+
+            # The training set, and noisy copies of it
+            queries = [samples]
+            for p in [0.05, 0.2, 0.5]:
+                flip = rng.rand(*samples.shape) < p
+                queries.append(np.where(flip, 255 - samples, samples))
+            queries = np.vstack(queries).astype(np.float32)
+
+            for k in [1, 3, 5]:
+                expected = knn.findNearest(queries, k)
+                r = bknn.findNearest(queries, k)
+                self.assertEqual(r[0], expected[0])
+                for a, b in zip(r[1:], expected[1:]):
+                    self.assertTrue(np.array_equal(a, b), model)
+
+            # Packed samples in the model file
+            bknn.train_packed(arrays['bits'], samples.shape[1], responses)
+            for a, b in zip(bknn.findNearest(queries, 3)[1:],
+                            knn.findNearest(queries, 3)[1:]):
+                self.assertTrue(np.array_equal(a, b), model)
+
+
+class TestModelFile(unittest.TestCase):
+
+    def test_save_and_load(self):
+        from ikalog.utils import model_file
+
+        arrays = {
+            'samples': np.arange(300, dtype=np.float32).reshape((30, 10)),
+            'responses': np.arange(30, dtype=np.int32),
+            'empty': np.empty((0, 10), dtype=np.float32),
+        }
+        meta = {'names': ['わかばシューター', 'N-ZAP85']}
+
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            model_file.save_model(filename, arrays, meta)
+            self.assertTrue(model_file.is_model_file(filename))
+
+            for mmap in [True, False]:
+                loaded, loaded_meta = model_file.load_model(filename, mmap=mmap)
+                self.assertEqual(loaded_meta, meta)
+                self.assertEqual(sorted(loaded.keys()), sorted(arrays.keys()))
+                for name in arrays:
+                    self.assertEqual(loaded[name].dtype, arrays[name].dtype)
+                    self.assertTrue(np.array_equal(loaded[name], arrays[name]))
+                del loaded
+        finally:
+            os.remove(filename)
+
+        self.assertFalse(model_file.is_model_file('masks/ui_go.png'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for IkaEngine timers: events should not depend on the
+#  decoding speed of recorded files.
+
+import time
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+
+# Synthetic recorded file. Frames are generated from masks, so that
+# scenes match them. The wall clock is driven by the source:
+# speed=1.0 means realtime, speed=None means as fast as possible.
+class SyntheticFile(object):
+    from_file = True
+    fps = 1
+
+    def read(self):
+        if not self.frames:
+            return None, None
+
+        self.n = self.n + 1
+        msec = self.n * 1000
+        if self.speed is None:
+            self.wall_time = self.wall_time + 0.001
+        else:
+            self.wall_time = 1000000.0 + msec / 1000.0 / self.speed
+        return self.frames.pop(0), msec
+
+    def __init__(self, schedule, speed):
+        self.n = 0
+        self.speed = speed
+        self.wall_time = 1000000.0
+        self.frames = []
+        for count, frame in schedule:
+            self.frames.extend([frame] * count)
+
+
+class EventRecorder(object):
+
+    def on_game_start(self, context):
+        self.events.append((context['engine']['msec'], 'on_game_start'))
+
+    def on_game_finish(self, context):
+        self.events.append((context['engine']['msec'], 'on_game_finish'))
+
+    def on_frame_read_failed(self, context):
+        self.engine.stop()
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.events = []
+
+
+class TestEngineClock(unittest.TestCase):
+
+    def _load_frame(self, mask_file):
+        mask = cv2.imread(mask_file)
+        assert mask is not None, 'Failed to read %s' % mask_file
+        return 255 - mask
+
+    def _schedule(self):
+        blank = np.zeros((720, 1280, 3), dtype=np.uint8)
+        game_start = self._load_frame('masks/gachi_tachiuo.png')
+        in_game = self._load_frame('masks/ingame_timer.png')
+        game_finish = self._load_frame('masks/ui_finish.png')
+
+        # 1 sec/frame
+        return [
+            (2, blank), (4, game_start), (8, in_game), (4, game_finish),
+            (10, blank), (4, game_start),     # +26 sec: another game
+            (8, in_game), (4, game_finish),   # +26 sec: within cooldown
+            (62, blank), (4, game_start),
+            (8, in_game), (4, game_finish),   # +78 sec: another game finish
+            (2, blank),
+        ]
+
+    def _run(self, speed, clock=None):
+        from ikalog.engine import IkaEngine
+
+        engine = IkaEngine(enable_capture_thread=False, clock=clock)
+        recorder = EventRecorder(engine)
+        source = SyntheticFile(self._schedule(), speed)
+
+        engine.pause(False)
+        engine.set_capture(source)
+        engine.set_plugins([recorder])
+
+        with mock.patch('time.time', lambda: source.wall_time):
+            while engine.process_frame():
+                pass
+
+        return recorder.events
+
+    def test_events_independent_of_speed(self):
+        events_1x = self._run(speed=1.0)
+        events_fast = self._run(speed=None)
+
+        self.assertEqual(events_1x, events_fast)
+        self.assertEqual(
+            [e[1] for e in events_1x],
+            ['on_game_start', 'on_game_finish', 'on_game_start',
+             'on_game_start', 'on_game_finish'])
+
+    def test_wall_clock(self):
+        from ikalog.utils import WallClock
+
+        events_1x = self._run(speed=1.0, clock=WallClock())
+        events_fast = self._run(speed=None, clock=WallClock())
+
+        self.assertEqual(events_1x, self._run(speed=1.0))
+        self.assertNotEqual(events_1x, events_fast)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for FrameCache
+
+import unittest
+
+import cv2
+import numpy as np
+
+
+class TestFrameCache(unittest.TestCase):
+
+    def _frame(self):
+        rng = np.random.RandomState(0)
+        return rng.randint(0, 256, (720, 1280, 3)).astype(np.uint8)
+
+    def test_conversions(self):
+        from ikalog.utils import FrameCache
+
+        frame = self._frame()
+        cache = FrameCache(frame)
+        roi = (100, 200, 50, 40)
+        crop = frame[200:240, 100:150]
+
+        self.assertTrue(np.array_equal(
+            cache.gray(roi), cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)))
+        self.assertTrue(np.array_equal(
+            cache.hsv(roi), cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)))
+        self.assertTrue(np.array_equal(cache.bgr(roi), crop))
+        self.assertFalse(cache.gray(roi).flags.writeable)
+
+    def test_memoize(self):
+        from ikalog.utils import FrameCache
+
+        cache = FrameCache(self._frame())
+        roi1 = (0, 0, 10, 10)
+        roi2 = (10, 0, 10, 10)
+
+        img = cache.gray(roi1)
+        self.assertIs(cache.gray(roi1), img)
+        self.assertIsNot(cache.hsv(roi1), img)
+        self.assertIsNot(cache.gray(roi2), img)
+        self.assertIs(cache.hsv(roi1), cache.hsv(roi1))
+
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 3))
+        self.assertEqual(stats['full_frame'], [])
+
+    def test_full_frame(self):
+        from ikalog.utils import FrameCache
+
+        frame = self._frame()
+        cache = FrameCache(frame)
+        full_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        # 0.25 of the frame: converted per region
+        roi1 = (0, 0, 640, 360)
+        cache.gray(roi1)
+        self.assertEqual(cache.get_stats()['full_frame'], [])
+
+        # 0.5 of the frame in total: the whole frame is converted
+        roi2 = (640, 0, 640, 360)
+        img = cache.gray(roi2)
+        self.assertEqual(cache.get_stats()['full_frame'], ['gray'])
+        self.assertTrue(np.array_equal(img, full_gray[0:360, 640:1280]))
+
+        # Other regions are cropped from the whole frame.
+        misses = cache.get_stats()['misses']
+        img = cache.gray((10, 500, 30, 20))
+        self.assertEqual(cache.get_stats()['misses'], misses)
+        self.assertTrue(np.array_equal(img, full_gray[500:520, 10:40]))
+
+        # Per color space
+        cache.hsv((0, 0, 10, 10))
+        self.assertEqual(cache.get_stats()['full_frame'], ['gray'])
+
+    def test_from_context(self):
+        from ikalog.utils import FrameCache
+
+        frame1 = self._frame()
+        frame2 = frame1.copy()
+        context = {'engine': {'frame': frame1}}
+
+        cache = FrameCache.from_context(context)
+        self.assertIs(cache.frame, frame1)
+        self.assertIs(FrameCache.from_context(context), cache)
+        self.assertIs(context['engine']['frame_cache'], cache)
+
+        # A cache built for another frame is not used.
+        context['engine']['frame'] = frame2
+        cache2 = FrameCache.from_context(context)
+        self.assertIsNot(cache2, cache)
+        self.assertIs(cache2.frame, frame2)
+        self.assertIs(context['engine']['frame_cache'], cache2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for IkaMatcher and MatcherBank.
+
+import glob
+import unittest
+
+import cv2
+import numpy as np
+
+
+class TestIkaMatcher(unittest.TestCase):
+
+    # The former implementation with calcHist
+    def _match_score_hist(self, matcher, img):
+        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        img_bg = 255 - \
+            matcher.bg_method.evaluate(img_bgr=img, img_gray=img_gray)
+        img_bg = np.minimum(img_bg, matcher.mask_img)
+
+        orig_hist = cv2.calcHist([img_bg], [0], None, [3], [0, 256])
+        orig_raito = (orig_hist[2] / np.sum(orig_hist))[0]
+
+        if orig_raito > matcher.orig_threshold:
+            return (False, 0.0, orig_raito)
+
+        img_fg = matcher.fg_method.evaluate(img_bgr=img, img_gray=img_gray)
+        img_added = np.maximum(img_fg, matcher.mask_img)
+
+        hist = cv2.calcHist([img_added], [0], None, [3], [0, 256])
+        raito = (hist[2] / np.sum(hist))[0]
+        return (raito > matcher.threshold, raito, orig_raito)
+
+    def test_bit_packed_scores(self):
+        from ikalog.utils import IkaMatcher
+        from ikalog.utils import matcher as m
+
+        rng = np.random.RandomState(0)
+        for mask_file in glob.glob('masks/*.png'):
+            mask = cv2.imread(mask_file)
+            height, width = mask.shape[0:2]
+
+            for bg_method, fg_method in [
+                    (m.MM_NOT_WHITE(), m.MM_WHITE()),
+                    (m.MM_BLACK(), m.MM_COLOR_BY_HUE(hue=(25, 35), visibility=(200, 255)))]:
+                matcher = IkaMatcher(
+                    0, 0, width, height, img=mask, orig_threshold=1.0,
+                    bg_method=bg_method, fg_method=fg_method)
+
+                for frame in [255 - mask, mask,
+                              rng.randint(0, 256, mask.shape).astype(np.uint8)]:
+                    self.assertEqual(
+                        matcher.match_score(frame),
+                        self._match_score_hist(matcher, frame), mask_file)
+
+    # Frames with some pixels dropped out still score above the
+    # thresholds, and match() must agree with match_score().
+    def test_match_degraded_frames(self):
+        from ikalog.scenes import GameStart, ResultJudge
+        from ikalog.utils import FrameCache
+
+        matchers = GameStart().map_bank.matchers + \
+            ResultJudge().bank_win_lose.matchers
+
+        rng = np.random.RandomState(1)
+        for mask_file in ['masks/result_judge_lose.png',
+                          'masks/hoko_mongara.png', 'masks/ui_finish.png']:
+            mask = cv2.imread(mask_file)
+            frame = np.where(mask < 171, 255, 0).astype(np.uint8)
+            dropout = rng.rand(*frame.shape[0:2]) < 0.08
+            frame[dropout] = 255 - frame[dropout]
+
+            num_matched = 0
+            for matcher in matchers:
+                matched, fg_score, bg_score = matcher.match_score(frame)
+                self.assertEqual(matcher.match(frame), matched, mask_file)
+                self.assertEqual(
+                    matcher.match(FrameCache(frame)), matched, mask_file)
+                if matched:
+                    num_matched = num_matched + 1
+            if mask_file != 'masks/ui_finish.png':
+                self.assertGreater(num_matched, 0, mask_file)
+
+
+class TestColorFilters(unittest.TestCase):
+
+    def test_hue_wrap_around(self):
+        from ikalog.utils import matcher as m
+
+        img_hsv = np.zeros((1, 180, 3), dtype=np.uint8)
+        img_hsv[0, :, 0] = np.arange(180)
+        img_hsv[0, :, 2] = 255
+
+        expected = np.zeros((1, 180), dtype=np.uint8)
+        expected[0, 170:180] = 255
+        expected[0, 0:11] = 255
+
+        for hue in [(-10, 10), (170, 190)]:
+            f = m.MM_COLOR_BY_HUE(hue=hue, visibility=(200, 256))
+            self.assertTrue(np.array_equal(f.evaluate(img_hsv=img_hsv), expected))
+
+            f = m.MM_NOT_COLOR_BY_HUE(hue=hue, visibility=(200, 256))
+            self.assertTrue(np.array_equal(f.evaluate(img_hsv=img_hsv), 255 - expected))
+
+    def test_output_buffer(self):
+        from ikalog.utils import matcher as m
+
+        img_gray = np.arange(256, dtype=np.uint8).reshape(16, 16)
+        out = np.empty(img_gray.shape, dtype=np.uint8)
+
+        r = m.MM_NOT_BLACK().evaluate(img_gray=img_gray, out=out)
+        self.assertTrue(r is out)
+        self.assertEqual(np.count_nonzero(out), 256 - 33)
+
+
+class TestMatcherBank(unittest.TestCase):
+
+    def _load_frames(self):
+        frames = []
+        for mask_file in ['masks/gachi_tachiuo.png', 'masks/hoko_mongara.png',
+                          'masks/ui_lobby_public.png', 'masks/result_judge_win.png']:
+            mask = cv2.imread(mask_file)
+            assert mask is not None, 'Failed to read %s' % mask_file
+            # Inverted masks match their own IkaMatchers
+            frames.append(255 - mask)
+            frames.append(mask)
+
+        rng = np.random.RandomState(0)
+        frames.append(rng.randint(0, 256, (720, 1280, 3)).astype(np.uint8))
+        return frames
+
+    def _get_banks(self):
+        from ikalog.scenes import GameStart, Lobby, ResultJudge
+
+        game_start = GameStart()
+        lobby = Lobby()
+        result_judge = ResultJudge()
+        return [
+            game_start.map_bank, game_start.rule_bank,
+            lobby.bank_matching, lobby.bank_tag_matching,
+            result_judge.bank_win_lose,
+        ]
+
+    def test_same_scores_as_ika_matcher(self):
+        from ikalog.utils import FrameCache
+
+        for frame in self._load_frames():
+            for bank in self._get_banks():
+                expected = [m.match_score(frame) for m in bank.matchers]
+
+                self.assertEqual(bank.match_scores(frame), expected)
+                self.assertEqual(
+                    bank.match_scores(FrameCache(frame)), expected)
+
+    def test_best_match(self):
+        from ikalog.scenes import GameStart
+
+        game_start = GameStart()
+        for stage in game_start.map_list:
+            frame = 255 - cv2.imread(stage['file'])
+            self.assertEqual(game_start.map_bank.best_match(frame), stage)
+
+        blank = np.zeros((720, 1280, 3), dtype=np.uint8)
+        self.assertIsNone(game_start.map_bank.best_match(blank))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for PluginHook and the dispatch table of IkaEngine
+
+import time
+import unittest
+
+
+class Handler(object):
+
+    def on_game_start(self, context):
+        time.sleep(0.01)
+        self.events.append('on_game_start')
+
+    def on_key_press(self, context, key):
+        self.events.append(('on_key_press', key))
+
+    def __init__(self):
+        self.events = []
+
+
+class Uncatched(object):
+
+    def onUncatchedEvent(self, event_name, context):
+        self.events.append(event_name)
+
+    def __init__(self):
+        self.events = []
+
+
+class TestPluginHook(unittest.TestCase):
+
+    def test_create(self):
+        from ikalog.utils import PluginHook
+
+        hook = PluginHook.create(Handler(), 'on_game_start')
+        self.assertFalse(hook.uncatched)
+        self.assertEqual(str(hook), 'Handler.on_game_start')
+
+        hook = PluginHook.create(Uncatched(), 'on_game_start')
+        self.assertTrue(hook.uncatched)
+        self.assertEqual(str(hook), 'Uncatched.onUncatchedEvent(on_game_start)')
+
+        self.assertIsNone(PluginHook.create(
+            Uncatched(), 'on_game_start', fallback=False))
+        self.assertIsNone(PluginHook.create(object(), 'on_game_start'))
+
+    def test_dispatch(self):
+        from ikalog.engine import IkaEngine
+
+        handler, uncatched = Handler(), Uncatched()
+        engine = IkaEngine(enable_capture_thread=False)
+        engine.set_plugins([handler, uncatched, object()])
+
+        engine.call_plugins('on_game_start')
+        engine.call_plugins('on_game_finish')
+        self.assertEqual(handler.events, ['on_game_start'])
+        self.assertEqual(uncatched.events, ['on_game_start', 'on_game_finish'])
+
+        # Non-standard events are not sent to onUncatchedEvent().
+        hooks = engine._get_hooks('on_key_press')
+        self.assertEqual([str(hook) for hook in hooks],
+                         ['Handler.on_key_press'])
+        hooks[0](engine.context, 'q')
+        self.assertEqual(handler.events[-1], ('on_key_press', 'q'))
+        self.assertEqual(uncatched.events, ['on_game_start', 'on_game_finish'])
+
+        # set_plugins() resets the cache.
+        handler2 = Handler()
+        engine.set_plugins([handler2])
+        engine.call_plugins('on_game_start')
+        self.assertEqual(handler.events.count('on_game_start'), 1)
+        self.assertEqual(handler2.events, ['on_game_start'])
+        self.assertEqual(uncatched.events, ['on_game_start', 'on_game_finish'])
+
+    def test_stats(self):
+        from ikalog.engine import IkaEngine
+
+        engine = IkaEngine(enable_capture_thread=False)
+        engine.set_plugins([Handler(), Uncatched()])
+        for i in range(3):
+            engine.call_plugins('on_game_start')
+
+        stats = engine.get_plugin_hook_stats()
+        self.assertEqual(set(stats), set([
+            'Handler.on_game_start',
+            'Uncatched.onUncatchedEvent(on_game_start)',
+        ]))
+
+        s = stats['Handler.on_game_start']
+        self.assertEqual(s['calls'], 3)
+        self.assertTrue(s['worst'] >= 0.01)
+        self.assertTrue(s['total'] >= 0.03)
+        self.assertAlmostEqual(s['average'], s['total'] / 3)
+
+if __name__ == '__main__':
+    unittest.main()
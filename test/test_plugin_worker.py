@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for PluginWorker and asynchronous plugin dispatch
+
+import threading
+import time
+import unittest
+
+import numpy as np
+
+
+class Recorder(object):
+
+    def on_game_killed(self, context):
+        self.events.append(('on_game_killed', context['game']['kills']))
+
+    def on_game_start(self, context):
+        self.events.append(('on_game_start', context['game']['map'],
+                            context['engine']['frame'][0, 0, 0]))
+        self.threads.add(threading.current_thread())
+
+    def __init__(self):
+        self.events = []
+        self.threads = set()
+
+
+# A plugin which waits until released.
+class BlockingPlugin(object):
+
+    def callback(self, plugin, event_name, context):
+        self.started.set()
+        self.release.wait()
+        self.events.append(event_name)
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.events = []
+
+
+class TestPluginWorker(unittest.TestCase):
+
+    def test_order(self):
+        from ikalog.utils import PluginWorker
+
+        events = []
+
+        def callback(plugin, event_name, context):
+            time.sleep(0.001 * (context % 3))
+            events.append((event_name, context))
+
+        worker = PluginWorker(object(), callback, max_queue=10)
+        expected = [('on_game_killed', i) for i in range(50)]
+        for event in expected:
+            self.assertTrue(worker.put(*event))
+
+        self.assertTrue(worker.stop())
+        self.assertEqual(events, expected)
+        self.assertEqual(worker.get_stats()['processed'], 50)
+
+    def test_overflow(self):
+        from ikalog.utils import PluginWorker
+
+        plugin = BlockingPlugin()
+        worker = PluginWorker(object(), plugin.callback, max_queue=2)
+        worker.put_timeout = 0.1
+        worker.put('on_game_killed', None)
+        plugin.started.wait(5.0)
+
+        results = [worker.put(event, None) for event in [
+            'on_game_paint_score_update',
+            'on_game_individual_result',
+            'on_game_paint_score_update',  # dropped at once
+            'on_game_session_end',         # dropped after put_timeout
+        ]]
+        self.assertEqual(results, [True, True, False, False])
+
+        stats = worker.get_stats()
+        self.assertEqual(stats['overflows'], 2)
+        self.assertEqual(stats['queued'], 2)
+
+        # Other events wait for the plugin.
+        worker.put_timeout = 5.0
+        threading.Timer(0.1, plugin.release.set).start()
+        self.assertTrue(worker.put('on_game_session_end', None))
+
+        self.assertTrue(worker.stop())
+        self.assertEqual(plugin.events, [
+            'on_game_killed',
+            'on_game_paint_score_update',
+            'on_game_individual_result',
+            'on_game_session_end',
+        ])
+        self.assertEqual(worker.get_stats()['overflows'], 2)
+
+    def test_stop_hung_plugin(self):
+        from ikalog.utils import PluginWorker
+
+        plugin = BlockingPlugin()
+        worker = PluginWorker(object(), plugin.callback)
+        for i in range(3):
+            worker.put('on_game_individual_result', None)
+        plugin.started.wait(5.0)
+
+        t = time.time()
+        self.assertFalse(worker.stop(timeout=0.2))
+        self.assertTrue(time.time() - t < 2.0)
+        self.assertEqual(worker.get_stats()['abandoned'], 2)
+
+        # The thread exits after the current event.
+        plugin.release.set()
+        worker._thread.join(5.0)
+        self.assertFalse(worker._thread.is_alive())
+        self.assertEqual(plugin.events, ['on_game_individual_result'])
+
+    def test_stop_hung_plugin_full_queue(self):
+        from ikalog.utils import PluginWorker
+
+        plugin = BlockingPlugin()
+        worker = PluginWorker(object(), plugin.callback, max_queue=2)
+        for i in range(3):
+            worker.put('on_game_individual_result', None)
+        plugin.started.wait(5.0)
+
+        # No room for the sentinel; stop() must not block.
+        t = time.time()
+        self.assertFalse(worker.stop(timeout=0.2))
+        self.assertTrue(time.time() - t < 2.0)
+        self.assertEqual(worker.get_stats()['abandoned'], 2)
+
+        plugin.release.set()
+        worker._thread.join(5.0)
+        self.assertFalse(worker._thread.is_alive())
+        self.assertEqual(plugin.events, ['on_game_individual_result'])
+
+
+class TestAsyncDispatch(unittest.TestCase):
+
+    def _engine(self, plugins):
+        from ikalog.engine import IkaEngine
+
+        engine = IkaEngine(enable_capture_thread=False, async_dispatch=True)
+        engine.set_plugins(plugins)
+        return engine
+
+    def test_snapshot(self):
+        recorder = Recorder()
+        engine = self._engine([recorder])
+        context = engine.context
+
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        context['engine']['frame'] = frame
+        context['game']['map'] = {'name': 'A'}
+        engine.call_plugins('on_game_start')
+
+        # Changes after the event don't affect the plugin.
+        context['game']['map']['name'] = 'B'
+        context['game']['map'] = {'name': 'C'}
+        frame[:] = 255
+
+        for i in range(5):
+            context['game']['kills'] = i
+            engine.call_plugins('on_game_killed')
+
+        engine.stop()
+        self.assertEqual(recorder.events[0], ('on_game_start', {'name': 'A'}, 0))
+        self.assertEqual(recorder.events[1:],
+                         [('on_game_killed', i) for i in range(5)])
+        self.assertNotIn(threading.current_thread(), recorder.threads)
+
+    def test_stop_drains(self):
+        recorders = [Recorder(), Recorder()]
+        engine = self._engine(recorders)
+
+        for i in range(20):
+            engine.context['game']['kills'] = i
+            engine.call_plugins('on_game_killed')
+
+        # run() is not running; stop() drains the queues.
+        engine.stop()
+        for recorder in recorders:
+            self.assertEqual(recorder.events,
+                             [('on_game_killed', i) for i in range(20)])
+        self.assertEqual(engine.get_plugin_worker_stats(), {})
+
+if __name__ == '__main__':
+    unittest.main()
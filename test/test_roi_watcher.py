@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for RoiWatcher
+
+import unittest
+
+import numpy as np
+
+
+class TestRoiWatcher(unittest.TestCase):
+
+    def _frame(self, value):
+        return np.full((720, 1280, 3), value, dtype=np.uint8)
+
+    def test_changed(self):
+        from ikalog.utils import RoiWatcher
+
+        watcher = RoiWatcher()
+        watcher.register('a', (100, 100, 40, 40))
+
+        results = [watcher.changed('a', self._frame(v))
+                   for v in [0, 0, 4, 12, 0, 0]]
+        self.assertEqual(results, [True, False, False, True, True, False])
+
+        # Outside of the region
+        frame = self._frame(0)
+        frame[0:100, :] = 255
+        self.assertFalse(watcher.changed('a', frame))
+
+        stats = watcher.get_stats()['a']
+        self.assertEqual((stats['checks'], stats['skips']), (7, 4))
+        self.assertAlmostEqual(stats['skip_ratio'], 4 / 7)
+
+    def test_call(self):
+        from ikalog.utils import RoiWatcher
+
+        watcher = RoiWatcher()
+        watcher.register('a', (100, 100, 40, 40))
+
+        calls = []
+
+        def func(value):
+            calls.append(value)
+            if value is None:
+                raise ValueError()
+            return value
+
+        self.assertEqual(watcher.call('a', self._frame(0), func, 1), 1)
+        self.assertEqual(watcher.call('a', self._frame(0), func, 2), 1)
+        self.assertEqual(watcher.call('a', self._frame(50), func, 3), 3)
+        self.assertEqual(calls, [1, 3])
+
+        # Failed calls are not remembered.
+        with self.assertRaises(ValueError):
+            watcher.call('a', self._frame(100), func, None)
+        self.assertEqual(watcher.call('a', self._frame(100), func, 4), 4)
+
+        watcher.reset()
+        self.assertEqual(watcher.call('a', self._frame(100), func, 5), 5)
+
+    def test_call_in_context(self):
+        from ikalog.utils import RoiWatcher
+
+        context = {'engine': {'frame': self._frame(0), 'service': {}}}
+        func = lambda: len(calls)
+        calls = []
+
+        # Without RoiWatcher, func() is always called.
+        for i in range(2):
+            calls.append(RoiWatcher.call_in_context(
+                context, 'a', (0, 0, 8, 8), func))
+        self.assertEqual(calls, [0, 1])
+
+        watcher = RoiWatcher()
+        context['engine']['service']['roi_watcher'] = watcher
+        for i in range(2):
+            calls.append(RoiWatcher.call_in_context(
+                context, 'a', (0, 0, 8, 8), func))
+        self.assertEqual(calls, [0, 1, 2, 2])
+        self.assertEqual(watcher.get_stats()['a']['skips'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
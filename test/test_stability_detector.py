@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for StabilityDetector
+
+import unittest
+
+import numpy as np
+
+
+class TestStabilityDetector(unittest.TestCase):
+
+    def _frame(self, value, noise=0):
+        rng = np.random.RandomState(value + noise)
+        frame = np.full((720, 1280, 3), value, dtype=np.uint8)
+        if noise:
+            frame = frame + rng.randint(0, noise, frame.shape).astype(np.uint8)
+        return frame
+
+    def test_stable(self):
+        from ikalog.utils import StabilityDetector
+
+        detector = StabilityDetector(roi=(100, 100, 400, 200), frames=3)
+        results = [detector.update(self._frame(v)) for v in
+                   [0, 50, 100, 100, 100, 100, 150, 150, 150]]
+        self.assertEqual(results, [False] * 4 + [True, True] +
+                         [False] * 2 + [True])
+
+        # Changes outside of the ROI are ignored.
+        frame = self._frame(150)
+        frame[0:100, :] = 255
+        self.assertTrue(detector.update(frame))
+
+        detector.reset()
+        self.assertFalse(detector.is_stable())
+
+    def test_tolerance(self):
+        from ikalog.utils import StabilityDetector
+
+        detector = StabilityDetector(frames=3)
+        results = [detector.update(self._frame(100, noise=i + 4))
+                   for i in range(3)]
+        self.assertEqual(results, [False, False, True])
+
+    def test_timeout(self):
+        from ikalog.utils import StabilityDetector
+
+        detector = StabilityDetector(frames=3, timeout=2.0)
+        detector.reset(10.0)
+        for t, value in [(10.0, 0), (11.0, 100), (11.9, 0)]:
+            detector.update(self._frame(value), t)
+            self.assertFalse(detector.is_timed_out(t))
+
+        detector.update(self._frame(100), 12.0)
+        self.assertFalse(detector.is_stable())
+        self.assertTrue(detector.is_timed_out(12.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+#  Unit test for TimeSeries (livesTrack and towerTrack)
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+
+class TestLivesTrack(unittest.TestCase):
+
+    def _track(self):
+        from ikalog.utils import LivesTrack
+
+        # Starts with small capacity so that it grows.
+        track = LivesTrack(capacity=2)
+        samples = []
+        for i in range(100):
+            team1 = [True, True, i < 30, i < 60]
+            team2 = [i % 40 < 20, True, False, True]
+            track.append(i * 100, team1, team2)
+            samples.append((i * 100, team1, team2))
+        return track, samples
+
+    def test_samples(self):
+        track, samples = self._track()
+
+        # Only the first and the last samples of each run are kept.
+        recorded = list(track.samples())
+        self.assertTrue(len(recorded) < 20)
+        for msec, team1, team2 in samples:
+            if msec in track.msec:
+                self.assertIn((msec, team1, team2), recorded)
+
+        # The value in effect at any time is the same.
+        for msec, team1, team2 in samples:
+            row = recorded[track.index_at(msec)]
+            self.assertEqual(row[1:], (team1, team2))
+
+        msec, team1, team2 = track.alive_counts()
+        self.assertEqual(team1.tolist(), [sum(s[1]) for s in recorded])
+        self.assertEqual(team2.tolist(), [sum(s[2]) for s in recorded])
+
+    def test_samples_step(self):
+        track, samples = self._track()
+
+        # A sample per append(), as before run-length encoding.
+        self.assertEqual(track.sample_interval, 100)
+        self.assertEqual(
+            list(track.samples(step=track.sample_interval)), samples)
+        self.assertEqual(
+            list(track.slice(2000).samples(step=100)), samples[20:])
+
+    def test_slice(self):
+        track, samples = self._track()
+
+        part = track.slice(2000, 5000)
+        self.assertTrue(np.all((part.msec >= 2000) & (part.msec < 5000)))
+        self.assertEqual(
+            part.msec.tolist(),
+            [t for t in track.msec.tolist() if 2000 <= t < 5000])
+
+        # Copies are independent.
+        snapshot = copy.deepcopy(track)
+        track.append(10000, [False] * 4, [False] * 4)
+        self.assertEqual(len(snapshot) + 1, len(track))
+
+    def test_export(self):
+        from ikalog.utils import LivesTrack
+
+        track, samples = self._track()
+        dir = tempfile.mkdtemp()
+        try:
+            track.save_npz(os.path.join(dir, 'lives.npz'))
+            track2 = LivesTrack.load_npz(os.path.join(dir, 'lives.npz'))
+            self.assertTrue(np.array_equal(track.data, track2.data))
+
+            track.to_csv(os.path.join(dir, 'lives.csv'))
+            with open(os.path.join(dir, 'lives.csv')) as f:
+                lines = f.read().splitlines()
+        finally:
+            shutil.rmtree(dir)
+
+        self.assertEqual(lines[0], 'msec,team1,team2')
+        self.assertEqual(len(lines), len(track) + 1)
+        self.assertEqual(lines[1], '0,15,11')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+# IkaMatcher のマイクロベンチマーク
+#
+# masks/ 以下のすべてのマスクについて、以前の calcHist による判定と
+# ビット列による判定の結果が一致することを確認し、処理時間を比較する。
+#
+# 使い方
+#   python tools/benchmark_matcher.py [回数]
+
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append('.')
+
+from ikalog.utils import IkaMatcher
+
+
+# calcHist による以前の実装
+def match_score_hist(matcher, img):
+    img = img[matcher.top: matcher.top + matcher.height,
+              matcher.left: matcher.left + matcher.width]
+    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    img_bg = 255 - \
+        matcher.bg_method.evaluate(img_bgr=img, img_gray=img_gray)
+    img_bg = np.minimum(img_bg, matcher.mask_img)
+
+    orig_hist = cv2.calcHist([img_bg], [0], None, [3], [0, 256])
+    orig_raito = (orig_hist[2] / np.sum(orig_hist))[0]
+
+    if orig_raito > matcher.orig_threshold:
+        return (False, 0.0, orig_raito)
+
+    img_fg = matcher.fg_method.evaluate(img_bgr=img, img_gray=img_gray)
+    img_added = np.maximum(img_fg, matcher.mask_img)
+
+    hist = cv2.calcHist([img_added], [0], None, [3], [0, 256])
+    raito = (hist[2] / np.sum(hist))[0]
+    return (raito > matcher.threshold, raito, orig_raito)
+
+
+def measure(func, loops):
+    t1 = time.perf_counter()
+    for i in range(loops):
+        func()
+    return (time.perf_counter() - t1) / loops * 1000
+
+
+def benchmark(mask_file, loops):
+    mask = cv2.imread(mask_file)
+    height, width = mask.shape[0:2]
+
+    # orig_threshold=1.0 so that the foreground is always evaluated
+    matcher = IkaMatcher(0, 0, width, height, img=mask,
+                         orig_threshold=1.0, label=mask_file)
+
+    rng = np.random.RandomState(0)
+    frames = [
+        255 - mask,  # matches
+        mask,
+        rng.randint(0, 256, mask.shape).astype(np.uint8),
+    ]
+
+    for frame in frames:
+        old = match_score_hist(matcher, frame)
+        new = matcher.match_score(frame)
+        if old != new:
+            print('%s: MISMATCH old=%s new=%s' % (mask_file, old, new))
+            return None
+
+    frame = frames[0]
+    t_old = measure(lambda: match_score_hist(matcher, frame), loops)
+    t_new = measure(lambda: matcher.match_score(frame), loops)
+    return t_old, t_new
+
+
+if __name__ == '__main__':
+    loops = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    print('%-40s %10s %10s %8s' % ('mask', 'old(ms)', 'new(ms)', 'speedup'))
+
+    total_old = 0.0
+    total_new = 0.0
+    for mask_file in sorted(glob.glob(os.path.join('masks', '*.png'))):
+        r = benchmark(mask_file, loops)
+        if r is None:
+            continue
+
+        t_old, t_new = r
+        total_old = total_old + t_old
+        total_new = total_new + t_new
+        print('%-40s %10.3f %10.3f %7.2fx' %
+              (os.path.basename(mask_file), t_old, t_new, t_old / t_new))
+
+    print('%-40s %10.3f %10.3f %7.2fx' %
+          ('total', total_old, total_new, total_old / total_new))
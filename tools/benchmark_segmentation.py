@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+
+# 文字切り出しのマイクロベンチマーク
+#
+# 数字 (NumberRecoginizer.extract_characters) と死因の武器
+# (DeadlyWeaponRecoginizer._normalize) について、以前の列毎ループによる
+# 実装と結果が一致することを確認し、1回あたりの処理時間を比較する。
+#
+# 使い方
+#   python tools/benchmark_segmentation.py [回数]
+
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append('.')
+
+from ikalog.utils.character_recoginizer import \
+    DeadlyWeaponRecoginizer, NumberRecoginizer
+
+
+# 以前の PerCharacter.cut()
+def cut_loop(img_hist_x):
+    chars = []
+    in_char = False
+    x_start = None
+
+    for x in range(len(img_hist_x)):
+        if in_char:
+            if img_hist_x[x] > 0:
+                continue
+            if (x - 1) - x_start > 2:
+                chars.append((x_start, x - 1))
+            in_char = False
+        elif img_hist_x[x] > 0:
+            x_start = x
+            in_char = True
+
+    return chars
+
+
+# 以前の CharacterRecoginizer.extract_characters()
+def extract_characters_loop(recoginizer, img):
+    img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    img_chars = recoginizer.WHITE_STRING(img_hsv)
+
+    img_chars1 = np.sum(img_chars / 255, axis=0)
+    array0to1280 = np.array(range(1280), dtype=np.int32)
+    img_chars1_hist_x = np.minimum(
+        img_chars1, array0to1280[0:len(img_chars1)])
+
+    char_tuples = cut_loop(img_chars1_hist_x)
+
+    characters = []
+    img_chars = np.sum(img_chars[:, :], axis=1)
+    img_char_extract_y = np.extract(
+        img_chars > 0, array0to1280[0:len(img_chars)])
+
+    if len(img_char_extract_y) > 1:
+        y1 = np.amin(img_char_extract_y)
+        y2 = np.amax(img_char_extract_y) + 1
+
+        if (y2 - y1) > 2:
+            for t in char_tuples:
+                characters.append(img[y1:y2, t[0]: t[1]])
+
+    return characters
+
+
+# 以前の DeadlyWeaponRecoginizer._normalize()
+def normalize_deadly_weapon_loop(recoginizer, img):
+    img_weapon_b = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    array0to1280 = np.array(range(1280), dtype=np.int32)
+    img_chars = np.sum(img_weapon_b[:, :], axis=1)
+    img_char_extract_y = np.extract(
+        img_chars > 0, array0to1280[0:len(img_chars)])
+
+    if len(img_char_extract_y) < 1:
+        return None
+
+    y1 = np.amin(img_char_extract_y)
+    y2 = np.amax(img_char_extract_y) + 1
+
+    if (y2 - y1) < 2:
+        return None
+
+    img_weapon_b = img_weapon_b[y1:y2, :]
+
+    new_height = recoginizer.sample_height
+    new_width = int(img_weapon_b.shape[
+                    1] * (new_height / img_weapon_b.shape[0]))
+    img_weapon_b32 = cv2.resize(img_weapon_b, (new_width, new_height))
+
+    array0to1280 = np.array(range(1280), dtype=np.int32)
+    img_chars = np.sum(img_weapon_b32[:, :], axis=0)
+    img_char_extract_x = np.extract(
+        img_chars > 0, array0to1280[0:len(img_chars)])
+
+    if len(img_char_extract_x) < 1:
+        return None
+
+    x1 = np.amin(img_char_extract_x)
+    x2 = np.amax(img_char_extract_x) + 1
+
+    if (x2 - x1 > 160):
+        x2 = x1 + 160
+    img_weapon_final = np.zeros((new_height, new_height * 10), np.uint8)
+    img_weapon_final[:, 0: x2 - x1] = img_weapon_b32[:, x1:x2]
+    return img_weapon_final
+
+
+def draw_text(rng, size, text):
+    img = np.zeros(size + (3,), dtype=np.uint8)
+    cv2.putText(img, text,
+                (rng.randint(0, 20), rng.randint(size[0] // 2, size[0] - 5)),
+                cv2.FONT_HERSHEY_SIMPLEX, rng.uniform(0.6, 1.2),
+                (255, 255, 255), rng.randint(1, 3))
+    return img
+
+
+def digit_images(rng, n):
+    imgs = [draw_text(rng, (45, 180), str(rng.randint(0, 10000)))
+            for i in range(n)]
+    imgs.append(np.zeros((45, 180, 3), dtype=np.uint8))
+    return imgs
+
+
+def deadly_weapon_images(rng, n):
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    imgs = []
+    for i in range(n):
+        text = ''.join(rng.choice(list(letters), rng.randint(4, 16)))
+        img = draw_text(rng, (51, 410), text)
+        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        ret, img_b = cv2.threshold(img_gray, 230, 255, cv2.THRESH_BINARY)
+        imgs.append(cv2.cvtColor(img_b, cv2.COLOR_GRAY2BGR))
+    imgs.append(np.zeros((51, 410, 3), dtype=np.uint8))
+    return imgs
+
+
+def same_characters(a, b):
+    if len(a) != len(b):
+        return False
+    return all(np.array_equal(x, y) for x, y in zip(a, b))
+
+
+def same_image(a, b):
+    if (a is None) or (b is None):
+        return (a is None) and (b is None)
+    return np.array_equal(a, b)
+
+
+def measure(func, imgs, loops):
+    t1 = time.perf_counter()
+    for i in range(loops):
+        for img in imgs:
+            func(img)
+    return (time.perf_counter() - t1) / (loops * len(imgs)) * 1000 * 1000
+
+
+def benchmark(label, old_func, new_func, compare, imgs, loops):
+    for img in imgs:
+        if not compare(old_func(img), new_func(img)):
+            print('%s: MISMATCH' % label)
+            return None
+
+    t_old = measure(old_func, imgs, loops)
+    t_new = measure(new_func, imgs, loops)
+    print('%-20s %10.1f %10.1f %7.2fx' %
+          (label, t_old, t_new, t_old / t_new))
+
+
+if __name__ == '__main__':
+    loops = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rng = np.random.RandomState(0)
+
+    number = NumberRecoginizer()
+    deadly_weapon = DeadlyWeaponRecoginizer()
+
+    print('%-20s %10s %10s %8s' % ('path', 'old(us)', 'new(us)', 'speedup'))
+
+    benchmark('digits',
+              lambda img: extract_characters_loop(number, img),
+              number.extract_characters,
+              same_characters, digit_images(rng, 50), loops)
+
+    benchmark('deadly_weapon',
+              lambda img: normalize_deadly_weapon_loop(deadly_weapon, img),
+              deadly_weapon._normalize,
+              same_image, deadly_weapon_images(rng, 50), loops)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2015 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# 認識モデルを新しいファイル形式 (ikalog/utils/model_file.py) に変換する
+#
+# pickle 形式のモデルを読み込み、同じファイル名で上書き保存する。
+# 変換済みのファイルはそのまま。
+#
+# 使い方
+#   python tools/convert_models.py [モデルファイル ...]
+#
+# ファイルを指定しない場合は data/ 以下の認識モデルをすべて変換する。
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append('.')
+
+from ikalog.utils import CharacterRecoginizer, IkaGlyphRecoginizer
+from ikalog.utils import model_file
+
+default_files = [
+    'data/number.model',
+    'data/udemae.model',
+    'data/fes_gender.model',
+    'data/fes_level.model',
+    'data/deadly_weapon.model',
+    'data/weapons.knn.data',
+]
+
+
+def convert(filename):
+    if model_file.is_model_file(filename):
+        print('%s: already converted' % filename)
+        return
+
+    size = os.path.getsize(filename)
+
+    if filename.endswith('.knn.data'):
+        obj = IkaGlyphRecoginizer()
+        obj.load_model_from_file(filename)
+        samples, responses = obj.samples, obj.responses
+        obj.save_model_to_file(filename)
+    else:
+        obj = CharacterRecoginizer()
+        meta = obj.load_model_from_file(filename)
+        samples, responses = obj.samples, obj.responses
+        obj.save_model_to_file(filename, meta=meta)
+
+    # Verify
+    arrays, meta = model_file.load_model(filename)
+    assert np.array_equal(arrays['samples'], np.float32(samples))
+    assert np.array_equal(arrays['responses'], responses)
+
+    print('%s: converted (%d -> %d bytes)' %
+          (filename, size, os.path.getsize(filename)))
+
+
+if __name__ == '__main__':
+    for filename in (sys.argv[1:] or default_files):
+        convert(filename)